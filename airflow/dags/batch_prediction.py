@@ -0,0 +1,74 @@
+"""
+Batch scoring of every csv in the input directory, one mapped Airflow task per file
+
+Scoring runs on its own schedule against the latest saved model and never retrains.
+A scored file is recorded by content hash, so retries and cleared runs do not score it again.
+
+Local test run:
+    AIRFLOW__CORE__EXECUTOR=LocalExecutor SENSOR_HOME=/path/to/repo python airflow/dags/batch_prediction.py
+"""
+import os
+import pendulum
+from airflow.decorators import dag, task
+from airflow.models.param import Param
+
+SENSOR_HOME = os.getenv("SENSOR_HOME", os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+SCORED_DIR = os.path.join("prediction", "scored")
+MAX_PARALLEL_FILES = 4
+
+default_args = {
+    "retries": 2,
+    "retry_delay": pendulum.duration(minutes=1),
+}
+
+
+@dag(dag_id="sensor_batch_prediction", schedule="@hourly", start_date=pendulum.datetime(2022, 10, 1, tz="UTC"),
+     catchup=False, max_active_runs=1, default_args=default_args, tags=["sensor"],
+     params={"input_dir": Param("prediction_input", type="string"),
+             "output_mode": Param("full", enum=["full", "slim", "parquet", "partitioned"])})
+def sensor_batch_prediction():
+
+    @task
+    def list_input_files(params=None) -> list:
+        os.chdir(SENSOR_HOME)
+        input_dir = params["input_dir"]
+        if not os.path.isdir(input_dir):
+            return []
+        return [os.path.join(input_dir, file_name) for file_name in sorted(os.listdir(input_dir)) if file_name.endswith(".csv")]
+
+
+    @task(max_active_tis_per_dag=MAX_PARALLEL_FILES)
+    def score_file(input_file_path:str, params=None) -> str:
+        from sensor.utils import get_file_hash, read_yaml_file, write_yaml_file
+        from sensor.resources import configure_process
+        from sensor.pipeline.batch_prediction import start_batch_prediction
+
+        os.chdir(SENSOR_HOME)
+        configure_process()
+
+        scored_file_path = os.path.join(SCORED_DIR, f"{get_file_hash(input_file_path)}.yaml")
+        scored = read_yaml_file(file_path=scored_file_path)
+        if scored:
+            return scored["prediction_file_path"]
+
+        prediction_file_path = start_batch_prediction(input_file_path=input_file_path, output_mode=params["output_mode"])
+        write_yaml_file(file_path=scored_file_path, data={"input_file_path": input_file_path,
+                                                          "prediction_file_path": prediction_file_path})
+        return prediction_file_path
+
+
+    @task
+    def summarize(prediction_file_paths) -> int:
+        prediction_file_paths = list(prediction_file_paths)
+        print(f"Scored {len(prediction_file_paths)} files: {prediction_file_paths}")
+        return len(prediction_file_paths)
+
+
+    summarize(score_file.expand(input_file_path=list_input_files()))
+
+
+batch_prediction_dag = sensor_batch_prediction()
+
+
+if __name__ == "__main__":
+    batch_prediction_dag.test()
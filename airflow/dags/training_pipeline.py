@@ -0,0 +1,147 @@
+"""
+Training pipeline with one Airflow task per component
+
+Every task rebuilds its component from the run's artifact directory and the upstream
+artifacts it receives through XCom. Stage artifacts are checkpointed in the artifact
+directory, so retries and cleared runs skip stages that already completed.
+
+Local test run:
+    AIRFLOW__CORE__EXECUTOR=LocalExecutor SENSOR_HOME=/path/to/repo python airflow/dags/training_pipeline.py
+"""
+import os
+import pendulum
+from airflow.decorators import dag, task
+
+# Components resolve saved_models, artifact_store and the base file relative to this directory
+SENSOR_HOME = os.getenv("SENSOR_HOME", os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+default_args = {
+    "retries": 2,
+    "retry_delay": pendulum.duration(minutes=5),
+}
+
+
+def get_training_pipeline_config(artifact_dir:str):
+    from sensor.entity import config_entity
+    from sensor.resources import configure_process
+
+    os.chdir(SENSOR_HOME)
+    configure_process()
+    return config_entity.TrainingPipelineConfig(artifact_dir=artifact_dir)
+
+
+@dag(dag_id="sensor_training", schedule="@weekly", start_date=pendulum.datetime(2022, 10, 1, tz="UTC"),
+     catchup=False, max_active_runs=1, default_args=default_args, tags=["sensor"])
+def sensor_training():
+
+    @task
+    def create_artifact_dir(logical_date=None) -> str:
+        # Derived from the logical date, so a cleared run writes into the same directory again
+        return os.path.join(SENSOR_HOME, "artifacts", logical_date.strftime('%m%d%Y__%H%M%S'))
+
+
+    @task
+    def data_ingestion(artifact_dir:str) -> dict:
+        from sensor.entity import config_entity
+        from sensor.components.data_ingestion import DataIngestion
+        from sensor.pipeline.stage_checkpoint import run_stage
+
+        training_pipeline_config = get_training_pipeline_config(artifact_dir)
+        data_ingestion_config = config_entity.DataIngestionConfig(training_pipeline_config=training_pipeline_config)
+        data_ingestion = DataIngestion(data_ingestion_config=data_ingestion_config)
+        return run_stage(artifact_dir, "data_ingestion", data_ingestion.initiate_data_ingestion)
+
+
+    @task
+    def data_validation(artifact_dir:str, data_ingestion_artifact:dict) -> dict:
+        from sensor.entity import config_entity, artifact_entity
+        from sensor.components.data_validation import DataValidation
+        from sensor.pipeline.stage_checkpoint import run_stage
+
+        training_pipeline_config = get_training_pipeline_config(artifact_dir)
+        data_validation_config = config_entity.DataValidationConfig(training_pipeline_config=training_pipeline_config)
+        data_validation = DataValidation(data_validation_config=data_validation_config,
+                                         data_ingestion_artifact=artifact_entity.DataIngestionArtifact(**data_ingestion_artifact))
+        return run_stage(artifact_dir, "data_validation", data_validation.initiate_data_validation)
+
+
+    @task
+    def data_transformation(artifact_dir:str, data_ingestion_artifact:dict) -> dict:
+        from sensor.entity import config_entity, artifact_entity
+        from sensor.components.data_transformation import DataTransformation
+        from sensor.pipeline.stage_checkpoint import run_stage
+
+        training_pipeline_config = get_training_pipeline_config(artifact_dir)
+        data_transformation_config = config_entity.DataTransformationConfig(training_pipeline_config=training_pipeline_config)
+        data_transformation = DataTransformation(data_transfomation_config=data_transformation_config,
+                                                 data_ingestion_artifact=artifact_entity.DataIngestionArtifact(**data_ingestion_artifact))
+        return run_stage(artifact_dir, "data_transformation", data_transformation.initiate_data_transformation)
+
+
+    @task
+    def model_trainer(artifact_dir:str, data_ingestion_artifact:dict, data_transformation_artifact:dict) -> dict:
+        from sensor.entity import config_entity, artifact_entity
+        from sensor.components.model_trainer import ModelTrainer
+        from sensor.pipeline.stage_checkpoint import run_stage
+
+        training_pipeline_config = get_training_pipeline_config(artifact_dir)
+        model_trainer_config = config_entity.ModelTrainerConfig(training_pipeline_config=training_pipeline_config)
+        model_trainer = ModelTrainer(model_trainer_config=model_trainer_config,
+                                     data_transformation_artifact=artifact_entity.DataTransformationArtifact(**data_transformation_artifact),
+                                     data_ingestion_artifact=artifact_entity.DataIngestionArtifact(**data_ingestion_artifact))
+        return run_stage(artifact_dir, "model_trainer", model_trainer.initiate_model_trainer)
+
+
+    @task
+    def model_evaluation(artifact_dir:str, data_ingestion_artifact:dict, data_transformation_artifact:dict,
+                         model_trainer_artifact:dict) -> dict:
+        from sensor.entity import config_entity, artifact_entity
+        from sensor.components.model_evaluation import ModelEvaluation
+        from sensor.pipeline.stage_checkpoint import run_stage
+
+        training_pipeline_config = get_training_pipeline_config(artifact_dir)
+        model_eval_config = config_entity.ModelEvaluationConfig(training_pipeline_config=training_pipeline_config)
+        model_eval = ModelEvaluation(model_eval_config=model_eval_config,
+                                     data_transformation_artifact=artifact_entity.DataTransformationArtifact(**data_transformation_artifact),
+                                     data_ingestion_artifact=artifact_entity.DataIngestionArtifact(**data_ingestion_artifact),
+                                     model_trainer_artifact=artifact_entity.ModelTrainerArtifact(**model_trainer_artifact))
+        return run_stage(artifact_dir, "model_evaluation", model_eval.initiate_model_evalutaion)
+
+
+    @task
+    def model_pusher(artifact_dir:str, data_transformation_artifact:dict, model_trainer_artifact:dict,
+                     model_eval_artifact:dict) -> dict:
+        from sensor.entity import config_entity, artifact_entity
+        from sensor.components.model_pusher import ModelPusher
+        from sensor.pipeline.stage_checkpoint import run_stage
+
+        from airflow.exceptions import AirflowSkipException
+
+        # A challenger that is not significantly better is not pushed
+        if not model_eval_artifact["is_model_accepted"]:
+            raise AirflowSkipException("Model was not accepted by evaluation")
+        training_pipeline_config = get_training_pipeline_config(artifact_dir)
+        model_pusher_config = config_entity.ModelPusherConfig(training_pipeline_config=training_pipeline_config)
+        model_pusher = ModelPusher(model_pusher_config=model_pusher_config,
+                                   data_transformation_artifact=artifact_entity.DataTransformationArtifact(**data_transformation_artifact),
+                                   model_trainer_artifact=artifact_entity.ModelTrainerArtifact(**model_trainer_artifact))
+        return run_stage(artifact_dir, "model_pusher", model_pusher.initiate_model_pusher)
+
+
+    artifact_dir = create_artifact_dir()
+    data_ingestion_artifact = data_ingestion(artifact_dir)
+    data_validation_artifact = data_validation(artifact_dir, data_ingestion_artifact)
+    data_transformation_artifact = data_transformation(artifact_dir, data_ingestion_artifact)
+    # Validation writes a report only, transformation still waits for it as in the sequential pipeline
+    data_validation_artifact >> data_transformation_artifact
+    model_trainer_artifact = model_trainer(artifact_dir, data_ingestion_artifact, data_transformation_artifact)
+    model_eval_artifact = model_evaluation(artifact_dir, data_ingestion_artifact, data_transformation_artifact,
+                                           model_trainer_artifact)
+    model_pusher(artifact_dir, data_transformation_artifact, model_trainer_artifact, model_eval_artifact)
+
+
+training_dag = sensor_training()
+
+
+if __name__ == "__main__":
+    training_dag.test()
@@ -0,0 +1,111 @@
+"""
+Measure throughput of concurrent trainings as worker processes are added
+
+Usage:
+    python -m benchmarks.cpu_scaling --workers 1 2 4 8 --tasks 16
+
+Every task fits an XGBoost model and scores a batch, the way a partition training or
+a scorer does. Each worker count is run twice: managed, where sensor.resources gives
+every worker its own cores and thread budget, and unmanaged, where every worker uses
+one thread per core of the host. Results go to benchmarks/results/cpu_scaling_<timestamp>.yaml.
+"""
+import os, sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+from sensor import utils
+from sensor.exception import SensorException
+from sensor.config import TARGET_COLUMN
+from sensor.resources import WorkerResources, get_available_cpus, get_num_threads, configure_process
+from benchmarks import data_generator
+from benchmarks.run_benchmarks import RESULT_DIR
+
+DEFAULT_NUM_ROWS = 20_000
+DEFAULT_NUM_TASKS = 16
+
+_task_data = dict()
+
+
+def load_task_data(data_file_path:str, worker_resources:WorkerResources = None):
+    if worker_resources is not None:
+        worker_resources.initialize()
+    else:
+        # Unmanaged workers pick every core, as the libraries do by default
+        configure_process(num_threads=len(get_available_cpus()))
+    with np.load(data_file_path) as data:
+        _task_data["x"], _task_data["y"] = data["x"], data["y"]
+
+
+def run_task(task_idx:int) -> int:
+    from xgboost import XGBClassifier
+    x, y = _task_data["x"], _task_data["y"]
+    model = XGBClassifier(n_estimators=50, n_jobs=get_num_threads(), random_state=task_idx)
+    model.fit(x, y)
+    model.predict(x)
+    return len(x)
+
+
+def run_workers(data_file_path:str, num_workers:int, num_tasks:int, managed:bool) -> dict:
+    """
+    return: wall time, tasks per second and rows per second of num_tasks tasks on num_workers processes
+    """
+    try:
+        mp_context = multiprocessing.get_context("spawn")
+        worker_resources = WorkerResources(num_workers=num_workers, mp_context=mp_context) if managed else None
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=mp_context,
+                                 initializer=load_task_data, initargs=(data_file_path, worker_resources)) as executor:
+            # Workers are started and warmed before timing
+            list(executor.map(run_task, range(num_workers)))
+            start_time = time.perf_counter()
+            num_rows = sum(executor.map(run_task, range(num_tasks)))
+            wall_time = time.perf_counter() - start_time
+
+        return {"wall_time_sec": wall_time, "tasks_per_sec": num_tasks / wall_time, "rows_per_sec": num_rows / wall_time}
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Throughput of concurrent trainings with and without the CPU budget")
+    parser.add_argument("--workers", type=int, nargs="+", default=None)
+    parser.add_argument("--tasks", type=int, default=DEFAULT_NUM_TASKS)
+    parser.add_argument("--rows", type=int, default=DEFAULT_NUM_ROWS)
+    args = parser.parse_args(args)
+
+    try:
+        num_cpus = len(get_available_cpus())
+        worker_counts = args.workers or sorted({1, 2, 4, num_cpus, 2*num_cpus})
+
+        data_df = next(data_generator.generate_sensor_data(num_rows=args.rows, chunk_size=args.rows))
+        x = data_df.drop(TARGET_COLUMN, axis=1).replace(to_replace="na", value=np.nan).astype("float64").to_numpy()
+        y = (data_df[TARGET_COLUMN] == "pos").to_numpy().astype(int)
+
+        results = {"num_cpus": num_cpus, "num_rows": args.rows, "num_tasks": args.tasks, "managed": dict(), "unmanaged": dict()}
+        with tempfile.TemporaryDirectory(prefix="aps_cpu_scaling_") as work_dir:
+            data_file_path = os.path.join(work_dir, "data.npz")
+            np.savez(data_file_path, x=x, y=y)
+
+            print(f"{'workers':>8} {'managed tasks/s':>16} {'unmanaged tasks/s':>18}")
+            for num_workers in worker_counts:
+                for mode in ("managed", "unmanaged"):
+                    results[mode][num_workers] = run_workers(data_file_path=data_file_path, num_workers=num_workers,
+                                                             num_tasks=args.tasks, managed=mode == "managed")
+                print(f"{num_workers:>8} {results['managed'][num_workers]['tasks_per_sec']:>16.2f} "
+                      f"{results['unmanaged'][num_workers]['tasks_per_sec']:>18.2f}")
+
+        result_file_path = os.path.join(RESULT_DIR, f"cpu_scaling_{datetime.now().strftime('%m%d%Y__%H%M%S')}.yaml")
+        utils.write_yaml_file(file_path=result_file_path, data=results)
+        print(f"Benchmark results stored here: {result_file_path}")
+        return 0
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
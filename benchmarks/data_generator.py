@@ -0,0 +1,114 @@
+import os, sys
+import numpy as np
+import pandas as pd
+from typing import Iterator, List
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.config import TARGET_COLUMN
+
+NUM_SENSOR_COLUMNS = 170
+POS_RATIO = 1/61
+MISSING_VALUE = "na"
+CHUNK_SIZE = 100_000
+
+
+def get_sensor_column_names(num_columns:int = NUM_SENSOR_COLUMNS) -> List[str]:
+    """
+    APS style anonymised sensor names: aa_000, ab_000, ... with histogram sensors
+    expanded into bins ag_000 ... ag_009
+    """
+    column_names = []
+    histogram_prefixes = {"ag", "ay", "az", "ba", "cn", "cs", "ee"}
+    for first in "abcde":
+        for second in "abcdefghijklmnopqrstuvwxyz":
+            prefix = f"{first}{second}"
+            num_bins = 10 if prefix in histogram_prefixes else 1
+            column_names.extend(f"{prefix}_{bin_idx:03d}" for bin_idx in range(num_bins))
+            if len(column_names) >= num_columns:
+                return column_names[:num_columns]
+    return column_names
+
+
+def generate_sensor_data(num_rows:int, num_columns:int = NUM_SENSOR_COLUMNS, pos_ratio:float = POS_RATIO,
+                         random_state:int = 42, chunk_size:int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Generate synthetic APS shaped data in chunks so millions of rows never have to fit in memory at once
+    num_rows: total number of rows to generate
+    num_columns: number of sensor columns
+    pos_ratio: share of rows labelled pos
+    =====================================================================================
+    yields Pandas DataFrame chunks with the target column first and "na" for missing values
+    """
+    try:
+        column_names = get_sensor_column_names(num_columns=num_columns)
+        # Column level properties are drawn once so every chunk shares the same missing pattern and signal
+        column_rng = np.random.default_rng(random_state)
+        missing_rates = column_rng.uniform(0, 0.1, num_columns)
+        sparse_columns = column_rng.choice(num_columns, size=max(1, num_columns//12), replace=False)
+        missing_rates[sparse_columns] = column_rng.uniform(0.3, 0.8, len(sparse_columns))
+        column_scales = column_rng.uniform(1, 6, num_columns)
+        signal_columns = column_rng.choice(num_columns, size=max(1, num_columns//10), replace=False)
+        signal_shift = np.zeros(num_columns)
+        signal_shift[signal_columns] = column_rng.uniform(1.5, 3, len(signal_columns))
+
+        for chunk_idx, chunk_start in enumerate(range(0, num_rows, chunk_size)):
+            rng = np.random.default_rng([random_state, chunk_idx])
+            chunk_rows = min(chunk_size, num_rows-chunk_start)
+
+            is_pos = rng.random(chunk_rows) < pos_ratio
+            values = rng.lognormal(mean=column_scales, sigma=1.0, size=(chunk_rows, num_columns))
+            values[is_pos] *= np.exp(signal_shift)
+            values = np.round(values).astype(object)
+            values[rng.random((chunk_rows, num_columns)) < missing_rates] = MISSING_VALUE
+
+            chunk_df = pd.DataFrame(values, columns=column_names)
+            chunk_df.insert(0, TARGET_COLUMN, np.where(is_pos, "pos", "neg"))
+            yield chunk_df
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def write_sensor_csv(file_path:str, num_rows:int, **kwargs) -> str:
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        for chunk_idx, chunk_df in enumerate(generate_sensor_data(num_rows=num_rows, **kwargs)):
+            chunk_df.to_csv(file_path, mode="w" if chunk_idx==0 else "a", header=chunk_idx==0, index=False)
+
+        logging.info(f"Synthetic sensor csv with {num_rows} rows written to: {file_path}")
+        return file_path
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def load_sensor_collection(mongo_client, database_name:str, collection_name:str, num_rows:int, **kwargs):
+    try:
+        collection = mongo_client[database_name][collection_name]
+        collection.drop()
+        for chunk_df in generate_sensor_data(num_rows=num_rows, **kwargs):
+            collection.insert_many(chunk_df.to_dict(orient="records"), ordered=False)
+
+        logging.info(f"Synthetic sensor collection {database_name}.{collection_name} loaded with {num_rows} rows")
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def get_local_mongo_client(mongo_db_url:str = None):
+    """
+    Return a client for a local mongod when mongo_db_url is given, else an in-memory mongomock stand-in
+    """
+    try:
+        if mongo_db_url is not None:
+            import pymongo
+            return pymongo.MongoClient(mongo_db_url)
+
+        try:
+            import mongomock
+        except ImportError:
+            raise Exception("mongomock is required for the in-memory Mongo stand-in, install it or pass a local mongo url")
+        return mongomock.MongoClient()
+
+    except Exception as e:
+        raise SensorException(e, sys)
@@ -0,0 +1,132 @@
+"""
+Time every stage of start_training_pipeline and start_batch_prediction on synthetic data
+
+Usage:
+    python -m benchmarks.run_benchmarks --sizes 10000 50000 200000
+    python -m benchmarks.run_benchmarks --update-baseline
+
+Each size runs in a fresh working directory against a local Mongo stand-in.
+Results are stored in benchmarks/results/<timestamp>.yaml and compared with
+benchmarks/baseline.yaml, stages slower than the tolerance are flagged as regressions.
+"""
+import os, sys
+import glob
+import argparse
+import tempfile
+from datetime import datetime
+from sensor import config, utils
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.entity import config_entity
+from benchmarks import data_generator
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULT_DIR = os.path.join(BENCHMARK_DIR, "results")
+BASELINE_FILE_PATH = os.path.join(BENCHMARK_DIR, "baseline.yaml")
+DEFAULT_SIZES = [10_000, 50_000, 200_000]
+DEFAULT_TOLERANCE = 0.2
+METRICS = ["wall_time_sec", "cpu_time_sec", "peak_rss_mb", "bytes_read", "bytes_written", "rows_processed"]
+
+
+def read_stage_metrics(profile_file_path:str) -> dict:
+    run_profile = utils.read_yaml_file(file_path=profile_file_path)
+    return {stage_name: {metric: stage_profile.get(metric) for metric in METRICS}
+            for stage_name, stage_profile in run_profile["stages"].items()}
+
+
+def run_size(num_rows:int, mongo_db_url:str = None, random_state:int = 42) -> dict:
+    """
+    Run training and batch prediction once on num_rows synthetic rows
+    return: dict of stage name to metrics
+    """
+    try:
+        from sensor.pipeline.training_pipeline import start_training_pipeline
+        from sensor.pipeline.batch_prediction import start_batch_prediction
+
+        current_dir = os.getcwd()
+        with tempfile.TemporaryDirectory(prefix=f"aps_benchmark_{num_rows}_") as work_dir:
+            os.chdir(work_dir)
+            try:
+                training_pipeline_config = config_entity.TrainingPipelineConfig()
+                data_ingestion_config = config_entity.DataIngestionConfig(training_pipeline_config=training_pipeline_config)
+                data_validation_config = config_entity.DataValidationConfig(training_pipeline_config=training_pipeline_config)
+
+                config.mongo_client = data_generator.get_local_mongo_client(mongo_db_url=mongo_db_url)
+                data_generator.load_sensor_collection(mongo_client=config.mongo_client,
+                                                      database_name=data_ingestion_config.database_name,
+                                                      collection_name=data_ingestion_config.collection_name,
+                                                      num_rows=num_rows, random_state=random_state)
+                data_generator.write_sensor_csv(file_path=data_validation_config.base_file_path,
+                                                num_rows=num_rows, random_state=random_state+1)
+
+                start_training_pipeline()
+                start_batch_prediction(input_file_path=data_validation_config.base_file_path)
+
+                training_profile_path, = glob.glob(os.path.join("artifacts", "*", "run_profile.yaml"))
+                prediction_profile_path, = glob.glob(os.path.join("prediction", "profile", "*.yaml"))
+                stage_metrics = read_stage_metrics(training_profile_path)
+                stage_metrics.update(read_stage_metrics(prediction_profile_path))
+                return stage_metrics
+
+            finally:
+                os.chdir(current_dir)
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def find_regressions(results:dict, baseline:dict, tolerance:float) -> list:
+    """
+    Compare wall time of every size and stage against the baseline
+    return: list of regression descriptions
+    """
+    regressions = []
+    for num_rows, stages in results.items():
+        for stage_name, metrics in stages.items():
+            baseline_time = baseline.get(num_rows, dict()).get(stage_name, dict()).get("wall_time_sec")
+            if baseline_time is None or baseline_time == 0:
+                continue
+            ratio = metrics["wall_time_sec"] / baseline_time
+            if ratio > 1 + tolerance:
+                regressions.append(f"{num_rows} rows, {stage_name}: {metrics['wall_time_sec']:.3f}s vs baseline {baseline_time:.3f}s ({ratio:.2f}x)")
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark APS fault detection pipeline stages on synthetic data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--mongo-url", default=None, help="local mongod url, defaults to an in-memory stand-in")
+    parser.add_argument("--baseline", default=BASELINE_FILE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(args)
+
+    try:
+        results = dict()
+        for num_rows in args.sizes:
+            logging.info(f"Benchmarking pipeline with {num_rows} rows")
+            results[num_rows] = run_size(num_rows=num_rows, mongo_db_url=args.mongo_url)
+            for stage_name, metrics in results[num_rows].items():
+                print(f"{num_rows:>10} rows  {stage_name:<22} {metrics['wall_time_sec']:>9.3f}s  {metrics['peak_rss_mb'] or 0:>9.1f} MB")
+
+        result_file_path = os.path.join(RESULT_DIR, f"{datetime.now().strftime('%m%d%Y__%H%M%S')}.yaml")
+        utils.write_yaml_file(file_path=result_file_path, data=results)
+        print(f"Benchmark results stored here: {result_file_path}")
+
+        if args.update_baseline:
+            utils.write_yaml_file(file_path=args.baseline, data=results)
+            print(f"Baseline updated: {args.baseline}")
+            return 0
+
+        regressions = find_regressions(results=results, baseline=utils.read_yaml_file(file_path=args.baseline),
+                                       tolerance=args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if len(regressions) > 0 else 0
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
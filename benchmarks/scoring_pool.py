@@ -0,0 +1,143 @@
+"""
+Compare start time and memory of scoring workers that load the model themselves with forked workers sharing it
+
+Usage:
+    python -m benchmarks.scoring_pool --workers 1 2 4 8
+
+A model is fitted on synthetic sensor data and pushed to a temporary registry. For every worker
+count, spawned workers each load the registry version, as separate scoring processes do, while
+forked workers inherit the version the parent loaded once. Every worker scores one batch and then
+reports its unique (USS) and proportional (PSS) memory. Linux only, memory is read from /proc.
+Results go to benchmarks/results/scoring_pool_<timestamp>.yaml.
+"""
+import os, sys
+import gc
+import time
+import argparse
+import tempfile
+import multiprocessing
+from datetime import datetime
+import numpy as np
+from xgboost import XGBClassifier
+from sklearn.preprocessing import LabelEncoder
+from sensor import utils
+from sensor.exception import SensorException
+from sensor.config import TARGET_COLUMN
+from sensor.predictor import ModelResolver, SensorModel
+from sensor.components.data_transformation import DataTransformation
+from benchmarks import data_generator
+from benchmarks.run_benchmarks import RESULT_DIR
+
+DEFAULT_NUM_ROWS = 20_000
+DEFAULT_NUM_ESTIMATORS = 300
+SCORE_ROWS = 1_000
+
+_sensor_model = None
+
+
+def read_memory_mb(pid:int) -> dict:
+    memory = dict()
+    with open(f"/proc/{pid}/smaps_rollup") as smaps_file:
+        for line in smaps_file:
+            fields = line.split()
+            if fields[0] in ("Pss:", "Private_Clean:", "Private_Dirty:"):
+                memory[fields[0][:-1]] = int(fields[1]) / 1024
+    return {"pss_mb": memory["Pss"], "uss_mb": memory["Private_Clean"] + memory["Private_Dirty"]}
+
+
+def run_worker(model_registry:str, score_df, ready_queue, stop_event):
+    sensor_model = _sensor_model if _sensor_model is not None else SensorModel(model_resolver=ModelResolver(model_registry=model_registry))
+    sensor_model.predict(score_df)
+    ready_queue.put(os.getpid())
+    stop_event.wait()
+
+
+def start_workers(model_registry:str, score_df, num_workers:int, start_method:str) -> dict:
+    """
+    return: seconds until every worker scored its batch and mean memory per worker
+    """
+    try:
+        mp_context = multiprocessing.get_context(start_method)
+        ready_queue, stop_event = mp_context.Queue(), mp_context.Event()
+
+        start_time = time.perf_counter()
+        workers = [mp_context.Process(target=run_worker, args=(model_registry, score_df, ready_queue, stop_event))
+                   for _ in range(num_workers)]
+        for worker in workers:
+            worker.start()
+        worker_pids = [ready_queue.get() for _ in range(num_workers)]
+        start_time_sec = time.perf_counter() - start_time
+
+        memory = [read_memory_mb(pid) for pid in worker_pids]
+        stop_event.set()
+        for worker in workers:
+            worker.join()
+
+        return {"start_time_sec": start_time_sec,
+                "uss_mb_per_worker": float(np.mean([worker_memory["uss_mb"] for worker_memory in memory])),
+                "pss_mb_per_worker": float(np.mean([worker_memory["pss_mb"] for worker_memory in memory]))}
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def push_model(model_registry:str, num_rows:int, num_estimators:int):
+    """
+    Fit transformer, model and target encoder on synthetic data and store them as registry version 0
+    return: raw DataFrame of the first SCORE_ROWS rows for the workers to score
+    """
+    data_df = next(data_generator.generate_sensor_data(num_rows=num_rows, chunk_size=num_rows))
+    input_df = data_df.drop(TARGET_COLUMN, axis=1).replace(to_replace="na", value=np.nan).astype("float64")
+    transformer = DataTransformation.get_data_transformer_object()
+    x = transformer.fit_transform(input_df)
+    target_encoder = LabelEncoder().fit(data_df[TARGET_COLUMN])
+    model = XGBClassifier(n_estimators=num_estimators).fit(x, target_encoder.transform(data_df[TARGET_COLUMN]))
+
+    model_resolver = ModelResolver(model_registry=model_registry)
+    version_dir = model_resolver.get_latest_save_dir_path()
+    utils.save_object(file_path=model_resolver.get_transformer_path(version_dir), obj=transformer)
+    utils.save_object(file_path=model_resolver.get_model_path(version_dir), obj=model)
+    utils.save_object(file_path=model_resolver.get_target_encoder_path(version_dir), obj=target_encoder)
+    return input_df.iloc[:SCORE_ROWS]
+
+
+def main(args=None):
+    global _sensor_model
+    parser = argparse.ArgumentParser(description="Start time and memory of spawned and forked scoring workers")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--rows", type=int, default=DEFAULT_NUM_ROWS)
+    parser.add_argument("--estimators", type=int, default=DEFAULT_NUM_ESTIMATORS)
+    args = parser.parse_args(args)
+
+    try:
+        results = {"num_estimators": args.estimators, "spawn": dict(), "fork": dict()}
+        with tempfile.TemporaryDirectory(prefix="aps_scoring_pool_") as model_registry:
+            score_df = push_model(model_registry=model_registry, num_rows=args.rows, num_estimators=args.estimators)
+            results["model_file_mb"] = os.path.getsize(ModelResolver(model_registry=model_registry).get_latest_model_path()) / 2**20
+
+            print(f"{'workers':>8} {'spawn start s':>14} {'fork start s':>13} {'spawn USS MB':>13} {'fork USS MB':>12}")
+            for num_workers in args.workers:
+                _sensor_model = None
+                results["spawn"][num_workers] = start_workers(model_registry, score_df, num_workers, "spawn")
+
+                # Loaded once, as ScoringPool does before forking its workers
+                _sensor_model = SensorModel(model_resolver=ModelResolver(model_registry=model_registry))
+                gc.freeze()
+                results["fork"][num_workers] = start_workers(model_registry, score_df, num_workers, "fork")
+                gc.unfreeze()
+
+                spawn_result, fork_result = results["spawn"][num_workers], results["fork"][num_workers]
+                print(f"{num_workers:>8} {spawn_result['start_time_sec']:>14.2f} {fork_result['start_time_sec']:>13.2f} "
+                      f"{spawn_result['uss_mb_per_worker']:>13.1f} {fork_result['uss_mb_per_worker']:>12.1f}")
+
+        result_file_path = os.path.join(RESULT_DIR, f"scoring_pool_{datetime.now().strftime('%m%d%Y__%H%M%S')}.yaml")
+        utils.write_yaml_file(file_path=result_file_path, data=results)
+        print(f"Benchmark results stored here: {result_file_path}")
+        return 0
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
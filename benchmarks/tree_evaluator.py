@@ -0,0 +1,102 @@
+"""
+Compare scoring latency of the XGBoost booster and the compiled tree ensemble
+
+Usage:
+    python -m benchmarks.tree_evaluator --batch-sizes 1 10 100 1000 10000 100000
+
+A model is fitted on synthetic sensor data with the training pipeline's transformer.
+Every batch size is scored repeatedly by both evaluators, the median call latency and
+rows per second are reported. Every batch is checked to give margins within the compiled
+ensemble's documented tolerance, and predictions that only differ for rows within that
+tolerance of the decision threshold.
+Results go to benchmarks/results/tree_evaluator_<timestamp>.yaml.
+"""
+import os, sys
+import time
+import argparse
+from datetime import datetime
+import numpy as np
+import xgboost
+from xgboost import XGBClassifier
+from sensor import utils
+from sensor.exception import SensorException
+from sensor.config import TARGET_COLUMN
+from sensor.resources import configure_process, get_num_threads
+from sensor.tree_ensemble import CompiledTreeEnsemble, MARGIN_ATOL, MARGIN_RTOL
+from sensor.components.data_transformation import DataTransformation
+from benchmarks import data_generator
+from benchmarks.run_benchmarks import RESULT_DIR
+
+DEFAULT_BATCH_SIZES = [1, 10, 100, 1_000, 10_000, 100_000]
+DEFAULT_NUM_ROWS = 20_000
+# Repeats of a batch size are capped by rows as well, so large batches do not dominate the run time
+MIN_REPEATS = 3
+MAX_REPEATS = 200
+ROWS_PER_SIZE = 1_000_000
+
+
+def time_calls(predict, x:np.ndarray, num_repeats:int) -> float:
+    """
+    return: median wall time of num_repeats predict calls in seconds
+    """
+    call_times = []
+    for _ in range(num_repeats):
+        start_time = time.perf_counter()
+        predict(x)
+        call_times.append(time.perf_counter() - start_time)
+    return float(np.median(call_times))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Latency of XGBoost and the compiled tree ensemble by batch size")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=DEFAULT_BATCH_SIZES)
+    parser.add_argument("--rows", type=int, default=DEFAULT_NUM_ROWS)
+    parser.add_argument("--num-threads", type=int, default=None)
+    args = parser.parse_args(args)
+
+    try:
+        configure_process(num_threads=args.num_threads)
+
+        data_df = next(data_generator.generate_sensor_data(num_rows=args.rows, chunk_size=args.rows))
+        input_df = data_df.drop(TARGET_COLUMN, axis=1).replace(to_replace="na", value=np.nan).astype("float64")
+        transformer = DataTransformation.get_data_transformer_object()
+        x = transformer.fit_transform(input_df)
+        y = (data_df[TARGET_COLUMN] == "pos").to_numpy().astype(int)
+
+        model = XGBClassifier(n_jobs=get_num_threads())
+        model.fit(x, y)
+        compiled_model = CompiledTreeEnsemble.from_xgb_classifier(model)
+
+        results = {"num_threads": get_num_threads(), "num_trees": len(compiled_model.tree_roots),
+                   "max_depth": compiled_model.max_depth, "batch_sizes": dict()}
+        print(f"{'rows':>8} {'xgboost ms':>12} {'compiled ms':>12} {'speedup':>8}")
+        for batch_size in args.batch_sizes:
+            batch = x[np.arange(batch_size) % len(x)]
+            xgboost_margin = model.get_booster().predict(xgboost.DMatrix(batch), output_margin=True)
+            if not np.allclose(compiled_model.predict_margin(batch), xgboost_margin, rtol=MARGIN_RTOL, atol=MARGIN_ATOL):
+                raise Exception(f"Compiled margins differ from XGBoost beyond tolerance at batch size: {batch_size}")
+            near_threshold = np.abs(xgboost_margin) <= MARGIN_ATOL
+            if not np.array_equal(model.predict(batch)[~near_threshold], compiled_model.predict(batch)[~near_threshold]):
+                raise Exception(f"Compiled predictions differ from XGBoost at batch size: {batch_size}")
+
+            num_repeats = int(np.clip(ROWS_PER_SIZE // batch_size, MIN_REPEATS, MAX_REPEATS))
+            xgboost_latency = time_calls(model.predict_proba, batch, num_repeats)
+            compiled_latency = time_calls(compiled_model.predict_proba, batch, num_repeats)
+            results["batch_sizes"][batch_size] = {
+                "xgboost": {"latency_ms": xgboost_latency * 1000, "rows_per_sec": batch_size / xgboost_latency},
+                "compiled": {"latency_ms": compiled_latency * 1000, "rows_per_sec": batch_size / compiled_latency},
+                "speedup": xgboost_latency / compiled_latency}
+            print(f"{batch_size:>8} {xgboost_latency*1000:>12.3f} {compiled_latency*1000:>12.3f} "
+                  f"{xgboost_latency/compiled_latency:>8.2f}")
+
+        result_file_path = os.path.join(RESULT_DIR, f"tree_evaluator_{datetime.now().strftime('%m%d%Y__%H%M%S')}.yaml")
+        utils.write_yaml_file(file_path=result_file_path, data=results)
+        print(f"Benchmark results stored here: {result_file_path}")
+        return 0
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
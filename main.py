@@ -1,5 +1,6 @@
 import os, sys
 from sensor.exception import SensorException
+from sensor.resources import configure_process
 from sensor.pipeline.training_pipeline import start_training_pipeline
 from sensor.pipeline.batch_prediction import start_batch_prediction
 
@@ -9,6 +10,7 @@ print(__name__)
 
 if __name__ == "__main__":
     try:
+        configure_process()
         start_training_pipeline()
         output = start_batch_prediction(input_file_path=input_dir)
         print(f"Prediction Complete, file stored here: {output}")
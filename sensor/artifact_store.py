@@ -0,0 +1,209 @@
+import os, sys
+import re
+import time
+import shutil
+import stat
+import uuid
+from typing import Dict, List
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.utils import get_file_hash, write_yaml_file, read_yaml_file
+
+# Blobs younger than this are never collected, a concurrent pusher may have stored them and not published them yet
+GC_MIN_BLOB_AGE_SEC = 3600
+
+
+class ArtifactStore:
+    """
+    Content addressed blob store for pipeline artifacts
+    Every file is copied once into blobs/<digest[:2]>/<digest> and published
+    into artifact or registry directories as hardlinks of the read only blob,
+    falling back to a copy when the target lives on another filesystem.
+    Every publish records a manifest of its target and digests, garbage
+    collection keeps the blobs referenced by manifests whose target still exists
+    """
+
+    def __init__(self, store_dir:str = "artifact_store"):
+        try:
+            self.store_dir = store_dir
+            self.blob_dir = os.path.join(self.store_dir, "blobs")
+            self.manifest_dir = os.path.join(self.store_dir, "manifests")
+            os.makedirs(self.blob_dir, exist_ok=True)
+            os.makedirs(self.manifest_dir, exist_ok=True)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_blob_path(self, digest:str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+
+    @staticmethod
+    def link_or_copy(src_path:str, dst_path:str):
+        try:
+            os.link(src_path, dst_path)
+        except OSError:
+            shutil.copy2(src_path, dst_path)
+
+
+    def put(self, file_path:str) -> str:
+        """
+        Add a file to the store
+        file_path: str location of file to store
+        return: sha256 digest addressing the stored blob
+        """
+        try:
+            digest = get_file_hash(file_path)
+            blob_path = self.get_blob_path(digest)
+
+            if os.path.exists(blob_path):
+                logging.info(f"Blob {digest} already available, skipping store of {file_path}")
+                # Restarts the garbage collection grace period, the caller is about to publish it
+                os.utime(blob_path)
+                return digest
+
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            tmp_blob_path = f"{blob_path}.{uuid.uuid4().hex}.tmp"
+            # Copied rather than linked, so the blob never shares an inode with a file the pipeline may rewrite
+            shutil.copyfile(file_path, tmp_blob_path)
+            # Blobs are shared by every published link, they must never be written in place
+            os.chmod(tmp_blob_path, 0o444)
+            os.replace(tmp_blob_path, blob_path)
+            return digest
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def write_manifest(self, target_path:str, files:Dict[str, str]):
+        """
+        Record that target_path, a file or a directory, references the given blobs
+        files: relative file path inside target_path to blob digest, "." for a file target
+        """
+        try:
+            manifest_path = os.path.join(self.manifest_dir, f"{uuid.uuid4().hex}.yaml")
+            tmp_manifest_path = f"{manifest_path}.tmp"
+            write_yaml_file(file_path=tmp_manifest_path, data={"target_path": os.path.abspath(target_path), "files": dict(files)})
+            os.replace(tmp_manifest_path, manifest_path)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def link_blob(self, digest:str, target_path:str):
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        tmp_target_path = f"{target_path}.{uuid.uuid4().hex}.tmp"
+        self.link_or_copy(self.get_blob_path(digest), tmp_target_path)
+        os.replace(tmp_target_path, target_path)
+
+
+    def publish(self, digest:str, target_path:str):
+        """
+        Publish a stored blob at target_path
+        """
+        try:
+            self.write_manifest(target_path=target_path, files={".": digest})
+            self.link_blob(digest=digest, target_path=target_path)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def publish_dir(self, target_dir:str, files:Dict[str, str]):
+        """
+        Atomically create target_dir holding the given blobs
+        The directory is assembled under a hidden temporary name next to
+        target_dir and renamed into place, so readers never see a partial version
+        target_dir: directory to create, must not exist
+        files: relative file path inside target_dir to blob digest
+        """
+        try:
+            parent_dir = os.path.dirname(os.path.abspath(target_dir))
+            tmp_dir = os.path.join(parent_dir, f".tmp-{uuid.uuid4().hex}")
+
+            # Manifest goes first, a collection running meanwhile must not take the blobs being linked
+            self.write_manifest(target_path=target_dir, files=files)
+            try:
+                for relative_path, digest in files.items():
+                    self.link_blob(digest=digest, target_path=os.path.join(tmp_dir, relative_path))
+                os.rename(tmp_dir, target_dir)
+            except Exception:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def collect_garbage(self, min_blob_age_sec:float = GC_MIN_BLOB_AGE_SEC) -> List[str]:
+        """
+        Delete blobs which are no longer referenced by any artifact or registry directory
+        Manifests whose target was removed are deleted first, blobs referenced by none of
+        the remaining manifests are deleted once they are older than min_blob_age_sec
+        return: list of deleted digests
+        """
+        try:
+            referenced_digests = set()
+            for manifest_name in os.listdir(self.manifest_dir):
+                manifest_path = os.path.join(self.manifest_dir, manifest_name)
+                is_expired = time.time() - os.path.getmtime(manifest_path) > min_blob_age_sec
+                if manifest_name.endswith(".tmp"):
+                    if is_expired:
+                        os.remove(manifest_path)
+                    continue
+                manifest = read_yaml_file(file_path=manifest_path)
+                if os.path.exists(manifest["target_path"]):
+                    referenced_digests.update(manifest["files"].values())
+                # A manifest written for a publish that is still running names a target which does not exist yet
+                elif is_expired:
+                    os.remove(manifest_path)
+
+            deleted_digests = []
+            for prefix in os.listdir(self.blob_dir):
+                prefix_dir = os.path.join(self.blob_dir, prefix)
+                for blob_name in os.listdir(prefix_dir):
+                    blob_path = os.path.join(prefix_dir, blob_name)
+                    if blob_name in referenced_digests or time.time() - os.path.getmtime(blob_path) <= min_blob_age_sec:
+                        continue
+                    os.chmod(blob_path, stat.S_IWRITE)
+                    os.remove(blob_path)
+                    deleted_digests.append(blob_name)
+
+            logging.info(f"Garbage collected {len(deleted_digests)} blobs from {self.blob_dir}")
+            return deleted_digests
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+def _remove_readonly(func, path, _):
+    # Published blobs are read only, which blocks their removal on Windows
+    os.chmod(path, stat.S_IWRITE)
+    func(path)
+
+
+def remove_old_artifact_runs(artifact_root_dir:str, num_runs_to_keep:int) -> List[str]:
+    """
+    Delete all but the most recent artifacts/<timestamp> run directories
+    Runs are ordered by modification time since the timestamp format does not sort across years
+    return: list of deleted run directories
+    """
+    try:
+        if not os.path.exists(artifact_root_dir):
+            return []
+
+        # Only timestamp named directories are runs, partition namespaces live beside them
+        run_dirs = [os.path.join(artifact_root_dir, dir_name) for dir_name in os.listdir(artifact_root_dir)
+                    if re.fullmatch(r"\d{8}__\d{6}", dir_name)]
+        run_dirs = sorted(filter(os.path.isdir, run_dirs), key=os.path.getmtime, reverse=True)
+
+        removed_run_dirs = run_dirs[num_runs_to_keep:]
+        for run_dir in removed_run_dirs:
+            logging.info(f"Removing old artifact run: {run_dir}")
+            shutil.rmtree(run_dir, onerror=_remove_readonly)
+
+        return removed_run_dirs
+
+    except Exception as e:
+        raise SensorException(e, sys)
@@ -1,12 +1,14 @@
-import os, sys
+import sys
 import pandas as pd
 import numpy as np
-from sensor import utils
+from sensor import utils, feature_store
 from sensor.exception import SensorException
 from sensor.logger import logging
+from sensor.profiler import record_rows
+from sensor.config import TARGET_COLUMN
+from sensor.predictor import ModelResolver
 from sensor.entity import config_entity
 from sensor.entity import artifact_entity
-from sklearn.model_selection import train_test_split
 
 
 class DataIngestion:
@@ -26,49 +28,70 @@ class DataIngestion:
 
             logging.info(f"Exporting collection data as Pandas Dataframe")
             # Exporting collection data in a pandas dataframe
-            df:pd.DataFrame = utils.get_collection_as_dataframe(database_name=self.data_ingestion_config.database_name,
-                                                                collection_name=self.data_ingestion_config.collection_name)
+            columns = self.data_ingestion_config.columns
+            if columns is None and self.data_ingestion_config.use_required_columns:
+                columns = ModelResolver(model_registry=self.data_ingestion_config.model_registry,
+                                        partition=self.data_ingestion_config.partition).get_required_columns()
+                logging.info(f"Fetching the columns required by the latest model: {columns}")
+            if columns is not None:
+                columns = list(dict.fromkeys([*columns, TARGET_COLUMN]))
+            if self.data_ingestion_config.sample_size is None:
+                df:pd.DataFrame = utils.get_collection_as_dataframe(database_name=self.data_ingestion_config.database_name,
+                                                                    collection_name=self.data_ingestion_config.collection_name,
+                                                                    columns=columns,
+                                                                    query=self.data_ingestion_config.query)
+            else:
+                df:pd.DataFrame = utils.get_collection_sample_as_dataframe(database_name=self.data_ingestion_config.database_name,
+                                                                           collection_name=self.data_ingestion_config.collection_name,
+                                                                           sample_size=self.data_ingestion_config.sample_size,
+                                                                           stratify_column=TARGET_COLUMN,
+                                                                           columns=columns,
+                                                                           query=self.data_ingestion_config.query,
+                                                                           random_state=self.data_ingestion_config.random_state)
             
             
-            # Replace na values with NAN
-            df.replace(to_replace="na", value=np.NAN, inplace=True)
+            record_rows(len(df))
 
-            
-            logging.info(f"Saving data in feature store")
-            # making a feature store folder
-            feature_store_dir = os.path.dirname(self.data_ingestion_config.feature_store_file_path)
-            logging.info(f"Make new folder store folder if not available")
-            # make new folder if not available
-            os.makedirs(feature_store_dir, exist_ok=True)
-            logging.info(f"Save df to feature folder")
-            # Store the df in feature store folder
-            df.to_csv(path_or_buf=self.data_ingestion_config.feature_store_file_path, index=False, header=True)
+            # The partition key identifies a fleet, it is not a sensor reading
+            partition_key = self.data_ingestion_config.partition_key
+            if partition_key is not None and partition_key in df.columns:
+                df.drop(partition_key, axis=1, inplace=True)
 
-            
-            logging.info(f"Split the dataset into train and test set")
-            # splitting the df into train and test
-            train_df, test_df = train_test_split(df, test_size=self.data_ingestion_config.test_size, random_state=40)
+            # Replace na values with NAN
+            df.replace(to_replace="na", value=np.nan, inplace=True)
 
             
-            logging.info(f"Create Dataset directory if not available")
-            # making dataset folder
-            dataset_dir = os.path.dirname(self.data_ingestion_config.train_file_path)
-            # make new folder if not available
-            os.makedirs(dataset_dir, exist_ok=True)
+            # Values arrive as strings wherever a column held "na", the snapshot stores them as numbers
+            # Values that are not numbers, such as an unlisted partition field, become NaN instead of failing the run,
+            # data validation then drops those columns and records them in its missing values report
+            feature_columns = [column for column in df.columns if column != TARGET_COLUMN]
+            numeric_df = df[feature_columns].apply(pd.to_numeric, errors="coerce")
+            num_coerced = (numeric_df.isna() & df[feature_columns].notna()).sum()
+            num_coerced = num_coerced[num_coerced > 0]
+            if len(num_coerced) > 0:
+                logging.warning(f"Replaced non numeric values with NaN, count per column: {num_coerced.to_dict()}")
+            df[feature_columns] = numeric_df
+
+            logging.info(f"Saving data in feature store")
+            # Single copy of the data, train and test sets only index into it
+            feature_store.write_feature_store(df=df, file_path=self.data_ingestion_config.feature_store_file_path)
 
             
-            logging.info(f"Save train and test set in dataset folder")
-            # Store in dataaset folder
-            train_df.to_csv(path_or_buf=self.data_ingestion_config.train_file_path, index=False, header=True)
-            test_df.to_csv(path_or_buf=self.data_ingestion_config.test_file_path, index=False, header=True)
+            logging.info(f"Split the dataset into train and test row indices")
+            feature_store.create_split(feature_store_file_path=self.data_ingestion_config.feature_store_file_path,
+                                       train_index_path=self.data_ingestion_config.train_index_path,
+                                       test_index_path=self.data_ingestion_config.test_index_path,
+                                       test_size=self.data_ingestion_config.test_size,
+                                       stratify=self.data_ingestion_config.stratify,
+                                       random_state=self.data_ingestion_config.random_state)
 
             
             # Preparing Artifacts
 
             data_ingestion_artifact = artifact_entity.DataIngestionArtifact(
                 feature_store_file_path=self.data_ingestion_config.feature_store_file_path,
-                train_file_path=self.data_ingestion_config.train_file_path,
-                test_file_path=self.data_ingestion_config.test_file_path)
+                train_index_path=self.data_ingestion_config.train_index_path,
+                test_index_path=self.data_ingestion_config.test_index_path)
             
             logging.info(f"Data Ingestion Artifact: {data_ingestion_artifact}")
             return data_ingestion_artifact
@@ -1,14 +1,22 @@
 import pandas as pd
 import numpy as np
 import os, sys
+from concurrent.futures import ThreadPoolExecutor
 from sensor import utils
 from sensor.exception import SensorException
 from sensor.logger import logging
+from sensor.profiler import record_rows
+from sensor.sketch import QuantileSketch, merge_sketches
+from sensor.drift_monitor import build_reference_profile
+from sensor.feature_store import load_split, iter_split_chunks
+from sensor.resources import get_num_threads
 from sensor.entity import config_entity, artifact_entity
 from sensor.config import TARGET_COLUMN
 from sklearn.preprocessing import LabelEncoder
 from sklearn.preprocessing import RobustScaler
 from imblearn.combine import SMOTETomek
+from imblearn.over_sampling import SMOTE
+from sklearn.neighbors import NearestNeighbors
 from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
 
@@ -42,12 +50,145 @@ class DataTransformation:
             raise SensorException(e, sys)
         
 
+    def read_split_chunks(self, index_path:str, columns=None):
+        return iter_split_chunks(feature_store_file_path=self.data_ingestion_artifact.feature_store_file_path,
+                                 index_path=index_path, columns=columns, chunk_size=self.data_transformation_config.chunk_size)
+
+
+    def sketch_chunk(self, chunk_df:pd.DataFrame) -> dict:
+        input_feature_df = chunk_df.drop(TARGET_COLUMN, axis=1).astype("float64")
+        return {
+            "columns": list(input_feature_df.columns),
+            "observed": input_feature_df.notna().any().to_numpy(),
+            "classes": set(chunk_df[TARGET_COLUMN].unique()),
+            # Imputer fills missing values with 0 before the scaler sees them
+            "sketch": QuantileSketch.from_array(input_feature_df.fillna(0).to_numpy(),
+                                                sketch_size=self.data_transformation_config.sketch_size)}
+
+
+    def fit_streaming_transformer(self, index_path:str):
+        """
+        Fit the transformer without loading the whole training split
+        Chunks are sketched in parallel, at most max_workers chunks are held in memory, and the
+        merged sketch gives the median and quartiles RobustScaler would compute on the full data
+        =====================================================================================
+        returns fitted transformer Pipeline and set of target classes
+        """
+        try:
+            max_workers = self.data_transformation_config.max_workers
+            chunk_results, pending = [], []
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for chunk_df in self.read_split_chunks(index_path):
+                    pending.append(executor.submit(self.sketch_chunk, chunk_df))
+                    if len(pending) >= max_workers:
+                        chunk_results.append(pending.pop(0).result())
+                chunk_results.extend(future.result() for future in pending)
+
+            columns = chunk_results[0]["columns"]
+            observed = np.logical_or.reduce([result["observed"] for result in chunk_results])
+            classes = set().union(*[result["classes"] for result in chunk_results])
+            sketch = merge_sketches(result["sketch"] for result in chunk_results)
+            logging.info(f"Sketched {int(sketch.count[0])} training rows in {len(chunk_results)} chunks")
+
+            # Fitting on a single row sets up the imputer columns, including dropping never observed columns,
+            # the scaler statistics are then replaced with the sketch estimates
+            transformation_pipeline = self.get_data_transformer_object()
+            transformation_pipeline.fit(pd.DataFrame([np.where(observed, 0.0, np.nan)], columns=columns))
+
+            imputer = transformation_pipeline.named_steps["Imputer"]
+            kept_columns = np.isin(columns, imputer.get_feature_names_out())
+            q25, q50, q75 = sketch.quantile([0.25, 0.5, 0.75])
+            iqr = q75 - q25
+
+            robust_scalar = transformation_pipeline.named_steps["RobustScalar"]
+            robust_scalar.center_ = q50[kept_columns]
+            robust_scalar.scale_ = np.where(iqr < 10*np.finfo(np.float64).eps, 1.0, iqr)[kept_columns]
+
+            return transformation_pipeline, classes
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def report_streaming_fit(self, index_path:str, transformation_pipeline:Pipeline, columns_per_pass:int = 32):
+        """
+        Compare the sketched scaler statistics with exact ones, the exact statistics are
+        computed a group of columns at a time so the report also stays out of core
+        """
+        try:
+            robust_scalar = transformation_pipeline.named_steps["RobustScalar"]
+            columns = list(transformation_pipeline.named_steps["Imputer"].get_feature_names_out())
+
+            exact_center, exact_scale = [], []
+            for column_start in range(0, len(columns), columns_per_pass):
+                column_group = columns[column_start:column_start+columns_per_pass]
+                group_arr = load_split(feature_store_file_path=self.data_ingestion_artifact.feature_store_file_path,
+                                       index_path=index_path, columns=column_group)[column_group].astype("float64").fillna(0).to_numpy()
+                q25, q50, q75 = np.quantile(group_arr, [0.25, 0.5, 0.75], axis=0)
+                exact_center.append(q50)
+                exact_scale.append(np.where(q75-q25 < 10*np.finfo(np.float64).eps, 1.0, q75-q25))
+            exact_center, exact_scale = np.concatenate(exact_center), np.concatenate(exact_scale)
+
+            # Differences are expressed in units of the exact scale, i.e. as shifts of the scaled output
+            center_error = np.abs(robust_scalar.center_ - exact_center) / exact_scale
+            scale_error = np.abs(robust_scalar.scale_ - exact_scale) / exact_scale
+            report = {
+                "center_error_max": float(center_error.max()), "center_error_mean": float(center_error.mean()),
+                "scale_error_max": float(scale_error.max()), "scale_error_mean": float(scale_error.mean()),
+                "columns": {column: {"center_error": float(center_error[idx]), "scale_error": float(scale_error[idx])}
+                            for idx, column in enumerate(columns)}}
+            logging.info(f"Streaming fit error against exact scaler, center max: {report['center_error_max']}, "
+                         f"scale max: {report['scale_error_max']}")
+            utils.write_yaml_file(file_path=self.data_transformation_config.streaming_fit_report_file_path, data=report)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def transform_split(self, index_path:str, transformation_pipeline:Pipeline, label_encoder:LabelEncoder):
+        """
+        Transform a split chunk by chunk so only the numeric output is kept in memory
+        """
+        try:
+            input_feature_name = list(transformation_pipeline.feature_names_in_)
+            input_arrs, target_arrs = [], []
+            for chunk_df in self.read_split_chunks(index_path):
+                record_rows(len(chunk_df))
+                input_arrs.append(transformation_pipeline.transform(chunk_df[input_feature_name]))
+                target_arrs.append(label_encoder.transform(chunk_df[TARGET_COLUMN]))
+            return np.concatenate(input_arrs), np.concatenate(target_arrs)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
     def initiate_data_transformation(self) -> artifact_entity.DataTransformationArtifact:
         try:
 
+            if self.data_transformation_config.streaming_fit:
+                logging.info("Fitting transformer on streamed training chunks")
+                transformation_pipeline, classes = self.fit_streaming_transformer(self.data_ingestion_artifact.train_index_path)
+                if self.data_transformation_config.streaming_fit_report_exact:
+                    self.report_streaming_fit(self.data_ingestion_artifact.train_index_path, transformation_pipeline)
+
+                label_encoder = LabelEncoder()
+                label_encoder.fit(sorted(classes))
+
+                input_feature_train_arr, target_feature_train_arr = self.transform_split(
+                    self.data_ingestion_artifact.train_index_path, transformation_pipeline, label_encoder)
+                input_feature_test_arr, target_feature_test_arr = self.transform_split(
+                    self.data_ingestion_artifact.test_index_path, transformation_pipeline, label_encoder)
+
+                return self.resample_and_save(transformation_pipeline, label_encoder,
+                                              input_feature_train_arr, target_feature_train_arr,
+                                              input_feature_test_arr, target_feature_test_arr)
+
             # Reading Training and Testing file
-            train_df = pd.read_csv(self.data_ingestion_artifact.train_file_path)
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
+            train_df = load_split(feature_store_file_path=self.data_ingestion_artifact.feature_store_file_path,
+                                  index_path=self.data_ingestion_artifact.train_index_path)
+            test_df = load_split(feature_store_file_path=self.data_ingestion_artifact.feature_store_file_path,
+                                 index_path=self.data_ingestion_artifact.test_index_path)
+            record_rows(len(train_df) + len(test_df))
 
             # Selecting input features for train and test dataset
             input_feature_train_df = train_df.drop(TARGET_COLUMN, axis=1)
@@ -71,7 +212,23 @@ class DataTransformation:
             input_feature_train_arr = transformation_pipeline.transform(input_feature_train_df)
             input_feature_test_arr = transformation_pipeline.transform(input_feature_test_df)
 
-            smt = SMOTETomek(random_state=42)
+            return self.resample_and_save(transformation_pipeline, label_encoder,
+                                          input_feature_train_arr, target_feature_train_arr,
+                                          input_feature_test_arr, target_feature_test_arr)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def resample_and_save(self, transformation_pipeline:Pipeline, label_encoder:LabelEncoder,
+                          input_feature_train_arr, target_feature_train_arr,
+                          input_feature_test_arr, target_feature_test_arr) -> artifact_entity.DataTransformationArtifact:
+        try:
+
+            # Same sampler as the SMOTETomek default with the neighbour searches held to the thread budget
+            n_jobs = get_num_threads()
+            smt = SMOTETomek(random_state=42, n_jobs=n_jobs,
+                             smote=SMOTE(random_state=42, k_neighbors=NearestNeighbors(n_neighbors=6, n_jobs=n_jobs)))
 
             logging.info(f"Before Resampling in Training set, Input: {input_feature_train_arr.shape} Target: {target_feature_train_arr.shape}")
             input_feature_train_arr, target_feature_train_arr = smt.fit_resample(input_feature_train_arr, target_feature_train_arr)
@@ -92,6 +249,13 @@ class DataTransformation:
             #Saving Objects
             utils.save_object(file_path=self.data_transformation_config.transform_object_path, obj=transformation_pipeline)
 
+            reference_columns = list(transformation_pipeline.feature_names_in_)
+            reference_profile = build_reference_profile(read_chunks=lambda: self.read_split_chunks(
+                                                            self.data_ingestion_artifact.train_index_path, columns=reference_columns),
+                                                        columns=reference_columns,
+                                                        sketch_size=self.data_transformation_config.sketch_size)
+            utils.write_yaml_file(file_path=self.data_transformation_config.reference_profile_path, data=reference_profile)
+
             utils.save_object(file_path=self.data_transformation_config.target_encoder_path, obj=label_encoder)
 
 
@@ -99,7 +263,8 @@ class DataTransformation:
                 transform_object_path=self.data_transformation_config.transform_object_path,
                 transformed_train_path=self.data_transformation_config.transformed_train_path,
                 transformed_test_path=self.data_transformation_config.transformed_test_path,
-                target_encoder_path=self.data_transformation_config.target_encoder_path
+                target_encoder_path=self.data_transformation_config.target_encoder_path,
+                reference_profile_path=self.data_transformation_config.reference_profile_path
             )   
 
             logging.info(f"Data Transformstion Artifact: {data_tranformation_artifact}")
@@ -1,11 +1,14 @@
 import pandas as pd
 import numpy as np
 import os, sys
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from sensor.entity import config_entity, artifact_entity
 from sensor.logger import logging
+from sensor.profiler import record_rows
 from sensor.exception import SensorException
 from sensor import utils
+from sensor.feature_store import load_split
 from sensor.config import TARGET_COLUMN
 from scipy.stats import ks_2samp
 
@@ -23,31 +26,44 @@ class DataValidation:
             raise SensorException(e, sys)
         
 
-    def dropped_missing_column_values(self, df:pd.DataFrame, report_key_name:str) -> Optional[pd.DataFrame]:
+    def profile_dataframe(self, df:pd.DataFrame, report_key_name:str) -> Optional[pd.DataFrame]:
         """
         This function will drop column which contains missing value more than specified threshold
+        and convert the remaining sensor columns to float, all from one pass over the values
 
-        df: Accepts a pandas dataframe
-        threshold: Percentage criteria to drop a column
+        df: Accepts a pandas dataframe with missing values as NaN
+        report_key_name: report key of the dropped column names
         =====================================================================================
-        returns Pandas DataFrame if atleast a single column is available after missing columns drop else None
+        returns float Pandas DataFrame if atleast a single column is available after missing columns drop else None
         """
 
         try:
 
             threshold = self.data_validation_config.threshold
-            null_report = df.isnull().sum() / df.shape[0]
+            exclude_columns = [column for column in df.columns if column == TARGET_COLUMN]
+            feature_columns = df.columns.drop(exclude_columns)
+
+            # One float matrix checks that every sensor column converts to float, as astype did column by column,
+            # and one NaN mask over it gives the null ratio of every column
+            values = df[feature_columns].to_numpy(dtype=np.float64)
+            null_report = pd.concat([pd.Series(np.isnan(values).sum(axis=0) / df.shape[0], index=feature_columns),
+                                     df[exclude_columns].isnull().sum() / df.shape[0]]).reindex(df.columns)
 
             logging.info(f"Selecting Column names which contain null values above {threshold}")
-            drop_column_names = null_report[null_report>threshold].index
+            drop_mask = (null_report > threshold).to_numpy()
+            drop_column_names = df.columns[drop_mask]
 
-            logging.info(f"Columns to drop: {list(drop_column_names)}")
+            logging.info("Columns to drop: %s", drop_column_names)
             self.validation_error[report_key_name] = list(drop_column_names)
-            df.drop(list(drop_column_names), axis=1, inplace=True)
 
-            if len(df.columns)==0:
+            if drop_mask.all():
                 return None
-            return df
+            keep_feature_mask = ~drop_mask[df.columns.get_indexer(feature_columns)]
+            profiled_df = pd.DataFrame(values[:, keep_feature_mask], columns=feature_columns[keep_feature_mask], index=df.index)
+            for column in exclude_columns:
+                if column not in drop_column_names:
+                    profiled_df[column] = df[column]
+            return profiled_df[df.columns[~drop_mask]]
         
         except Exception as e:
             raise SensorException(e, sys)
@@ -56,17 +72,10 @@ class DataValidation:
     def do_required_columns_exists(self, base_df:pd.DataFrame, current_df:pd.DataFrame, report_key_name:str)->bool:
         try:
 
-            base_columns = base_df.columns
-            current_columns = current_df.columns
-
-            missing_columns = []
-
-            for base_column in base_columns:
-                if base_column not in current_columns:
-                    logging.info(f"Column: [{base_column} is not available]")
-                    missing_columns.append(base_column)
+            missing_columns = list(base_df.columns[~base_df.columns.isin(current_df.columns)])
 
             if len(missing_columns)>0:
+                logging.info("Columns: %s are not available", missing_columns)
                 self.validation_error[report_key_name] = missing_columns
                 return False
             return True
@@ -75,6 +84,31 @@ class DataValidation:
             raise SensorException(e, sys)
         
 
+    def validate_split(self, base_df:pd.DataFrame, index_path:str, dataset_name:str, drift_report_key_name:str) -> int:
+        """
+        Profile one split of the feature store and detect data drift against base_df when all its columns are present
+        returns number of rows of the split
+        """
+        try:
+            current_df = load_split(feature_store_file_path=self.data_ingestion_artifact.feature_store_file_path,
+                                    index_path=index_path)
+            num_rows = len(current_df)
+
+            logging.info(f"Dropping Null Value columns from {dataset_name}_df")
+            current_df = self.profile_dataframe(df=current_df, report_key_name=f"missing_values_within_{dataset_name}_dataset")
+
+            logging.info(f"Are all required columns present in {dataset_name}_df")
+            if self.do_required_columns_exists(base_df=base_df, current_df=current_df,
+                                               report_key_name=f"missing_columns_within_{dataset_name}_dataset"):
+                logging.info(f"As all columns are available in {dataset_name}_df, hence detecting data_drift")
+                self.data_drift(base_df=base_df, current_df=current_df, report_key_name=drift_report_key_name)
+
+            return num_rows
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
     def data_drift(self, base_df:pd.DataFrame, current_df:pd.DataFrame, report_key_name:str):
         try:
             drift_report = dict()
@@ -85,7 +119,7 @@ class DataValidation:
             for base_column in base_columns:
                 base_data, current_data = base_df[base_column], current_df[base_column]
 
-                logging.info(f"Hypothesis {base_column}: {base_data.dtype}, {current_data.dtype} ")
+                logging.debug("Hypothesis %s: %s, %s", base_column, base_data.dtype, current_data.dtype)
                 same_distribution = ks_2samp(base_data, current_data)
 
                 if same_distribution.pvalue>0.05:
@@ -110,39 +144,20 @@ class DataValidation:
         try:
 
             logging.info(f"Reading base DataFrame")
-            base_df = pd.read_csv(self.data_validation_config.base_file_path)
-
-            logging.info(f"Replace na values in base_df")
-            base_df.replace(to_replace="na", value=np.NAN, inplace=True)
+            # na values are read as NaN, so the sensor columns are parsed as numbers right away
+            base_df = pd.read_csv(self.data_validation_config.base_file_path, na_values="na")
 
             logging.info(f"Drop Null value columns from base_df above threshold")
-            base_df = self.dropped_missing_column_values(df=base_df, report_key_name="missing_values_within_base_dataset")
-
-            logging.info(f"Reading Train and Test DataFrame")
-            train_df = pd.read_csv(self.data_ingestion_artifact.train_file_path)
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
-
-            logging.info(f"Dropping Null Value columns from train_df and test_df")
-            train_df = self.dropped_missing_column_values(df=train_df, report_key_name="missing_values_within_train_dataset")
-            test_df = self.dropped_missing_column_values(df=test_df, report_key_name="missing_values_within_test_dataset")
-
-            exclude_columns = [TARGET_COLUMN]
-
-            base_df = utils.convert_column_float(df=base_df, exclude_columns=exclude_columns)
-            train_df = utils.convert_column_float(df=train_df, exclude_columns=exclude_columns)
-            test_df = utils.convert_column_float(df=test_df, exclude_columns=exclude_columns)
-
-            logging.info(f"Are all required columns present in train_df and test_df")
-            train_df_column_status = self.do_required_columns_exists(base_df=base_df, current_df=train_df, report_key_name="missing_columns_within_train_dataset")
-            test_df_column_status = self.do_required_columns_exists(base_df=base_df, current_df=test_df, report_key_name="missing_columns_within_test_dataset")
-
-            if train_df_column_status:
-                logging.info(f"As all columns are available in train_df, hence detecting data_drift")
-                self.data_drift(base_df=base_df, current_df=train_df, report_key_name="data_drift_within_train_data")
-
-            if test_df_column_status:
-                logging.info(f"As all columns are available in test_df, hence detecting data_drift")
-                self.data_drift(base_df=base_df, current_df=test_df, report_key_name="data_drift_within_test_dataset")
+            base_df = self.profile_dataframe(df=base_df, report_key_name="missing_values_within_base_dataset")
+
+            logging.info(f"Validating train_df and test_df concurrently")
+            # Each split writes its own report keys
+            with ThreadPoolExecutor(max_workers=self.data_validation_config.max_workers) as executor:
+                futures = [executor.submit(self.validate_split, base_df, self.data_ingestion_artifact.train_index_path,
+                                           "train", "data_drift_within_train_data"),
+                           executor.submit(self.validate_split, base_df, self.data_ingestion_artifact.test_index_path,
+                                           "test", "data_drift_within_test_dataset")]
+                record_rows(len(base_df) + sum(future.result() for future in futures))
 
             logging.info(f"Write report in yaml file")
             utils.write_yaml_file(file_path=self.data_validation_config.report_file_path, data=self.validation_error)
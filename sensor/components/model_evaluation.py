@@ -1,13 +1,63 @@
 import pandas as pd
+import numpy as np
 import os, sys
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from sensor.logger import logging
+from sensor.profiler import record_rows
 from sensor.exception import SensorException
 from sensor.config import TARGET_COLUMN
 from sensor.entity import config_entity, artifact_entity
 from sensor.predictor import ModelResolver
-from sensor.utils import load_object
+from sensor.utils import load_object, get_file_hash, read_yaml_file, write_yaml_file, save_numpy_array_data, load_numpy_array_data
+from sensor.feature_store import load_split, get_split_hash
 from sklearn.metrics import f1_score
 
+CHALLENGER_KEY = "challenger"
+SIGNIFICANCE_RULE_POINT = "point"
+SIGNIFICANCE_RULE_NOT_WORSE = "not_worse"
+SIGNIFICANCE_RULE_BETTER = "better"
+SIGNIFICANCE_RULES = [SIGNIFICANCE_RULE_POINT, SIGNIFICANCE_RULE_NOT_WORSE, SIGNIFICANCE_RULE_BETTER]
+
+
+def get_f1_scores(true_positives:np.ndarray, false_positives:np.ndarray, false_negatives:np.ndarray) -> np.ndarray:
+    # Zero where there are no positives at all, as f1_score does
+    denominator = 2*true_positives + false_positives + false_negatives
+    return np.divide(2*true_positives, denominator, out=np.zeros(denominator.shape), where=denominator > 0)
+
+
+def bootstrap_f1_difference(y_true:np.ndarray, challenger_pred:np.ndarray, champion_pred:np.ndarray,
+                            num_resamples:int = 5000, confidence_level:float = 0.95, random_state:int = 42):
+    """
+    Percentile bootstrap interval of challenger F1 minus champion F1 on the same test rows
+    F1 of both models only depends on how many resampled rows fall in each of the 8 combinations
+    of label and the two predictions, so drawing the row counts of those cells from one multinomial
+    resamples the paired prediction vectors exactly, all resamples in a single NumPy call
+    =====================================================================================
+    return: lower and upper bound of the F1 difference
+    """
+    try:
+        cells = 4*np.asarray(y_true, dtype=np.int64) + 2*np.asarray(challenger_pred, dtype=np.int64) + np.asarray(champion_pred, dtype=np.int64)
+        cell_counts = np.bincount(cells, minlength=8)
+        rng = np.random.default_rng(random_state)
+        # (num_resamples, 8) row counts of every cell: index bits are label, challenger and champion prediction
+        resampled = rng.multinomial(len(cells), cell_counts / len(cells), size=num_resamples)
+
+        label, challenger, champion = np.arange(8) >> 2 & 1, np.arange(8) >> 1 & 1, np.arange(8) & 1
+        def f1_scores(pred):
+            return get_f1_scores(true_positives=resampled[:, (label == 1) & (pred == 1)].sum(axis=1),
+                                 false_positives=resampled[:, (label == 0) & (pred == 1)].sum(axis=1),
+                                 false_negatives=resampled[:, (label == 1) & (pred == 0)].sum(axis=1))
+
+        difference = f1_scores(challenger) - f1_scores(champion)
+        alpha = 1 - confidence_level
+        lower, upper = np.quantile(difference, [alpha/2, 1 - alpha/2])
+        return float(lower), float(upper)
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
 class ModelEvaluation:
 
     def __init__(self,
@@ -21,11 +71,96 @@ class ModelEvaluation:
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_transformation_artifact = data_transformation_artifact
             self.model_trainer_artifact = model_trainer_artifact
-            self.model_resolver = ModelResolver()
+            self.model_resolver = ModelResolver(model_registry=self.model_eval_config.model_registry,
+                                                partition=self.model_eval_config.partition)
+            if self.model_eval_config.significance_rule not in SIGNIFICANCE_RULES:
+                raise Exception(f"Unknown significance rule: {self.model_eval_config.significance_rule}, "
+                                f"expected one of {SIGNIFICANCE_RULES}")
 
         except Exception as e:
             raise SensorException(e, sys)
-        
+
+
+    def get_candidates(self, champion_dir_paths:list) -> dict:
+        """
+        Collect object paths of challenger and champion models
+        champion_dir_paths: registry version directories to evaluate
+        =====================================================================================
+        returns dict of candidate name to transformer, model and target encoder paths
+        """
+        try:
+            candidates = {CHALLENGER_KEY: {
+                "transformer_path": self.model_trainer_artifact.transform_object_path or self.data_transformation_artifact.transform_object_path,
+                "model_path": self.model_trainer_artifact.model_path,
+                "target_encoder_path": self.data_transformation_artifact.target_encoder_path}}
+
+            for dir_path in champion_dir_paths:
+                candidates[os.path.basename(dir_path)] = {
+                    "transformer_path": self.model_resolver.get_transformer_path(dir_path),
+                    "model_path": self.model_resolver.get_model_path(dir_path),
+                    "target_encoder_path": self.model_resolver.get_target_encoder_path(dir_path)}
+
+            return candidates
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    @staticmethod
+    def get_model_fingerprint(paths:dict) -> str:
+        """
+        Content hash of a candidate's transformer, model and target encoder, a version number is reused
+        when the registry is recreated and can not identify the model the cached scores belong to
+        """
+        file_hashes = [get_file_hash(paths[key]) for key in ("transformer_path", "model_path", "target_encoder_path")]
+        return hashlib.sha256(":".join(file_hashes).encode()).hexdigest()
+
+
+    def get_prediction_path(self, fingerprint:str, test_file_hash:str) -> str:
+        return os.path.join(self.model_eval_config.prediction_cache_dir, f"{fingerprint[:16]}_{test_file_hash[:16]}.npy")
+
+
+    def score_candidates(self, candidates:dict, test_df:pd.DataFrame):
+        """
+        Score all candidates on the test set in a single pass
+        Transformers with identical content are applied only once and
+        the transformed matrix is shared between the candidates using them
+        =====================================================================================
+        returns dict of candidate name to f1 score and dict of candidate name to test set predictions
+        """
+        try:
+            if len(candidates)==0:
+                return dict(), dict()
+
+            transformer_hashes = {name: get_file_hash(paths["transformer_path"]) for name, paths in candidates.items()}
+            unique_transformer_paths = {transformer_hash: candidates[name]["transformer_path"]
+                                        for name, transformer_hash in transformer_hashes.items()}
+            logging.info(f"Transforming test set with {len(unique_transformer_paths)} unique transformers for {len(candidates)} models")
+
+            def transform(transformer_path):
+                transformer = load_object(file_path=transformer_path)
+                input_feature = list(transformer.feature_names_in_)
+                return transformer.transform(test_df[input_feature])
+
+            def predict(name):
+                paths = candidates[name]
+                model = load_object(file_path=paths["model_path"])
+                target_encoder = load_object(file_path=paths["target_encoder_path"])
+                y_true = target_encoder.transform(test_df[TARGET_COLUMN])
+                y_pred = model.predict(input_arrs[transformer_hashes[name]])
+                logging.info(f"Prediction using {name} model: {target_encoder.inverse_transform(y_pred[:5])}")
+                return f1_score(y_true=y_true, y_pred=y_pred), y_pred
+
+            with ThreadPoolExecutor(max_workers=self.model_eval_config.max_workers) as executor:
+                input_arrs = dict(zip(unique_transformer_paths.keys(),
+                                      executor.map(transform, unique_transformer_paths.values())))
+                results = dict(zip(candidates.keys(), executor.map(predict, candidates.keys())))
+            return ({name: score for name, (score, _) in results.items()},
+                    {name: y_pred for name, (_, y_pred) in results.items()})
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
 
     def initiate_model_evalutaion(self) -> artifact_entity.ModelEvaluationArtifact:
         try:
@@ -38,59 +173,83 @@ class ModelEvaluation:
                 model_eval_artifact = artifact_entity.ModelEvaluationArtifact(is_model_accepted=True,
                                                                               improved_accuracy=None)
                 logging.info(f"Model Evaluation Artifact: {model_eval_artifact}")
-                
+
                 return model_eval_artifact
-            
+
             logging.info("Finding locations of saved transformer, model and target encoder objects")
-            transformer_path = self.model_resolver.get_latest_transformer_path()
-            model_path = self.model_resolver.get_latest_model_path()
-            target_encoder_path = self.model_resolver.get_latest_target_encoder_path()
-
-            logging.info("Previously Trained Objects: Transformer, Model and Target Encoder")
-            transformer = load_object(file_path=transformer_path)
-            model = load_object(file_path=model_path)
-            target_encoder = load_object(file_path=target_encoder_path)
-
-            
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
-            target_df = test_df[TARGET_COLUMN]
-            y_true = target_encoder.transform(target_df)
-
-            # Accuracy using Previous Model
-            input_feature = list(transformer.feature_names_in_)
-            input_arr = transformer.transform(test_df[input_feature])
-            y_pred = model.predict(input_arr)
-            print(f"Prediction using previous model: {target_encoder.inverse_transform(y_pred[:5])}")
-
-            previous_model_accuracy = f1_score(y_true=y_true, y_pred=y_pred)
-            logging.info(f"Accuracy using Previous Model: {previous_model_accuracy}")
+            champion_dir_paths = self.model_resolver.get_dir_paths(num_versions=self.model_eval_config.num_champion_versions)
+            candidates = self.get_candidates(champion_dir_paths=champion_dir_paths)
+            champion_name = os.path.basename(latest_dir_path)
+
+            # Champion scores and predictions do not change for the same test set, so they are cached by
+            # the content fingerprint of the champion's files and the test set hash
+            test_file_hash = get_split_hash(feature_store_file_path=self.data_ingestion_artifact.feature_store_file_path,
+                                            index_path=self.data_ingestion_artifact.test_index_path)
+            fingerprints = {name: self.get_model_fingerprint(paths) for name, paths in candidates.items() if name != CHALLENGER_KEY}
+            score_cache = read_yaml_file(file_path=self.model_eval_config.score_cache_file_path)
+            cached_names = [name for name, fingerprint in fingerprints.items()
+                            if test_file_hash in score_cache.get(fingerprint, dict())
+                            and os.path.exists(self.get_prediction_path(fingerprint, test_file_hash))]
+            scores = {name: score_cache[fingerprints[name]][test_file_hash] for name in cached_names}
+            predictions = {name: load_numpy_array_data(file_path=self.get_prediction_path(fingerprints[name], test_file_hash))
+                           for name in cached_names}
+            logging.info(f"Cached champion scores: {scores}")
+
+            test_df = load_split(feature_store_file_path=self.data_ingestion_artifact.feature_store_file_path,
+                                 index_path=self.data_ingestion_artifact.test_index_path)
+            record_rows(len(test_df))
+            new_scores, new_predictions = self.score_candidates(
+                candidates={name: paths for name, paths in candidates.items() if name not in scores}, test_df=test_df)
+            scores.update(new_scores)
+            predictions.update(new_predictions)
 
-            logging.info("Currently trained model objects")
-            # Currently trained model objects
-            current_transformer = load_object(file_path=self.data_transformation_artifact.transform_object_path)
-            current_model = load_object(file_path=self.model_trainer_artifact.model_path)
-            current_target_encoder = load_object(file_path=self.data_transformation_artifact.target_encoder_path)
+            for name, score in new_scores.items():
+                if name != CHALLENGER_KEY:
+                    score_cache.setdefault(fingerprints[name], dict())[test_file_hash] = float(score)
+                    save_numpy_array_data(file_path=self.get_prediction_path(fingerprints[name], test_file_hash),
+                                          array=new_predictions[name].astype(np.int8))
+            write_yaml_file(file_path=self.model_eval_config.score_cache_file_path, data=score_cache)
 
-            # Accuracy using Current Model
-            input_feature_name = list(current_transformer.feature_names_in_)
-            input_arr_current = current_transformer.transform(test_df[input_feature_name])
-            y_pred_current = current_model.predict(input_arr_current)
-            current_target_encoder.inverse_transform(y_pred_current[:5])
-            print(f"Prediction using previous model: {current_target_encoder.inverse_transform(y_pred_current[:5])}")
+            previous_model_accuracy = scores[champion_name]
+            logging.info(f"Accuracy using Previous Model: {previous_model_accuracy}")
+            logging.info(f"Accuracy using historical models: {scores}")
 
-            current_model_accuracy = f1_score(y_true=y_true, y_pred=y_pred_current)
+            current_model_accuracy = scores[CHALLENGER_KEY]
             logging.info(f"Accuracy using Current Model: {current_model_accuracy}")
 
-            if current_model_accuracy < previous_model_accuracy:
+            significance_rule = self.model_eval_config.significance_rule
+            ci_lower, ci_upper = None, None
+            if significance_rule == SIGNIFICANCE_RULE_POINT:
+                is_worse, is_model_accepted = current_model_accuracy < previous_model_accuracy, True
+            else:
+                y_true = load_object(file_path=candidates[CHALLENGER_KEY]["target_encoder_path"]).transform(test_df[TARGET_COLUMN])
+                ci_lower, ci_upper = bootstrap_f1_difference(y_true=y_true, challenger_pred=predictions[CHALLENGER_KEY],
+                                                             champion_pred=predictions[champion_name],
+                                                             num_resamples=self.model_eval_config.num_bootstrap_resamples,
+                                                             confidence_level=self.model_eval_config.confidence_level)
+                logging.info(f"F1 difference to the previous model: {current_model_accuracy-previous_model_accuracy}, "
+                             f"{self.model_eval_config.confidence_level} bootstrap interval: [{ci_lower}, {ci_upper}]")
+                # An interval containing zero is noise: not worse enough to fail the run, not better enough to push under "better"
+                is_worse = ci_upper < 0
+                is_model_accepted = significance_rule == SIGNIFICANCE_RULE_NOT_WORSE or ci_lower > 0
+
+            if is_worse:
                 logging.info("Current Trained Model does not perform better than Previous Trained Model")
-                raise Exception("Current Trained Model does not perform better than Previous Trained Model")
-            
-            model_eval_artifact = artifact_entity.ModelEvaluationArtifact(is_model_accepted=True,
-                                                                          improved_accuracy=current_model_accuracy-previous_model_accuracy)
-            
+                if self.model_eval_config.fail_on_worse:
+                    raise Exception("Current Trained Model does not perform better than Previous Trained Model")
+                is_model_accepted = False
+
+            if not is_model_accepted:
+                logging.info("Current Trained Model is not significantly better than Previous Trained Model, it will not be pushed")
+
+            model_eval_artifact = artifact_entity.ModelEvaluationArtifact(is_model_accepted=is_model_accepted,
+                                                                          improved_accuracy=current_model_accuracy-previous_model_accuracy,
+                                                                          improved_accuracy_ci_lower=ci_lower,
+                                                                          improved_accuracy_ci_upper=ci_upper)
+
             logging.info(f"Model Evaluation Artifact: {model_eval_artifact}")
-            
+
             return model_eval_artifact
-        
+
         except Exception as e:
-            raise SensorException(e, sys)
\ No newline at end of file
+            raise SensorException(e, sys)
@@ -1,10 +1,10 @@
 import os, sys
 from sensor.exception import SensorException
 from sensor.logger import logging
-from sensor.utils import load_object, save_object
 from sensor.entity.config_entity import ModelPusherConfig
 from sensor.entity.artifact_entity import DataTransformationArtifact, ModelPusherArtifact, ModelTrainerArtifact
 from sensor.predictor import ModelResolver
+from sensor.artifact_store import ArtifactStore, remove_old_artifact_runs
 
 class ModelPusher:
 
@@ -16,43 +16,95 @@ class ModelPusher:
             self.model_pusher_config = model_pusher_config
             self.data_transformation_artifact = data_transformation_artifact
             self.model_trainer_artifact = model_trainer_artifact
-            self.model_resolver = ModelResolver(model_registry=self.model_pusher_config.saved_model_dir)
+            self.model_resolver = ModelResolver(model_registry=self.model_pusher_config.saved_model_dir,
+                                                partition=self.model_pusher_config.partition)
+            self.artifact_store = ArtifactStore(store_dir=self.model_pusher_config.artifact_store_dir)
 
         except Exception as e:
             raise SensorException(e, sys)
-        
+
+
+    def publish_saved_model_dir(self, transformer_digest:str, model_digest:str, target_encoder_digest:str,
+                                required_columns_digest:str = None, reference_profile_digest:str = None) -> str:
+        """
+        Publish the objects as the next version of the saved model directory
+        Retries with the following version number if another pusher created the same version first
+        """
+        try:
+            for _ in range(5):
+                saved_model_dir = self.model_resolver.get_latest_save_dir_path()
+                files = {
+                    os.path.relpath(self.model_resolver.get_transformer_path(saved_model_dir), saved_model_dir): transformer_digest,
+                    os.path.relpath(self.model_resolver.get_model_path(saved_model_dir), saved_model_dir): model_digest,
+                    os.path.relpath(self.model_resolver.get_target_encoder_path(saved_model_dir), saved_model_dir): target_encoder_digest}
+                if required_columns_digest is not None:
+                    files[os.path.relpath(self.model_resolver.get_required_columns_path(saved_model_dir), saved_model_dir)] = required_columns_digest
+                if reference_profile_digest is not None:
+                    files[os.path.relpath(self.model_resolver.get_reference_profile_path(saved_model_dir), saved_model_dir)] = reference_profile_digest
+                try:
+                    self.artifact_store.publish_dir(target_dir=saved_model_dir, files=files)
+                    return saved_model_dir
+                except SensorException:
+                    if not os.path.exists(saved_model_dir):
+                        raise
+                    logging.info(f"Saved model directory {saved_model_dir} already created, retrying with next version")
+
+            raise Exception("Unable to publish saved model directory")
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
 
     def initiate_model_pusher(self) -> ModelPusherArtifact:
         try:
 
-            # Load Objects
-            logging.info("Loading Transformer, Model and Target Encoder objects")
-            transformer = load_object(file_path=self.data_transformation_artifact.transform_object_path)
-            model = load_object(file_path=self.model_trainer_artifact.model_path)
-            target_encoder = load_object(file_path=self.data_transformation_artifact.target_encoder_path)
+            # Store Objects
+            logging.info("Storing Transformer, Model and Target Encoder objects in artifact store")
+            transformer_path = self.model_trainer_artifact.transform_object_path or self.data_transformation_artifact.transform_object_path
+            transformer_digest = self.artifact_store.put(file_path=transformer_path)
+            model_digest = self.artifact_store.put(file_path=self.model_trainer_artifact.model_path)
+            target_encoder_digest = self.artifact_store.put(file_path=self.data_transformation_artifact.target_encoder_path)
+            # Pruned models record the sensor columns they need, so readers can fetch only those
+            required_columns_digest = None
+            if self.model_trainer_artifact.required_columns_path is not None:
+                required_columns_digest = self.artifact_store.put(file_path=self.model_trainer_artifact.required_columns_path)
+            # Scoring compares incoming data against the profile of the data this model was trained on
+            reference_profile_digest = None
+            if self.data_transformation_artifact.reference_profile_path is not None:
+                reference_profile_digest = self.artifact_store.put(file_path=self.data_transformation_artifact.reference_profile_path)
 
-            # Saving objects in Model Pusher Directory
-            logging.info("Saving objects into Model Pusher Directory")
-            save_object(file_path=self.model_pusher_config.pusher_transformer_path, obj=transformer)
-            save_object(file_path=self.model_pusher_config.pusher_model_path, obj=model)
-            save_object(file_path=self.model_pusher_config.pusher_target_encoder_path, obj=target_encoder)
+            # Publishing objects in Model Pusher Directory
+            logging.info("Publishing objects into Model Pusher Directory")
+            self.artifact_store.publish(digest=transformer_digest, target_path=self.model_pusher_config.pusher_transformer_path)
+            self.artifact_store.publish(digest=model_digest, target_path=self.model_pusher_config.pusher_model_path)
+            self.artifact_store.publish(digest=target_encoder_digest, target_path=self.model_pusher_config.pusher_target_encoder_path)
+            if required_columns_digest is not None:
+                self.artifact_store.publish(digest=required_columns_digest, target_path=self.model_pusher_config.pusher_required_columns_path)
+            if reference_profile_digest is not None:
+                self.artifact_store.publish(digest=reference_profile_digest, target_path=self.model_pusher_config.pusher_reference_profile_path)
 
-            # Saving Objects in Saved Model Directory
-            logging.info(f"Saving objects in Saved Model Directory")
-            saved_transformer_path = self.model_resolver.get_latest_save_transformer_path()
-            saved_model_path = self.model_resolver.get_latest_save_model_path()
-            saved_target_encoder_path = self.model_resolver.get_latest_save_target_encoder_path()
+            # Publishing Objects in Saved Model Directory
+            logging.info(f"Publishing objects in Saved Model Directory")
+            saved_model_version_dir = self.publish_saved_model_dir(transformer_digest=transformer_digest,
+                                                                   model_digest=model_digest,
+                                                                   target_encoder_digest=target_encoder_digest,
+                                                                   required_columns_digest=required_columns_digest,
+                                                                   reference_profile_digest=reference_profile_digest)
+            logging.info(f"Published saved model version: {saved_model_version_dir}")
 
-            save_object(file_path=saved_transformer_path, obj=transformer)
-            save_object(file_path=saved_model_path, obj=model)
-            save_object(file_path=saved_target_encoder_path, obj=target_encoder)
+            # Retention
+            logging.info("Removing old artifact runs and unreferenced blobs")
+            remove_old_artifact_runs(artifact_root_dir=self.model_pusher_config.artifact_root_dir,
+                                     num_runs_to_keep=self.model_pusher_config.num_artifact_runs_to_keep)
+            if self.model_pusher_config.collect_garbage:
+                self.artifact_store.collect_garbage()
 
             model_pusher_artifact = ModelPusherArtifact(pusher_model_dir=self.model_pusher_config.pusher_model_dir,
                                                         saved_model_dir=self.model_pusher_config.saved_model_dir)
-            
+
             logging.info(f"Model Pusher Artifact: {model_pusher_artifact}")
 
             return model_pusher_artifact
-        
+
         except Exception as e:
-            raise SensorException(e, sys)
\ No newline at end of file
+            raise SensorException(e, sys)
@@ -1,28 +1,36 @@
 import pandas as pd
 import numpy as np
 import os, sys
+import time
+from typing import Optional
 from sensor.exception import SensorException
 from sensor.logger import logging
+from sensor.profiler import record_rows
+from sensor.resources import get_num_threads
 from sensor.entity import config_entity, artifact_entity
 from sensor import utils
+from sensor.feature_store import load_split
+from sensor.components.data_transformation import DataTransformation
 from sklearn.metrics import f1_score
 from xgboost import XGBClassifier
 
 class ModelTrainer:
 
     def __init__(self, model_trainer_config:config_entity.ModelTrainerConfig,
-                       data_transformation_artifact:artifact_entity.DataTransformationArtifact):
+                       data_transformation_artifact:artifact_entity.DataTransformationArtifact,
+                       data_ingestion_artifact:Optional[artifact_entity.DataIngestionArtifact] = None):
         try:
             logging.info(f"{'>>'*20} Model Trainer {'<<'*20}")
             self.model_trainer_config = model_trainer_config
             self.data_transformation_artifact = data_transformation_artifact
+            self.data_ingestion_artifact = data_ingestion_artifact
         except Exception as e:
             raise SensorException(e, sys)
         
 
     def train_model(self, x, y):
         try:
-            xgb_clf = XGBClassifier()
+            xgb_clf = XGBClassifier(n_estimators=self.model_trainer_config.n_estimators, n_jobs=get_num_threads())
             xgb_clf.fit(x, y)
             return xgb_clf
         
@@ -30,6 +38,98 @@ class ModelTrainer:
             raise SensorException(e, sys)
         
 
+    def get_feature_ranking(self, model:XGBClassifier) -> list:
+        """
+        Rank input feature names by total gain of the trained booster
+        Transformed array columns are mapped back to sensor names through the fitted transformer.
+        Features no tree splits on are missing from the booster's scores, they rank last with zero gain
+        so every transformed feature is ranked
+        =====================================================================================
+        returns list of (column index, feature name) from most to least important
+        """
+        try:
+            transformer = utils.load_object(file_path=self.data_transformation_artifact.transform_object_path)
+            feature_names = list(transformer.get_feature_names_out())
+
+            gain = model.get_booster().get_score(importance_type="gain")
+            logging.info(f"{len(gain)} of {len(feature_names)} features are used by the booster")
+            ranked_idx = sorted(range(len(feature_names)), key=lambda idx: gain.get(f"f{idx}", 0.0), reverse=True)
+            return [(idx, feature_names[idx]) for idx in ranked_idx]
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def evaluate_pruned_model(self, feature_idx:list, x_train, y_train, x_test, y_test) -> dict:
+        try:
+            model = self.train_model(x_train[:, feature_idx], y_train)
+            f1_test_score = f1_score(y_true=y_test, y_pred=model.predict(x_test[:, feature_idx]))
+
+            start_time = time.perf_counter()
+            model.predict(x_test[:, feature_idx])
+            predict_time = time.perf_counter() - start_time
+
+            return {"model": model, "num_features": len(feature_idx), "f1_test_score": float(f1_test_score),
+                    "predict_ms_per_1k_rows": 1000 * predict_time / len(x_test) * 1000}
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def prune_model(self, model:XGBClassifier, f1_test_score:float, x_train, y_train, x_test, y_test) -> dict:
+        """
+        Train a model on the top K features by gain, fit a matching reduced transformer and
+        report the accuracy and latency trade off for several K
+        =====================================================================================
+        returns dict of pruned model artifact paths
+        """
+        try:
+            if self.data_ingestion_artifact is None:
+                raise Exception("Data ingestion artifact is required to fit the reduced transformer")
+
+            num_features = self.model_trainer_config.num_pruned_features
+            feature_ranking = self.get_feature_ranking(model=model)
+
+            start_time = time.perf_counter()
+            model.predict(x_test)
+            pruning_report = {"full": {"num_features": x_test.shape[1], "f1_test_score": float(f1_test_score),
+                                       "predict_ms_per_1k_rows": 1000 * (time.perf_counter()-start_time) / len(x_test) * 1000}}
+
+            pruned_results = dict()
+            for k in sorted(set([*self.model_trainer_config.pruning_report_num_features, num_features])):
+                if k >= x_test.shape[1]:
+                    continue
+                feature_idx = [idx for idx, _ in feature_ranking[:k]]
+                pruned_results[k] = self.evaluate_pruned_model(feature_idx, x_train, y_train, x_test, y_test)
+                pruning_report[f"top_{k}"] = {key: value for key, value in pruned_results[k].items() if key != "model"}
+                logging.info(f"Pruned model with top {k} features: {pruning_report[f'top_{k}']}")
+
+            utils.write_yaml_file(file_path=self.model_trainer_config.pruning_report_file_path, data=pruning_report)
+
+            if num_features not in pruned_results:
+                raise Exception(f"Pruned model needs fewer than {x_test.shape[1]} features, got: {num_features}")
+
+            # Imputer and scaler work column by column, so refitting them on the selected
+            # training columns reproduces the full transformer output for those columns
+            required_columns = [name for _, name in feature_ranking[:num_features]]
+            train_df = load_split(feature_store_file_path=self.data_ingestion_artifact.feature_store_file_path,
+                                  index_path=self.data_ingestion_artifact.train_index_path, columns=required_columns)
+            reduced_transformer = DataTransformation.get_data_transformer_object()
+            reduced_transformer.fit(train_df[required_columns])
+
+            utils.save_object(file_path=self.model_trainer_config.pruned_model_path, obj=pruned_results[num_features]["model"])
+            utils.save_object(file_path=self.model_trainer_config.pruned_transformer_path, obj=reduced_transformer)
+            utils.write_yaml_file(file_path=self.model_trainer_config.required_columns_path, data=required_columns)
+
+            return {"model_path": self.model_trainer_config.pruned_model_path,
+                    "transform_object_path": self.model_trainer_config.pruned_transformer_path,
+                    "required_columns_path": self.model_trainer_config.required_columns_path,
+                    "f1_test_score": pruned_results[num_features]["f1_test_score"]}
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
     def initiate_model_trainer(self) -> artifact_entity.ModelTrainerArtifact:
         try:
 
@@ -40,6 +140,7 @@ class ModelTrainer:
             logging.info(f"Splitting input and target feature from both Train and Test array")
             x_train, y_train = train_df[:, :-1], train_df[:, -1]
             x_test, y_test = test_df[:, :-1], test_df[:, -1]
+            record_rows(len(x_train) + len(x_test))
 
             logging.info(f"Train Model")
             model = self.train_model(x_train, y_train)
@@ -69,12 +170,28 @@ class ModelTrainer:
             logging.info(f"Saving Model Object")
             utils.save_object(file_path=self.model_trainer_config.model_path, obj=model)
 
+            pruned_model = dict()
+            if self.model_trainer_config.num_pruned_features is not None:
+                logging.info(f"Pruning model to top {self.model_trainer_config.num_pruned_features} features by gain")
+                pruned_model = self.prune_model(model, f1_test_score, x_train, y_train, x_test, y_test)
+
             logging.info(f"Preparing Artifact")
-            model_trainer_artifact = artifact_entity.ModelTrainerArtifact(
-                model_path=self.model_trainer_config.model_path,
-                f1_train_score=f1_train_score,
-                f1_test_sccore=f1_test_score
-            )
+            if self.model_trainer_config.push_pruned_model and len(pruned_model) > 0:
+                model_trainer_artifact = artifact_entity.ModelTrainerArtifact(
+                    model_path=pruned_model["model_path"],
+                    f1_train_score=f1_train_score,
+                    f1_test_sccore=pruned_model["f1_test_score"],
+                    transform_object_path=pruned_model["transform_object_path"],
+                    required_columns_path=pruned_model["required_columns_path"],
+                    pruning_report_file_path=self.model_trainer_config.pruning_report_file_path
+                )
+            else:
+                model_trainer_artifact = artifact_entity.ModelTrainerArtifact(
+                    model_path=self.model_trainer_config.model_path,
+                    f1_train_score=f1_train_score,
+                    f1_test_sccore=f1_test_score,
+                    pruning_report_file_path=self.model_trainer_config.pruning_report_file_path if len(pruned_model) > 0 else None
+                )
 
             logging.info(f"Model Trainer Artifact: {model_trainer_artifact}")
             return model_trainer_artifact
@@ -10,5 +10,14 @@ class EnvironmentVariable:
 
 
 env_var = EnvironmentVariable()
-mongo_client = pymongo.MongoClient(env_var.mongo_db_url)
-TARGET_COLUMN = "class"
\ No newline at end of file
+TARGET_COLUMN = "class"
+
+
+def __getattr__(name:str):
+    # The client is created on first use, so processes that never query MongoDB, such as the
+    # scoring supervisor forking workers, do not run its monitor threads
+    if name == "mongo_client":
+        global mongo_client
+        mongo_client = pymongo.MongoClient(env_var.mongo_db_url)
+        return mongo_client
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,266 @@
+import os, sys
+import threading
+from datetime import datetime
+from typing import Optional, List, Callable, Iterable
+import numpy as np
+import pandas as pd
+from sensor import utils
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.sketch import QuantileSketch, merge_sketches
+
+DRIFT_DIR = os.path.join("prediction", "drift")
+DRIFT_STATE_FILE_NAME = "state.npz"
+RETRAIN_SIGNAL_FILE_NAME = "retrain_signal.yaml"
+NUM_REFERENCE_BINS = 10
+SUMMARY_INTERVAL_ROWS = 100_000
+PSI_THRESHOLD = 0.2
+NULL_RATIO_THRESHOLD = 0.1
+RETRAIN_DRIFT_FRACTION = 0.3
+
+
+def count_bins(arr:np.ndarray, edges:List[np.ndarray]) -> np.ndarray:
+    """
+    Histogram every column of arr on its own bin edges with a single bincount
+    arr: 2d float array, NaN values are not counted
+    edges: inner bin edges per column, a column with k edges has k+1 bins
+    =====================================================================================
+    return: flat count array, bins of column i start at sum of earlier columns' bins
+    """
+    try:
+        num_bins = np.array([len(column_edges)+1 for column_edges in edges])
+        offsets = np.concatenate([[0], np.cumsum(num_bins)[:-1]])
+        bin_idx = np.empty(arr.shape, dtype=np.int64)
+        for column_idx, column_edges in enumerate(edges):
+            bin_idx[:, column_idx] = offsets[column_idx] + np.searchsorted(column_edges, arr[:, column_idx], side="right")
+        observed = ~np.isnan(arr)
+        return np.bincount(bin_idx[observed], minlength=int(num_bins.sum())).astype(np.float64)
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def split_counts(counts:np.ndarray, edges:List[np.ndarray]) -> List[np.ndarray]:
+    return np.split(counts, np.cumsum([len(column_edges)+1 for column_edges in edges])[:-1])
+
+
+def population_stability_index(expected:np.ndarray, actual:np.ndarray, eps:float = 1e-4) -> float:
+    expected = np.clip(expected, eps, None)
+    actual = np.clip(actual, eps, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def build_reference_profile(read_chunks:Callable[[], Iterable[pd.DataFrame]], columns:List[str],
+                            num_bins:int = NUM_REFERENCE_BINS, sketch_size:int = 1000) -> dict:
+    """
+    Profile the training data the model was fitted on, chunk by chunk
+    First pass sketches quantiles to place num_bins equal frequency bins per column,
+    second pass counts rows per bin so the expected frequencies are exact for those edges
+    read_chunks: returns a fresh iterator over the training DataFrame chunks, called once per pass
+    =====================================================================================
+    return: dict with num_rows and per column edges, expected bin frequencies and null_ratio
+    """
+    try:
+        sketches = [QuantileSketch.from_array(chunk_df[columns].astype("float64").to_numpy(), sketch_size=sketch_size)
+                    for chunk_df in read_chunks()]
+        sketch = merge_sketches(sketches)
+
+        probs = np.arange(1, num_bins) / num_bins
+        quantiles = sketch.quantile(probs)
+        edges = [np.unique(quantiles[:, column_idx][~np.isnan(quantiles[:, column_idx])]) for column_idx in range(len(columns))]
+
+        counts = np.zeros(sum(len(column_edges)+1 for column_edges in edges))
+        null_counts = np.zeros(len(columns))
+        num_rows = 0
+        for chunk_df in read_chunks():
+            arr = chunk_df[columns].astype("float64").to_numpy()
+            counts += count_bins(arr, edges)
+            null_counts += np.isnan(arr).sum(axis=0)
+            num_rows += len(arr)
+
+        profile_columns = dict()
+        for column, column_edges, column_counts, null_count in zip(columns, edges, split_counts(counts, edges), null_counts):
+            num_observed = column_counts.sum()
+            profile_columns[column] = {
+                "edges": column_edges.tolist(),
+                "expected": (column_counts / num_observed).tolist() if num_observed > 0 else [],
+                "null_ratio": float(null_count / num_rows) if num_rows > 0 else 0.0}
+
+        logging.info(f"Reference profile built from {num_rows} rows and {len(columns)} columns")
+        return {"num_rows": num_rows, "num_bins": num_bins, "columns": profile_columns}
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+class DriftMonitor:
+    """
+    Online drift check of scored batches against the reference profile of the scoring model version
+    Every batch only adds bin counts to a running window, so batches, threads and runs merge by addition.
+    Once summary_interval_rows rows are counted a summary is written and the window restarts.
+    A retrain signal is raised when at least retrain_drift_fraction of the columns drifted
+    """
+
+    def __init__(self, drift_dir:str = DRIFT_DIR, summary_interval_rows:int = SUMMARY_INTERVAL_ROWS,
+                 psi_threshold:float = PSI_THRESHOLD, null_ratio_threshold:float = NULL_RATIO_THRESHOLD,
+                 retrain_drift_fraction:float = RETRAIN_DRIFT_FRACTION):
+        try:
+            self.drift_dir = drift_dir
+            os.makedirs(self.drift_dir, exist_ok=True)
+            self.state_file_path = os.path.join(self.drift_dir, DRIFT_STATE_FILE_NAME)
+            self.retrain_signal_file_path = os.path.join(self.drift_dir, RETRAIN_SIGNAL_FILE_NAME)
+            self.summary_interval_rows = summary_interval_rows
+            self.psi_threshold = psi_threshold
+            self.null_ratio_threshold = null_ratio_threshold
+            self.retrain_drift_fraction = retrain_drift_fraction
+            self.lock = threading.Lock()
+
+            self.model_fingerprint = None
+            self.model_version = None
+            self.reference_profile = None
+            self.columns = []
+            self.edges = []
+            self.counts = np.zeros(0)
+            self.null_counts = np.zeros(0)
+            self.num_rows = 0
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def _reset(self, sensor_model):
+        self.model_fingerprint = sensor_model.fingerprint
+        self.model_version = sensor_model.version
+        self.reference_profile = sensor_model.reference_profile
+        reference_columns = self.reference_profile["columns"] if self.reference_profile is not None else dict()
+        # Pruned models are fed only their own columns, so the check follows the model inputs
+        self.columns = [column for column in sensor_model.input_feature_name if column in reference_columns]
+        self.edges = [np.asarray(reference_columns[column]["edges"], dtype=np.float64) for column in self.columns]
+        self.counts = np.zeros(sum(len(column_edges)+1 for column_edges in self.edges))
+        self.null_counts = np.zeros(len(self.columns))
+        self.num_rows = 0
+
+        # Counts of an earlier run with the same model continue the window
+        if os.path.exists(self.state_file_path):
+            with np.load(self.state_file_path, allow_pickle=False) as state:
+                if str(state["model_fingerprint"]) == self.model_fingerprint and len(state["counts"]) == len(self.counts):
+                    self.counts = state["counts"]
+                    self.null_counts = state["null_counts"]
+                    self.num_rows = int(state["num_rows"])
+
+
+    def update(self, sensor_model, df:pd.DataFrame) -> Optional[dict]:
+        """
+        Add one scored batch to the window
+        sensor_model: SensorModel which scored df
+        df: raw input rows of the batch
+        =====================================================================================
+        return: drift summary if this batch completed a window else None
+        """
+        try:
+            with self.lock:
+                if sensor_model.fingerprint != self.model_fingerprint:
+                    if self.num_rows > 0:
+                        self._summarize()
+                    self._reset(sensor_model)
+                    if self.reference_profile is None:
+                        logging.info(f"Model version {sensor_model.version} has no reference profile, drift is not monitored")
+                columns, edges = self.columns, self.edges
+
+            if self.reference_profile is None or len(df) == 0:
+                return None
+
+            # Counting runs outside the lock, only the additions are serialised
+            arr = df[columns].replace(to_replace="na", value=np.nan).astype("float64").to_numpy()
+            counts = count_bins(arr, edges)
+            null_counts = np.isnan(arr).sum(axis=0)
+
+            with self.lock:
+                if sensor_model.fingerprint != self.model_fingerprint:
+                    return None
+                self.counts += counts
+                self.null_counts += null_counts
+                self.num_rows += len(arr)
+                if self.num_rows >= self.summary_interval_rows:
+                    return self._summarize()
+            return None
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def _summarize(self) -> dict:
+        reference_columns = self.reference_profile["columns"]
+        column_report = dict()
+        drifted_columns = []
+        for column, column_counts, null_count in zip(self.columns, split_counts(self.counts, self.edges), self.null_counts):
+            reference = reference_columns[column]
+            null_ratio = float(null_count / self.num_rows)
+            report = {"null_ratio": null_ratio, "reference_null_ratio": reference["null_ratio"]}
+            num_observed = column_counts.sum()
+            if num_observed > 0 and len(reference["expected"]) > 0:
+                report["psi"] = population_stability_index(np.asarray(reference["expected"]), column_counts / num_observed)
+
+            report["drift"] = bool(report.get("psi", 0.0) > self.psi_threshold or
+                                   abs(null_ratio - reference["null_ratio"]) > self.null_ratio_threshold)
+            if report["drift"]:
+                drifted_columns.append(column)
+            column_report[column] = report
+
+        drift_fraction = len(drifted_columns) / len(self.columns) if len(self.columns) > 0 else 0.0
+        timestamp = datetime.now()
+        summary = {
+            "timestamp": timestamp.isoformat(),
+            "model_version": self.model_version,
+            "num_rows": self.num_rows,
+            "drift_fraction": drift_fraction,
+            "drifted_columns": drifted_columns,
+            "retrain": drift_fraction >= self.retrain_drift_fraction,
+            "columns": column_report}
+
+        summary_file_path = os.path.join(self.drift_dir, f"drift_summary_{timestamp.strftime('%m%d%Y__%H%M%S_%f')}.yaml")
+        utils.write_yaml_file(file_path=summary_file_path, data=summary)
+        logging.info(f"Drift summary of {self.num_rows} rows, drifted columns: {len(drifted_columns)}/{len(self.columns)}, "
+                     f"file: {summary_file_path}")
+        if summary["retrain"]:
+            logging.warning(f"Retrain signalled for model version {self.model_version}, drift fraction: {drift_fraction}")
+            utils.write_yaml_file(file_path=self.retrain_signal_file_path,
+                                  data={key: summary[key] for key in ("timestamp", "model_version", "num_rows",
+                                                                      "drift_fraction", "drifted_columns")}
+                                       | {"summary_file_path": summary_file_path})
+
+        self.counts = np.zeros_like(self.counts)
+        self.null_counts = np.zeros_like(self.null_counts)
+        self.num_rows = 0
+        return summary
+
+
+    def save_state(self):
+        """
+        Persist the open window so the next batch run with the same model continues it
+        """
+        try:
+            with self.lock:
+                if self.model_fingerprint is None or self.reference_profile is None:
+                    return
+                tmp_file_path = f"{self.state_file_path}.tmp.npz"
+                np.savez(tmp_file_path, model_fingerprint=self.model_fingerprint, counts=self.counts,
+                         null_counts=self.null_counts, num_rows=self.num_rows)
+                os.replace(tmp_file_path, self.state_file_path)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def flush(self) -> Optional[dict]:
+        """
+        Write a summary of the open window regardless of its size
+        """
+        try:
+            with self.lock:
+                if self.reference_profile is None or self.num_rows == 0:
+                    return None
+                return self._summarize()
+
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -1,11 +1,12 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
 class DataIngestionArtifact:
     feature_store_file_path:str
-    train_file_path:str
-    test_file_path:str
+    train_index_path:str
+    test_index_path:str
 
 
 @dataclass
@@ -19,6 +20,7 @@ class DataTransformationArtifact:
     transformed_train_path:str
     transformed_test_path:str
     target_encoder_path:str
+    reference_profile_path:Optional[str] = None
 
 
 @dataclass
@@ -26,12 +28,19 @@ class ModelTrainerArtifact:
     model_path:str
     f1_train_score:float
     f1_test_sccore:float
+    # Set when the model needs its own transformer instead of the one from data transformation
+    transform_object_path:Optional[str] = None
+    required_columns_path:Optional[str] = None
+    pruning_report_file_path:Optional[str] = None
 
 
 @dataclass
 class ModelEvaluationArtifact:
     is_model_accepted:bool
     improved_accuracy:float
+    # Bootstrap interval of improved_accuracy, None for the first model and the point rule
+    improved_accuracy_ci_lower:Optional[float] = None
+    improved_accuracy_ci_upper:Optional[float] = None
 
 
 @dataclass    
@@ -1,21 +1,62 @@
 import os, sys
+import re
+import hashlib
+from typing import Optional
 from sensor.exception import SensorException
 from datetime import datetime
 
 
-FILE_NAME = "sensor.csv"
+FILE_NAME = "sensor.parquet"
 TRAIN_FILE_NAME = "train.csv"
 TEST_FILE_NAME = "test.csv"
+TRAIN_INDEX_FILE_NAME = "train_index.npy"
+TEST_INDEX_FILE_NAME = "test_index.npy"
 TRANSFORMER_OBJECT_FILE_NAME = "transformer.pkl"
 TARGET_ENCODER_OBJECT_FILE_NAME = "target_encoder.pkl"
 MODEL_FILE_NAME = "model.pkl"
+REQUIRED_COLUMNS_FILE_NAME = "required_columns.yaml"
+REFERENCE_PROFILE_FILE_NAME = "reference_profile.yaml"
+PARTITION_DIR_NAME = "partitions"
+SMOKE_DIR_NAME = "smoke"
+
+
+def get_partition_dir_name(partition) -> str:
+    """
+    Directory name of a partition value, characters unsafe in paths are replaced
+    A short hash of the raw value keeps values which only differ in replaced characters,
+    such as "B/1" and "B_1", in separate directories
+    """
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", str(partition))
+    return f"{safe_name}-{hashlib.sha256(str(partition).encode()).hexdigest()[:8]}"
 
 
 class TrainingPipelineConfig:
 
-    def __init__(self):
+    def __init__(self, partition_key:Optional[str] = None, partition = None, artifact_dir:Optional[str] = None,
+                 smoke:bool = False):
         try:
-            self.artifact_dir = os.path.join(os.getcwd(), "artifacts", f"{datetime.now().strftime('%m%d%Y__%H%M%S')}")
+            # A smoke run checks that every stage works end to end in seconds: a stratified sample of the
+            # collection and few boosting rounds, with artifacts, registry and caches under smoke/
+            # so it never touches saved_models
+            self.smoke = smoke
+            self.namespace_dir = SMOKE_DIR_NAME if self.smoke else ""
+            self.model_registry = os.path.join(self.namespace_dir, "saved_models")
+            self.smoke_sample_size = 2000
+            self.smoke_n_estimators = 10
+            # A partition run trains on the documents where partition_key equals partition,
+            # its artifacts and registry live in their own namespace
+            self.partition_key = partition_key
+            self.partition = partition
+            artifact_root_dir = os.path.join(os.getcwd(), "artifacts", self.namespace_dir)
+            if self.partition is not None:
+                artifact_root_dir = os.path.join(artifact_root_dir, PARTITION_DIR_NAME, get_partition_dir_name(self.partition))
+            self.artifact_dir = os.path.join(artifact_root_dir, f"{datetime.now().strftime('%m%d%Y__%H%M%S')}")
+            # Schedulers running one stage per task pass the directory of the run they belong to
+            if artifact_dir is not None:
+                self.artifact_dir = artifact_dir
+            self.profile_file_path = os.path.join(self.artifact_dir, "run_profile.yaml")
+            self.cprofile_dir = os.path.join(self.artifact_dir, "cprofile")
+            self.enable_cprofile = False
         except Exception as e:
             raise SensorException(e, sys)
 
@@ -28,9 +69,27 @@ class DataIngestionConfig:
             self.collection_name = "sensor"
             self.data_ingestion_dir = os.path.join(training_pipeline_config.artifact_dir, "data_ingestion")
             self.feature_store_file_path = os.path.join(self.data_ingestion_dir, "feature_store", FILE_NAME)
-            self.train_file_path = os.path.join(self.data_ingestion_dir, "dataset", TRAIN_FILE_NAME)
-            self.test_file_path = os.path.join(self.data_ingestion_dir, "dataset", TEST_FILE_NAME)
+            # Splits are row positions in the feature store snapshot, not copies of the data
+            self.train_index_path = os.path.join(self.data_ingestion_dir, "dataset", TRAIN_INDEX_FILE_NAME)
+            self.test_index_path = os.path.join(self.data_ingestion_dir, "dataset", TEST_INDEX_FILE_NAME)
             self.test_size = 0.2
+            # Keeps the share of the rare positive class equal in train and test
+            self.stratify = True
+            self.random_state = 40
+            # Rows drawn from the collection keeping the class shares, None fetches every row
+            self.sample_size = training_pipeline_config.smoke_sample_size if training_pipeline_config.smoke else None
+            # Columns fetched from the collection, None fetches every column
+            self.columns = None
+            # Fetch only the columns recorded by the latest registry version when it is a pruned model.
+            # Off by default, a run reading those columns alone can not rank or retrain on the others
+            self.use_required_columns = False
+            self.model_registry = training_pipeline_config.model_registry
+            self.partition = training_pipeline_config.partition
+            # Filter selecting the documents of a partition run, None fetches every document
+            self.query = None
+            self.partition_key = training_pipeline_config.partition_key
+            if training_pipeline_config.partition is not None:
+                self.query = {self.partition_key: training_pipeline_config.partition}
         except Exception as e:
             raise SensorException(e, sys)
         
@@ -49,6 +108,8 @@ class DataValidationConfig:
             self.report_file_path = os.path.join(self.data_validation_dir, "report.yaml")
             self.threshold = 0.2
             self.base_file_path = os.path.join("aps_failure_training_set1.csv")
+            # Train and test splits are validated concurrently
+            self.max_workers = 2
 
         except Exception as e:
             raise SensorException(e, sys)
@@ -63,6 +124,15 @@ class DataTransformationConfig:
             self.transformed_train_path = os.path.join(self.data_transformation_dir, "transformed", TRAIN_FILE_NAME.replace("csv", "npz"))
             self.transformed_test_path = os.path.join(self.data_transformation_dir, "transformed", TEST_FILE_NAME.replace("csv", "npz"))
             self.target_encoder_path = os.path.join(self.data_transformation_dir, "target_encoder", TARGET_ENCODER_OBJECT_FILE_NAME)
+            # Fit the transformer chunk by chunk with quantile sketches instead of on the full training frame
+            self.streaming_fit = False
+            self.chunk_size = 100_000
+            self.sketch_size = 1000
+            self.max_workers = 4
+            self.streaming_fit_report_exact = True
+            self.streaming_fit_report_file_path = os.path.join(self.data_transformation_dir, "streaming_fit_report.yaml")
+            # Training data profile which inference time drift is measured against
+            self.reference_profile_path = os.path.join(self.data_transformation_dir, "reference_profile", REFERENCE_PROFILE_FILE_NAME)
 
         except Exception as e:
             raise SensorException(e, sys)
@@ -76,6 +146,21 @@ class ModelTrainerConfig:
             self.model_path = os.path.join(self.model_trainer_dir, "model", MODEL_FILE_NAME)
             self.expected_score = 0.7
             self.overfitting_threshold = 0.1
+            # Boosting rounds, None keeps the XGBoost default
+            self.n_estimators = None
+            if training_pipeline_config.smoke:
+                # Scores of a few rounds on a sample say nothing about the model, only that training ran
+                self.n_estimators = training_pipeline_config.smoke_n_estimators
+                self.expected_score = 0.0
+                self.overfitting_threshold = 1.0
+            # Top K features by gain kept in the pruned model, None disables pruning
+            self.num_pruned_features = None
+            self.pruning_report_num_features = [10, 20, 40, 80]
+            self.push_pruned_model = False
+            self.pruned_model_path = os.path.join(self.model_trainer_dir, "pruned_model", MODEL_FILE_NAME)
+            self.pruned_transformer_path = os.path.join(self.model_trainer_dir, "pruned_model", TRANSFORMER_OBJECT_FILE_NAME)
+            self.required_columns_path = os.path.join(self.model_trainer_dir, "pruned_model", REQUIRED_COLUMNS_FILE_NAME)
+            self.pruning_report_file_path = os.path.join(self.model_trainer_dir, "pruning_report.yaml")
         
         except Exception as e:
             raise SensorException(e, sys)
@@ -86,6 +171,26 @@ class ModelEvaluationConfig:
     def __init__(self, training_pipeline_config:TrainingPipelineConfig):
         try:
             self.change_threshold = 0.01
+            self.partition = training_pipeline_config.partition
+            self.model_registry = training_pipeline_config.model_registry
+            model_evaluation_dir = os.path.join(training_pipeline_config.namespace_dir, "model_evaluation")
+            self.score_cache_file_path = os.path.join(model_evaluation_dir, "score_cache.yaml")
+            if self.partition is not None:
+                self.score_cache_file_path = os.path.join(model_evaluation_dir, PARTITION_DIR_NAME,
+                                                          get_partition_dir_name(self.partition), "score_cache.yaml")
+            self.num_champion_versions = 1
+            self.max_workers = 2
+            # Test set predictions of champions, the bootstrap needs them when their scores are cached
+            self.prediction_cache_dir = os.path.join(os.path.dirname(self.score_cache_file_path), "predictions")
+            # Promotion rule on challenger minus champion F1, point: promote unless the point difference
+            # is negative, not_worse: promote unless the bootstrap interval lies below zero,
+            # better: promote only when the bootstrap interval lies above zero.
+            # point keeps the promotion behaviour of deployments predating the bootstrap
+            self.significance_rule = "point"
+            self.num_bootstrap_resamples = 5000
+            self.confidence_level = 0.95
+            # A worse challenger fails the run, a smoke run only skips the push since its scores are noise
+            self.fail_on_worse = not training_pipeline_config.smoke
         
         except Exception as e:
             raise SensorException(e, sys)
@@ -96,11 +201,19 @@ class ModelPusherConfig:
     def __init__(self, training_pipeline_config:TrainingPipelineConfig):
         try:
             self.model_pusher_dir = os.path.join(training_pipeline_config.artifact_dir, "model_pusher")
-            self.saved_model_dir = os.path.join("saved_models")
+            self.saved_model_dir = training_pipeline_config.model_registry
+            self.partition = training_pipeline_config.partition
             self.pusher_model_dir = os.path.join(self.model_pusher_dir, "saved_models")
             self.pusher_model_path = os.path.join(self.pusher_model_dir, MODEL_FILE_NAME)
             self.pusher_transformer_path = os.path.join(self.pusher_model_dir, TRANSFORMER_OBJECT_FILE_NAME)
             self.pusher_target_encoder_path = os.path.join(self.pusher_model_dir, TARGET_ENCODER_OBJECT_FILE_NAME)
+            self.pusher_required_columns_path = os.path.join(self.pusher_model_dir, REQUIRED_COLUMNS_FILE_NAME)
+            self.pusher_reference_profile_path = os.path.join(self.pusher_model_dir, REFERENCE_PROFILE_FILE_NAME)
+            self.artifact_store_dir = os.path.join(training_pipeline_config.namespace_dir, "artifact_store")
+            self.artifact_root_dir = os.path.dirname(training_pipeline_config.artifact_dir)
+            self.num_artifact_runs_to_keep = 5
+            # Partition runs share the store, the partitioned training runner collects garbage once all are pushed
+            self.collect_garbage = self.partition is None
 
         except Exception as e:
             raise SensorException(e, sys)
\ No newline at end of file
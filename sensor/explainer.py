@@ -0,0 +1,101 @@
+import sys
+from typing import Optional
+import numpy as np
+import pandas as pd
+import xgboost
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.prediction_cache import PredictionCache, InMemoryPredictionCache, hash_feature_rows
+
+EXPLAIN_TOP_N = 5
+NEAR_THRESHOLD = 0.1
+DECISION_THRESHOLD = 0.5
+
+
+class PredictionExplainer:
+    """
+    Per sensor contributions of XGBoost (pred_contribs) for the rows maintenance asks about
+    Only rows predicted positive or with a positive class probability within near_threshold of the
+    decision threshold are explained, all of them in one booster call, so the cost follows the
+    number of alerts rather than the number of scored rows. Contributions are cached by row hash
+    and model version, a truck reporting the same readings again is not explained twice.
+    """
+
+    def __init__(self, top_n:int = EXPLAIN_TOP_N, near_threshold:float = NEAR_THRESHOLD,
+                 cache:Optional[PredictionCache] = None):
+        try:
+            self.top_n = top_n
+            self.near_threshold = near_threshold
+            self.cache = cache if cache is not None else InMemoryPredictionCache(max_size=100_000)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def select_rows(self, proba:np.ndarray) -> np.ndarray:
+        # The target encoder sorts classes, so pos is the second column
+        positive_proba = proba[:, 1]
+        return np.flatnonzero((positive_proba > DECISION_THRESHOLD) |
+                              (np.abs(positive_proba - DECISION_THRESHOLD) <= self.near_threshold))
+
+
+    def get_contributions(self, sensor_model, input_df:pd.DataFrame) -> np.ndarray:
+        """
+        Contributions of every transformed feature and the bias, identical rows are computed once
+        return: float64 array of shape (rows, transformed features + 1)
+        """
+        try:
+            row_hashes = hash_feature_rows(input_df)
+            hit_mask, hit_contributions = self.cache.lookup(version=sensor_model.fingerprint, row_hashes=row_hashes)
+
+            contributions = np.empty((len(input_df), len(sensor_model.transformed_feature_name) + 1))
+            if hit_mask.any():
+                contributions[hit_mask] = hit_contributions
+
+            miss_idx = np.flatnonzero(~hit_mask)
+            if len(miss_idx) > 0:
+                unique_hashes, first_idx, inverse = np.unique(row_hashes[miss_idx], return_index=True, return_inverse=True)
+                transformed_arr = sensor_model.transformer.transform(input_df.iloc[miss_idx[first_idx]])
+                unique_contributions = sensor_model.xgb_model.get_booster().predict(
+                    xgboost.DMatrix(transformed_arr, nthread=sensor_model.xgb_model.n_jobs), pred_contribs=True).astype(np.float64)
+                contributions[miss_idx] = unique_contributions[inverse.reshape(-1)]
+                self.cache.store(version=sensor_model.fingerprint, row_hashes=unique_hashes, probas=unique_contributions)
+
+            return contributions
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def explain(self, sensor_model, input_df:pd.DataFrame, proba:np.ndarray) -> pd.DataFrame:
+        """
+        Top top_n sensors pushing each selected row towards the positive class
+        input_df: model input columns with missing values converted to NaN
+        proba: class probabilities of input_df rows
+        =====================================================================================
+        returns Pandas DataFrame aligned to input_df index, rows not selected are left empty
+        """
+        try:
+            row_idx = self.select_rows(proba)
+            logging.info(f"Explaining {len(row_idx)} of {len(input_df)} scored rows")
+            explanation = dict()
+            for rank in range(1, self.top_n+1):
+                explanation[f"top_sensor_{rank}"] = np.full(len(input_df), None, dtype=object)
+                explanation[f"top_contribution_{rank}"] = np.full(len(input_df), np.nan)
+            if len(row_idx) == 0:
+                return pd.DataFrame(explanation, index=input_df.index)
+
+            # Bias column is the model's base value, not a sensor
+            contributions = self.get_contributions(sensor_model, input_df.iloc[row_idx])[:, :-1]
+            top_n = min(self.top_n, contributions.shape[1])
+            top_idx = np.argsort(-contributions, axis=1, kind="stable")[:, :top_n]
+            top_contributions = np.take_along_axis(contributions, top_idx, axis=1)
+            feature_names = np.asarray(sensor_model.transformed_feature_name, dtype=object)
+
+            for rank in range(top_n):
+                explanation[f"top_sensor_{rank+1}"][row_idx] = feature_names[top_idx[:, rank]]
+                explanation[f"top_contribution_{rank+1}"][row_idx] = top_contributions[:, rank]
+            return pd.DataFrame(explanation, index=input_df.index)
+
+        except Exception as e:
+            raise SensorException(e, sys)
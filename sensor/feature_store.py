@@ -0,0 +1,105 @@
+"""
+Feature store snapshot of one ingestion run and the row-index splits over it
+
+The snapshot is written once as parquet. Train and test sets are arrays of row positions
+in the snapshot, so a new split only writes two index files and every stage reads just
+the columns and rows it needs.
+"""
+import os, sys
+import hashlib
+from typing import Optional, List, Iterator, Tuple
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sklearn.model_selection import train_test_split
+from sensor import utils
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.config import TARGET_COLUMN
+
+ROW_GROUP_SIZE = 100_000
+
+
+def write_feature_store(df:pd.DataFrame, file_path:str, row_group_size:int = ROW_GROUP_SIZE):
+    """
+    Store the ingested DataFrame as the parquet snapshot every split indexes into
+    """
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_table(table, file_path, row_group_size=row_group_size)
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def create_split(feature_store_file_path:str, train_index_path:str, test_index_path:str, test_size:float,
+                 stratify:bool = True, random_state:int = 40) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Split the snapshot rows into train and test and save their positions
+    Only the target column is read, so splits can be redrawn without rewriting any data
+    =====================================================================================
+    return: sorted train and test row positions
+    """
+    try:
+        target = pq.read_table(feature_store_file_path, columns=[TARGET_COLUMN]).column(TARGET_COLUMN).to_numpy()
+        # A class with a single row cannot be on both sides of a stratified split
+        stratify = stratify and np.unique(target, return_counts=True)[1].min() >= 2
+        train_idx, test_idx = train_test_split(np.arange(len(target)), test_size=test_size, random_state=random_state,
+                                               stratify=target if stratify else None)
+        # Sorted positions let the chunked reader walk the snapshot front to back
+        train_idx, test_idx = np.sort(train_idx), np.sort(test_idx)
+
+        utils.save_numpy_array_data(file_path=train_index_path, array=train_idx)
+        utils.save_numpy_array_data(file_path=test_index_path, array=test_idx)
+        logging.info(f"Split {len(target)} rows into {len(train_idx)} train and {len(test_idx)} test rows, stratified: {stratify}")
+        return train_idx, test_idx
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def load_split(feature_store_file_path:str, index_path:str, columns:Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read the rows of a split from the snapshot
+    columns: columns to read, None reads every column
+    """
+    try:
+        row_idx = utils.load_numpy_array_data(file_path=index_path)
+        table = pq.read_table(feature_store_file_path, columns=columns)
+        return table.take(pa.array(row_idx)).to_pandas()
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def iter_split_chunks(feature_store_file_path:str, index_path:str, columns:Optional[List[str]] = None,
+                      chunk_size:int = ROW_GROUP_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Yield the rows of a split chunk by chunk, at most chunk_size snapshot rows are decoded at a time
+    """
+    try:
+        row_idx = utils.load_numpy_array_data(file_path=index_path)
+        parquet_file = pq.ParquetFile(feature_store_file_path)
+        batch_end = 0
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            batch_start, batch_end = batch_end, batch_end + batch.num_rows
+            start, stop = np.searchsorted(row_idx, [batch_start, batch_end])
+            if stop > start:
+                yield batch.take(pa.array(row_idx[start:stop] - batch_start)).to_pandas()
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def get_split_hash(feature_store_file_path:str, index_path:str) -> str:
+    """
+    Identity of a split, changes with the snapshot content or the selected rows
+    """
+    try:
+        return hashlib.sha256(f"{utils.get_file_hash(feature_store_file_path)}:"
+                              f"{utils.get_file_hash(index_path)}".encode()).hexdigest()
+
+    except Exception as e:
+        raise SensorException(e, sys)
@@ -1,7 +1,10 @@
 import logging
+import logging.handlers
+import atexit
+import json
+import queue
 import os
 from datetime import datetime
-import os
 
 #log file name
 LOG_FILE_NAME = f"{datetime.now().strftime('%m%d%Y__%H%M%S')}.log"
@@ -16,8 +19,103 @@ os.makedirs(LOG_FILE_DIR,exist_ok=True)
 
 LOG_FILE_PATH = os.path.join(LOG_FILE_DIR,LOG_FILE_NAME)
 
-logging.basicConfig(
-    filename=LOG_FILE_PATH,
-    format="[ %(asctime)s ] %(lineno)d %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-)
\ No newline at end of file
+#default level, output format (json or text) and per module levels such as "data_validation=WARNING,utils=DEBUG"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_MODULE_LEVELS = os.getenv("LOG_MODULE_LEVELS", "")
+
+TEXT_FORMAT = "[ %(asctime)s ] %(lineno)d %(name)s - %(levelname)s - %(message)s"
+
+# Attributes present on every LogRecord, anything else was passed through extra= and is kept as a structured field
+RESERVED_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record:logging.LogRecord) -> str:
+        log_record = {
+            "time": datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "name": record.name,
+            "module": record.module,
+            "lineno": record.lineno,
+            "message": record.getMessage(),
+        }
+        log_record.update({key: value for key, value in vars(record).items() if key not in RESERVED_RECORD_ATTRS})
+
+        if record.exc_info:
+            log_record["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(log_record, default=str)
+
+
+class ModuleLevelFilter(logging.Filter):
+    """
+    Applies a level per source module, records from other modules use the default level
+    """
+
+    def __init__(self, default_level:int, module_levels:dict):
+        super().__init__()
+        self.default_level = default_level
+        self.module_levels = module_levels
+
+    def filter(self, record:logging.LogRecord) -> bool:
+        return record.levelno >= self.module_levels.get(record.module, self.default_level)
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the background writer without formatting them
+    The message is built lazily in the writer thread, so arguments passed to
+    a log call must not be mutated afterwards
+    """
+
+    def prepare(self, record:logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def get_level(level_name:str) -> int:
+    # getLevelName returns "Level <name>" for names it does not know, which only fails later when levels are compared
+    level_name = level_name.strip().upper()
+    level = logging.getLevelName(level_name)
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level {level_name!r}, expected one of DEBUG, INFO, WARNING, ERROR, CRITICAL")
+    return level
+
+
+def parse_module_levels(module_levels:str) -> dict:
+    levels = dict()
+    for module_level in filter(None, module_levels.split(",")):
+        if module_level.count("=") != 1:
+            raise ValueError(f"Invalid LOG_MODULE_LEVELS entry {module_level!r}, expected module=LEVEL")
+        module_name, level_name = module_level.split("=")
+        levels[module_name.strip()] = get_level(level_name)
+    return levels
+
+
+def start_listener():
+    global log_queue, log_listener
+    log_queue = queue.SimpleQueue()
+    queue_handler.queue = log_queue
+    log_listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    log_listener.start()
+
+
+file_handler = logging.FileHandler(LOG_FILE_PATH)
+file_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+default_level = get_level(LOG_LEVEL)
+module_levels = parse_module_levels(LOG_MODULE_LEVELS)
+
+queue_handler = AsyncQueueHandler(None)
+queue_handler.addFilter(ModuleLevelFilter(default_level=default_level, module_levels=module_levels))
+
+root_logger = logging.getLogger()
+# Root level is the most verbose configured level, so disabled calls return before a record is created
+root_logger.setLevel(min([default_level, *module_levels.values()]))
+root_logger.addHandler(queue_handler)
+
+start_listener()
+atexit.register(lambda: log_listener.stop())
+# The writer thread does not survive fork, forked workers get their own
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=start_listener)
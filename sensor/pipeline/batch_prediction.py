@@ -2,48 +2,279 @@ import numpy as np
 import pandas as pd
 from sensor.exception import SensorException
 from sensor.logger import logging
-from sensor.utils import load_object
-from sensor.predictor import ModelResolver
+from sensor.predictor import ModelResolver, SensorModel
+from sensor.prediction_cache import PredictionCache
+from sensor.explainer import PredictionExplainer
+from sensor.drift_monitor import DriftMonitor
+from sensor.profiler import RunProfiler, record_rows
+from sensor import config
+from pymongo import UpdateOne
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 import os, sys
+import uuid
 from datetime import datetime
 PREDICTION_DIR = "prediction"
+PROFILE_DIR = os.path.join(PREDICTION_DIR, "profile")
+PREDICTION_STORE_DIR_NAME = "store"
+OUTPUT_MODE_FULL = "full"
+OUTPUT_MODE_SLIM = "slim"
+OUTPUT_MODE_PARQUET = "parquet"
+OUTPUT_MODE_PARTITIONED = "partitioned"
+OUTPUT_MODES = [OUTPUT_MODE_FULL, OUTPUT_MODE_SLIM, OUTPUT_MODE_PARQUET, OUTPUT_MODE_PARTITIONED]
+PARQUET_COMPRESSION = "zstd"
+MONGO_BATCH_SIZE = 10_000
+MONGO_MAX_PENDING_WRITES = 4
 
-def start_batch_prediction(input_file_path):
+
+def run_profiled(run_name:str, stage_name:str, enable_cprofile:bool, func, **kwargs):
+    try:
+        profiler = RunProfiler(profile_file_path=os.path.join(PROFILE_DIR, f"{run_name}.yaml"),
+                               cprofile_dir=os.path.join(PROFILE_DIR, run_name) if enable_cprofile else None)
+
+        try:
+            with profiler.stage(stage_name):
+                return func(**kwargs)
+        finally:
+            profiler.write()
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def start_batch_prediction(input_file_path, output_mode:str = OUTPUT_MODE_FULL, include_proba:bool = False,
+                           key_column:Optional[str] = None, prediction_cache:Optional[PredictionCache] = None,
+                           enable_cprofile:bool = False, drift_monitor:Optional[DriftMonitor] = None, partition = None,
+                           explainer:Optional[PredictionExplainer] = None):
     try:
+        run_name = os.path.basename(input_file_path).replace(".csv", f"{datetime.now().strftime('%m%d%H__%H%M%S')}")
+        return run_profiled(run_name=run_name, stage_name="batch_prediction", enable_cprofile=enable_cprofile,
+                            func=_start_batch_prediction, input_file_path=input_file_path, output_mode=output_mode,
+                            include_proba=include_proba, key_column=key_column, prediction_cache=prediction_cache,
+                            drift_monitor=drift_monitor, partition=partition, explainer=explainer)
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def start_mongo_batch_prediction(database_name:str, collection_name:str, query:Optional[dict] = None,
+                                 output_collection_name:Optional[str] = None, batch_size:int = MONGO_BATCH_SIZE,
+                                 prediction_cache:Optional[PredictionCache] = None, enable_cprofile:bool = False,
+                                 drift_monitor:Optional[DriftMonitor] = None, partition = None,
+                                 explainer:Optional[PredictionExplainer] = None) -> int:
+    """
+    Score documents of a MongoDB collection and write prediction and cat_pred back by document id
+    database_name: database name
+    collection_name: collection to read documents from
+    query: filter selecting documents to score, all documents when None
+    output_collection_name: collection to upsert predictions into, defaults to collection_name
+    batch_size: number of documents scored together
+    prediction_cache: optional cache so repeated sensor snapshots are not scored again
+    drift_monitor: optional monitor which compares scored batches with the training data profile
+    partition: score with the model trained on this partition instead of the global model
+    explainer: optional explainer, its top sensor fields are written to positive and near threshold documents
+    =========================================================
+    return number of documents scored
+    """
+    try:
+        run_name = f"{database_name}.{collection_name}{datetime.now().strftime('%m%d%H__%H%M%S')}"
+        return run_profiled(run_name=run_name, stage_name="mongo_batch_prediction", enable_cprofile=enable_cprofile,
+                            func=_start_mongo_batch_prediction, database_name=database_name,
+                            collection_name=collection_name, query=query,
+                            output_collection_name=output_collection_name, batch_size=batch_size,
+                            prediction_cache=prediction_cache, drift_monitor=drift_monitor, partition=partition,
+                            explainer=explainer)
+
+    except Exception as e:
+        raise SensorException(e, sys)
 
-        os.makedirs(PREDICTION_DIR, exist_ok=True)
 
+def write_mongo_predictions(collection, prediction_df:pd.DataFrame) -> int:
+    """
+    Upsert prediction and cat_pred of every row of prediction_df, which is indexed by document id
+    Explanation columns are only set on the rows which were explained
+    """
+    try:
+        explanation_columns = [column for column in prediction_df.columns if column not in ("prediction", "cat_pred")]
+        updates = [{"prediction": prediction, "cat_pred": cat_pred}
+                   for prediction, cat_pred in zip(prediction_df["prediction"].tolist(), prediction_df["cat_pred"].tolist())]
+        if len(explanation_columns) > 0:
+            explanation_df = prediction_df[explanation_columns]
+            explained = explanation_df.notna().to_numpy()
+            for row_idx in map(int, explained.any(axis=1).nonzero()[0]):
+                updates[row_idx].update({column: value for column, value, is_set in
+                                         zip(explanation_columns, explanation_df.iloc[row_idx].tolist(), explained[row_idx]) if is_set})
+        requests = [UpdateOne({"_id": doc_id}, {"$set": update}, upsert=True)
+                    for doc_id, update in zip(prediction_df.index, updates)]
+        if len(requests)==0:
+            return 0
+        return collection.bulk_write(requests, ordered=False).matched_count
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def _start_mongo_batch_prediction(database_name:str, collection_name:str, query:Optional[dict],
+                                  output_collection_name:Optional[str], batch_size:int,
+                                  prediction_cache:Optional[PredictionCache],
+                                  drift_monitor:Optional[DriftMonitor], partition = None,
+                                  explainer:Optional[PredictionExplainer] = None) -> int:
+    try:
         logging.info("Creating Model Resolver Object")
-        model_resolver = ModelResolver(model_registry="saved_models")
+        model_resolver = ModelResolver(model_registry="saved_models", partition=partition)
+        sensor_model = SensorModel(model_resolver=model_resolver, prediction_cache=prediction_cache, explainer=explainer)
 
-        logging.info(f"Reading file: {input_file_path}")
-        df = pd.read_csv(input_file_path)
-        df.replace(to_replace="na", value=np.NAN, inplace=True)
+        source_collection = config.mongo_client[database_name][collection_name]
+        output_collection = config.mongo_client[database_name][output_collection_name or collection_name]
+
+        # Only the columns the transformer was fitted on are fetched
+        projection = {column: 1 for column in sensor_model.input_feature_name}
+        cursor = source_collection.find(query or dict(), projection=projection).batch_size(batch_size)
+        logging.info("Scoring %s.%s in batches of %s documents", database_name, collection_name, batch_size)
+
+        def score_batch(documents:list):
+            batch_df = pd.DataFrame(documents).set_index("_id")
+            for column in sensor_model.input_feature_name:
+                if column not in batch_df.columns:
+                    batch_df[column] = np.nan
+            record_rows(len(batch_df))
+            prediction_df = sensor_model.predict(batch_df)
+            if drift_monitor is not None:
+                drift_monitor.update(sensor_model, batch_df)
+            return prediction_df
+
+        num_scored = 0
+        pending_writes = []
+        # Writes run on pooled connections while the next batch is read and scored
+        with ThreadPoolExecutor(max_workers=MONGO_MAX_PENDING_WRITES) as executor:
+            documents = []
+            for document in cursor:
+                documents.append(document)
+                if len(documents) < batch_size:
+                    continue
+
+                prediction_df = score_batch(documents)
+                num_scored += len(prediction_df)
+                documents = []
+
+                pending_writes.append(executor.submit(write_mongo_predictions, output_collection, prediction_df))
+                if len(pending_writes) >= MONGO_MAX_PENDING_WRITES:
+                    pending_writes.pop(0).result()
+
+            if len(documents) > 0:
+                prediction_df = score_batch(documents)
+                num_scored += len(prediction_df)
+                pending_writes.append(executor.submit(write_mongo_predictions, output_collection, prediction_df))
 
-        logging.info("Loading Transformer to transform loaded dataset")
-        transformer = load_object(file_path=model_resolver.get_latest_transformer_path())
+            for pending_write in pending_writes:
+                pending_write.result()
 
-        input_feature_name = list(transformer.feature_names_in_)
-        input_arr = transformer.transform(df[input_feature_name])
+        if drift_monitor is not None:
+            drift_monitor.save_state()
 
-        logging.info("Loading Model to make prediction")
-        model = load_object(file_path=model_resolver.get_latest_model_path())
-        prediction = model.predict(input_arr)
+        logging.info(f"Mongo Batch Prediction Complete, {num_scored} documents written to: {output_collection.full_name}")
+        return num_scored
 
-        logging.info("Loading Target Encoder to convert predicted column to categorical values")
-        target_encoder = load_object(file_path=model_resolver.get_latest_target_encoder_path())
-        cat_pred = target_encoder.inverse_transform(prediction)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def _start_batch_prediction(input_file_path, prediction_cache:Optional[PredictionCache] = None,
+                            drift_monitor:Optional[DriftMonitor] = None, partition = None,
+                            explainer:Optional[PredictionExplainer] = None, **kwargs):
+    try:
+
+        logging.info("Creating Model Resolver Object")
+        model_resolver = ModelResolver(model_registry="saved_models", partition=partition)
+        sensor_model = SensorModel(model_resolver=model_resolver, prediction_cache=prediction_cache, explainer=explainer)
+
+        prediciton_file_path = predict_file(input_file_path=input_file_path, sensor_model=sensor_model,
+                                            drift_monitor=drift_monitor, **kwargs)
+        if drift_monitor is not None:
+            # The window carries over to the next run scored by the same model
+            drift_monitor.save_state()
+        return prediciton_file_path
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def write_predictions(df:pd.DataFrame, prediction_df:pd.DataFrame, input_file_path:str, prediction_dir:str,
+                      output_mode:str = OUTPUT_MODE_FULL, key_column:Optional[str] = None) -> str:
+    """
+    Store predictions of one input file according to output_mode
+    full: input columns and predictions as csv, slim: row key and predictions as csv,
+    parquet: row key and predictions as compressed parquet,
+    partitioned: row key and predictions appended to a parquet store partitioned by prediction date
+    key_column: input column identifying a row, the input row number is used when None
+    =========================================================
+    return path of the written file
+    """
+    try:
+        timestamp = datetime.now()
+        file_stem = os.path.basename(input_file_path).replace(".csv", f"{timestamp.strftime('%m%d%H__%H%M%S')}")
+
+        if output_mode == OUTPUT_MODE_FULL:
+            output_df = pd.concat([df, prediction_df], axis=1)
+        else:
+            row_key = df[key_column] if key_column is not None else pd.Series(range(len(df)), index=df.index, name="row_number")
+            output_df = pd.concat([row_key, prediction_df], axis=1)
 
-        df["prediction"] = prediction
-        df["cat_pred"] = cat_pred
+        if output_mode in (OUTPUT_MODE_FULL, OUTPUT_MODE_SLIM):
+            prediciton_file_path = os.path.join(prediction_dir, f"{file_stem}.csv")
+            output_df.to_csv(prediciton_file_path, index=False, header=True)
+
+        elif output_mode == OUTPUT_MODE_PARQUET:
+            prediciton_file_path = os.path.join(prediction_dir, f"{file_stem}.parquet")
+            output_df.to_parquet(prediciton_file_path, index=False, compression=PARQUET_COMPRESSION)
+
+        elif output_mode == OUTPUT_MODE_PARTITIONED:
+            output_df["source_file"] = os.path.basename(input_file_path)
+            partition_dir = os.path.join(prediction_dir, PREDICTION_STORE_DIR_NAME, f"prediction_date={timestamp.strftime('%Y-%m-%d')}")
+            os.makedirs(partition_dir, exist_ok=True)
+            prediciton_file_path = os.path.join(partition_dir, f"part-{file_stem}-{uuid.uuid4().hex[:8]}.parquet")
+            output_df.to_parquet(prediciton_file_path, index=False, compression=PARQUET_COMPRESSION)
+
+        else:
+            raise Exception(f"Unknown output mode: {output_mode}, expected one of {OUTPUT_MODES}")
+
+        return prediciton_file_path
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def predict_file(input_file_path:str, sensor_model:SensorModel, prediction_dir:str = PREDICTION_DIR,
+                 output_mode:str = OUTPUT_MODE_FULL, include_proba:bool = False, key_column:Optional[str] = None,
+                 drift_monitor:Optional[DriftMonitor] = None) -> str:
+    """
+    Score a csv file with an already loaded model and store the predictions in prediction_dir
+    return: path of the prediction file
+    """
+    try:
+
+        os.makedirs(prediction_dir, exist_ok=True)
+
+        logging.info(f"Reading file: {input_file_path}")
+        if output_mode == OUTPUT_MODE_FULL:
+            df = pd.read_csv(input_file_path)
+        else:
+            # Slim outputs only need the model inputs and the row key
+            usecols = set(sensor_model.input_feature_name) | ({key_column} if key_column is not None else set())
+            df = pd.read_csv(input_file_path, usecols=lambda column: column in usecols)
+        record_rows(len(df))
+        df.replace(to_replace="na", value=np.nan, inplace=True)
 
-        prediciton_file_name = os.path.basename(input_file_path).replace(".csv", f"{datetime.now().strftime('%m%d%H__%H%M%S')}.csv")
-        prediciton_file_path = os.path.join(PREDICTION_DIR, prediciton_file_name)
+        prediction_df = sensor_model.predict(df, include_proba=include_proba)
+        if drift_monitor is not None:
+            drift_monitor.update(sensor_model, df)
 
-        df.to_csv(prediciton_file_path, index=False, header=True)
+        prediciton_file_path = write_predictions(df=df, prediction_df=prediction_df, input_file_path=input_file_path,
+                                                 prediction_dir=prediction_dir, output_mode=output_mode,
+                                                 key_column=key_column)
 
         logging.info(f"Batch Prediction Complete, file stored here: {prediciton_file_path}")
         return prediciton_file_path
     
     except Exception as e:
-        raise SensorException(e, sys)
\ No newline at end of file
+        raise SensorException(e, sys)
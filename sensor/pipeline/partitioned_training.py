@@ -0,0 +1,171 @@
+"""
+Train one model per partition of the sensor collection, e.g. per truck fleet
+
+Usage:
+    python -m sensor.pipeline.partitioned_training --partition-key fleet --max-workers 4 --memory-limit-mb 4096
+
+Every partition runs the full stage chain in its own worker process with its own
+artifact directory and model registry namespace, saved_models/partitions/<partition>-<hash>,
+see config_entity.get_partition_dir_name.
+"""
+import os, sys
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Optional, List
+from sensor import config
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.utils import read_yaml_file, write_yaml_file
+from sensor.entity import config_entity
+from sensor.artifact_store import ArtifactStore
+from sensor.resources import WorkerResources
+from sensor.pipeline.training_pipeline import start_training_pipeline
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PARTITION_SUMMARY_DIR = os.path.join("artifacts", config_entity.PARTITION_DIR_NAME)
+
+
+def get_partitions(database_name:str, collection_name:str, partition_key:str) -> list:
+    try:
+        partitions = config.mongo_client[database_name][collection_name].distinct(partition_key)
+        return sorted(partition for partition in partitions if partition is not None)
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def limit_worker_resources(memory_limit_mb:Optional[int], niceness:int, worker_resources:Optional[WorkerResources] = None):
+    """
+    Process pool initializer, caps the address space and lowers the scheduling priority of a worker
+    worker_resources: gives the worker its share of the cores and threads
+    """
+    if worker_resources is not None:
+        worker_resources.initialize()
+    if memory_limit_mb is not None and resource is not None:
+        memory_limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    if niceness > 0 and hasattr(os, "nice"):
+        os.nice(niceness)
+
+
+def train_partition(partition_key:str, partition) -> dict:
+    """
+    Run the training pipeline on one partition, failures are reported instead of raised
+    so one partition does not stop the others
+    """
+    start_time = time.time()
+    training_pipeline_config = config_entity.TrainingPipelineConfig(partition_key=partition_key, partition=partition)
+    partition_summary = {"partition": partition, "pid": os.getpid(), "artifact_dir": training_pipeline_config.artifact_dir}
+
+    try:
+        logging.info(f"Training partition {partition_key}={partition}")
+        artifacts = start_training_pipeline(training_pipeline_config=training_pipeline_config)
+        model_trainer_artifact = artifacts["model_trainer"]
+        model_eval_artifact = artifacts["model_evaluation"]
+        partition_summary.update({
+            "status": "success",
+            "f1_train_score": float(model_trainer_artifact.f1_train_score),
+            "f1_test_score": float(model_trainer_artifact.f1_test_sccore),
+            "is_model_accepted": bool(model_eval_artifact.is_model_accepted),
+            # No improvement is measured for the first model of a partition
+            "improved_accuracy": float(model_eval_artifact.improved_accuracy)
+                                 if model_eval_artifact.improved_accuracy is not None else None})
+
+    except Exception as e:
+        logging.error(f"Training failed for partition {partition_key}={partition}: {e}")
+        partition_summary.update({"status": "failed", "error": str(e)})
+
+    partition_summary["wall_time_sec"] = time.time() - start_time
+    run_profile = read_yaml_file(file_path=training_pipeline_config.profile_file_path)
+    partition_summary["stage_wall_time_sec"] = {stage_name: stage["wall_time_sec"]
+                                                for stage_name, stage in run_profile.get("stages", dict()).items()}
+    return partition_summary
+
+
+def start_partitioned_training(partition_key:str, partitions:Optional[List] = None, max_workers:int = 2,
+                               memory_limit_mb:Optional[int] = None, niceness:int = 0,
+                               start_method:str = "spawn", pin_workers:bool = True) -> str:
+    """
+    Train every partition of the sensor collection in a pool of worker processes
+    partition_key: document field the collection is split on
+    partitions: partition values to train, all distinct values of partition_key when None
+    max_workers: number of partitions trained at the same time
+    memory_limit_mb: address space limit of each worker, None leaves it unlimited
+    niceness: added to the scheduling niceness of each worker
+    start_method: multiprocessing start method of the workers
+    pin_workers: pin every worker to its own group of cores
+    =========================================================
+    return path of the summary file with per partition timings and scores
+    """
+    try:
+        start_time = time.time()
+        data_ingestion_config = config_entity.DataIngestionConfig(training_pipeline_config=config_entity.TrainingPipelineConfig())
+        if partitions is None:
+            partitions = get_partitions(database_name=data_ingestion_config.database_name,
+                                        collection_name=data_ingestion_config.collection_name,
+                                        partition_key=partition_key)
+        logging.info(f"Training {len(partitions)} partitions on {partition_key} with {max_workers} workers")
+
+        pool_kwargs = dict()
+        if start_method != "fork":
+            # A fresh process per partition hands the memory of a finished partition back to the system
+            pool_kwargs["max_tasks_per_child"] = 1
+        mp_context = multiprocessing.get_context(start_method)
+        worker_resources = WorkerResources(num_workers=max_workers, pin=pin_workers, mp_context=mp_context)
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context,
+                                 initializer=limit_worker_resources,
+                                 initargs=(memory_limit_mb, niceness, worker_resources),
+                                 **pool_kwargs) as executor:
+            futures = [executor.submit(train_partition, partition_key, partition) for partition in partitions]
+            partition_summaries = [future.result() for future in futures]
+
+        # Blobs are shared between partitions, so they are only collected once every partition has been pushed
+        model_pusher_config = config_entity.ModelPusherConfig(training_pipeline_config=config_entity.TrainingPipelineConfig())
+        ArtifactStore(store_dir=model_pusher_config.artifact_store_dir).collect_garbage()
+
+        summary = {
+            "partition_key": partition_key,
+            "max_workers": max_workers,
+            "memory_limit_mb": memory_limit_mb,
+            "total_wall_time_sec": time.time() - start_time,
+            "num_succeeded": sum(partition_summary["status"] == "success" for partition_summary in partition_summaries),
+            "num_failed": sum(partition_summary["status"] != "success" for partition_summary in partition_summaries),
+            "partitions": {config_entity.get_partition_dir_name(partition_summary["partition"]): partition_summary
+                           for partition_summary in partition_summaries}}
+        summary_file_path = os.path.join(PARTITION_SUMMARY_DIR, f"summary_{datetime.now().strftime('%m%d%Y__%H%M%S')}.yaml")
+        write_yaml_file(file_path=summary_file_path, data=summary)
+        logging.info(f"Partitioned training complete, {summary['num_succeeded']} succeeded, {summary['num_failed']} failed, "
+                     f"summary: {summary_file_path}")
+        return summary_file_path
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Train one model per partition of the sensor collection")
+    parser.add_argument("--partition-key", required=True)
+    parser.add_argument("--partitions", nargs="*", default=None)
+    parser.add_argument("--max-workers", type=int, default=2)
+    parser.add_argument("--memory-limit-mb", type=int, default=None)
+    parser.add_argument("--niceness", type=int, default=0)
+    parser.add_argument("--start-method", choices=multiprocessing.get_all_start_methods(), default="spawn")
+    parser.add_argument("--no-pin-workers", action="store_true")
+    args = parser.parse_args(args)
+
+    summary_file_path = start_partitioned_training(partition_key=args.partition_key, partitions=args.partitions,
+                                                   max_workers=args.max_workers, memory_limit_mb=args.memory_limit_mb,
+                                                   niceness=args.niceness, start_method=args.start_method,
+                                                   pin_workers=not args.no_pin_workers)
+    print(f"Partitioned training complete, summary stored here: {summary_file_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Long running scorer which watches a directory and scores every csv file dropped into it
+
+Usage:
+    python -m sensor.pipeline.scoring_daemon --input-dir incoming --output-dir prediction
+
+Producers should write files elsewhere and move them into the input directory,
+so the daemon never picks up a partially written csv.
+"""
+import os, sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from watchfiles import watch
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.predictor import ModelResolver, WarmModel, EVALUATOR_XGBOOST, EVALUATORS
+from sensor.scoring_pool import ScoringPool
+from sensor.explainer import PredictionExplainer
+from sensor.prediction_cache import PredictionCache, InMemoryPredictionCache, DiskPredictionCache
+from sensor.drift_monitor import DriftMonitor, SUMMARY_INTERVAL_ROWS
+from sensor.resources import configure_process, get_num_threads
+from sensor.pipeline.batch_prediction import predict_file, OUTPUT_MODE_FULL, OUTPUT_MODES
+
+INPUT_DIR = "incoming"
+LATENCY_FILE_NAME = "latency.jsonl"
+
+
+class ScoringDaemon:
+
+    def __init__(self, input_dir:str = INPUT_DIR, output_dir:str = "prediction", model_registry:str = "saved_models",
+                 max_workers:int = 4, max_pending_files:int = 16, check_interval_sec:float = 5,
+                 output_mode:str = OUTPUT_MODE_FULL, include_proba:bool = False, key_column:Optional[str] = None,
+                 prediction_cache:Optional[PredictionCache] = None, drift_monitor:Optional[DriftMonitor] = None,
+                 partition = None, evaluator:str = EVALUATOR_XGBOOST, worker_processes:int = 0,
+                 explainer:Optional[PredictionExplainer] = None, rescan_interval_sec:float = 5):
+        try:
+            self.input_dir = input_dir
+            self.output_dir = output_dir
+            os.makedirs(self.input_dir, exist_ok=True)
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.latency_file_path = os.path.join(self.output_dir, LATENCY_FILE_NAME)
+            self.output_mode = output_mode
+            self.include_proba = include_proba
+            self.key_column = key_column
+            self.drift_monitor = drift_monitor
+
+            model_resolver = ModelResolver(model_registry=model_registry, partition=partition)
+            if worker_processes > 0:
+                if prediction_cache is not None:
+                    raise Exception("A prediction cache can not be used with worker processes, "
+                                    "a cache filled inside one worker would not be seen by the others")
+                # Threads read and write files, the model is loaded once and scoring runs in forked workers
+                self.warm_model = ScoringPool(model_resolver=model_resolver, num_workers=worker_processes,
+                                              check_interval_sec=check_interval_sec, evaluator=evaluator,
+                                              explainer=explainer)
+            else:
+                self.warm_model = WarmModel(model_resolver=model_resolver,
+                                            check_interval_sec=check_interval_sec,
+                                            prediction_cache=prediction_cache,
+                                            # Files are scored concurrently, so the thread budget is shared between them
+                                            n_jobs=max(1, get_num_threads() // max_workers),
+                                            evaluator=evaluator, explainer=explainer)
+            self.max_workers = max_workers
+            # Bounds files queued or being scored, the watcher blocks once it is exhausted
+            self.pending_files = threading.BoundedSemaphore(max_pending_files)
+            self.metrics_lock = threading.Lock()
+            # Input files already submitted, files which left input_dir are forgotten on the next scan
+            self.submitted_files = set()
+            self.rescan_interval_sec = rescan_interval_sec
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def score_file(self, file_path:str, submit_time:float):
+        try:
+            start_time = time.time()
+            sensor_model = self.warm_model.get()
+            prediction_file_path = predict_file(input_file_path=file_path, sensor_model=sensor_model,
+                                                prediction_dir=self.output_dir, output_mode=self.output_mode,
+                                                include_proba=self.include_proba, key_column=self.key_column,
+                                                drift_monitor=self.drift_monitor)
+            end_time = time.time()
+
+            latency = {
+                "input_file_path": file_path,
+                "prediction_file_path": prediction_file_path,
+                "model_version": sensor_model.version,
+                "queue_wait_sec": start_time - submit_time,
+                "scoring_sec": end_time - start_time,
+                "end_to_end_sec": end_time - os.path.getmtime(file_path),
+            }
+            logging.info("Scored file %s", file_path, extra={"latency": latency})
+            with self.metrics_lock:
+                with open(self.latency_file_path, "a") as latency_file:
+                    latency_file.write(json.dumps(latency) + "\n")
+
+        except Exception as e:
+            logging.error(f"Scoring failed for {file_path}: {SensorException(e, sys)}")
+
+        finally:
+            self.pending_files.release()
+
+
+    def list_input_files(self) -> list:
+        return [os.path.join(self.input_dir, file_name) for file_name in sorted(os.listdir(self.input_dir))
+                if file_name.endswith(".csv")]
+
+
+    def submit(self, executor:ThreadPoolExecutor, file_path:str):
+        if file_path in self.submitted_files:
+            return
+        self.submitted_files.add(file_path)
+        self.pending_files.acquire()
+        executor.submit(self.score_file, file_path, time.time())
+
+
+    def scan_input_dir(self, executor:ThreadPoolExecutor):
+        input_files = self.list_input_files()
+        # Keeps the set as small as the directory, a file moved in again under the same name is scored again
+        self.submitted_files.intersection_update(input_files)
+        for file_path in input_files:
+            self.submit(executor, file_path)
+
+
+    def run(self, stop_event:Optional[threading.Event] = None, score_existing:bool = False):
+        """
+        Watch input_dir until stop_event is set and score every new csv file
+        score_existing: also score csv files already present when the daemon starts
+        """
+        try:
+            logging.info(f"Scoring daemon watching: {self.input_dir}")
+            # Existing files are listed before the model is loaded, files landing while it loads are new ones
+            if not score_existing:
+                self.submitted_files.update(self.list_input_files())
+
+            # Load the model before the first file arrives
+            self.warm_model.get()
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                self.scan_input_dir(executor)
+
+                # The directory is rescanned on every change and at least every rescan_interval_sec, so files
+                # landing before the watcher started, or changes the watcher did not report, are not missed
+                for _ in watch(self.input_dir, stop_event=stop_event, debounce=200,
+                               rust_timeout=int(self.rescan_interval_sec * 1000), yield_on_timeout=True):
+                    self.scan_input_dir(executor)
+
+            if self.drift_monitor is not None:
+                self.drift_monitor.save_state()
+            if isinstance(self.warm_model, ScoringPool):
+                self.warm_model.close()
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Score csv files as they land in a directory")
+    parser.add_argument("--input-dir", default=INPUT_DIR)
+    parser.add_argument("--output-dir", default="prediction")
+    parser.add_argument("--model-registry", default="saved_models")
+    parser.add_argument("--partition", default=None)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--max-pending-files", type=int, default=16)
+    parser.add_argument("--score-existing", action="store_true")
+    parser.add_argument("--output-mode", choices=OUTPUT_MODES, default=OUTPUT_MODE_FULL)
+    parser.add_argument("--include-proba", action="store_true")
+    parser.add_argument("--key-column", default=None)
+    parser.add_argument("--cache", choices=["none", "memory", "disk"], default="none")
+    parser.add_argument("--cache-size", type=int, default=1_000_000)
+    parser.add_argument("--monitor-drift", action="store_true")
+    parser.add_argument("--drift-interval-rows", type=int, default=SUMMARY_INTERVAL_ROWS)
+    parser.add_argument("--num-threads", type=int, default=None)
+    parser.add_argument("--evaluator", choices=EVALUATORS, default=EVALUATOR_XGBOOST)
+    parser.add_argument("--worker-processes", type=int, default=0,
+                        help="forked scoring processes sharing one loaded model, 0 scores in the daemon process")
+    parser.add_argument("--explain-top-n", type=int, default=0,
+                        help="add the top N contributing sensors of positive and near threshold rows, 0 disables")
+    args = parser.parse_args(args)
+
+    if args.worker_processes > 0 and args.cache != "none":
+        parser.error("--cache can not be combined with --worker-processes")
+
+    configure_process(num_threads=args.num_threads)
+
+    prediction_cache = None
+    if args.cache == "memory":
+        prediction_cache = InMemoryPredictionCache(max_size=args.cache_size)
+    elif args.cache == "disk":
+        prediction_cache = DiskPredictionCache(max_size=args.cache_size)
+
+    drift_monitor = None
+    if args.monitor_drift:
+        drift_monitor = DriftMonitor(drift_dir=os.path.join(args.output_dir, "drift"),
+                                     summary_interval_rows=args.drift_interval_rows)
+
+    scoring_daemon = ScoringDaemon(input_dir=args.input_dir, output_dir=args.output_dir,
+                                   model_registry=args.model_registry, max_workers=args.max_workers,
+                                   max_pending_files=args.max_pending_files, output_mode=args.output_mode,
+                                   include_proba=args.include_proba, key_column=args.key_column,
+                                   prediction_cache=prediction_cache, drift_monitor=drift_monitor,
+                                   partition=args.partition, evaluator=args.evaluator,
+                                   worker_processes=args.worker_processes,
+                                   explainer=PredictionExplainer(top_n=args.explain_top_n) if args.explain_top_n > 0 else None)
+    scoring_daemon.run(score_existing=args.score_existing)
+
+
+if __name__ == "__main__":
+    main()
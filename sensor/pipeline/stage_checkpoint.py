@@ -0,0 +1,37 @@
+import os, sys
+import dataclasses
+from typing import Callable
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.utils import read_yaml_file, write_yaml_file
+
+STAGE_CHECKPOINT_DIR_NAME = "stage_checkpoints"
+
+
+def get_stage_checkpoint_path(artifact_dir:str, stage_name:str) -> str:
+    return os.path.join(artifact_dir, STAGE_CHECKPOINT_DIR_NAME, f"{stage_name}.yaml")
+
+
+def run_stage(artifact_dir:str, stage_name:str, func:Callable) -> dict:
+    """
+    Run one pipeline stage unless it already completed for this run
+    The stage artifact is written as a checkpoint once func returns, a rerun of the same
+    artifact_dir returns the checkpoint instead of running the stage again
+    =========================================================
+    return stage artifact as a dict of its fields
+    """
+    try:
+        checkpoint_path = get_stage_checkpoint_path(artifact_dir=artifact_dir, stage_name=stage_name)
+        artifact = read_yaml_file(file_path=checkpoint_path)
+        if artifact:
+            logging.info(f"Stage {stage_name} already completed for {artifact_dir}, reusing its artifact")
+            return artifact
+
+        # NumPy scalars such as scores become plain values so the artifact is valid yaml and json
+        artifact = {field_name: value.item() if hasattr(value, "item") else value
+                    for field_name, value in dataclasses.asdict(func()).items()}
+        write_yaml_file(file_path=checkpoint_path, data=artifact)
+        return artifact
+
+    except Exception as e:
+        raise SensorException(e, sys)
@@ -1,8 +1,11 @@
 from sensor.utils import get_collection_as_dataframe
 import os, sys
+import argparse
 from sensor.exception import SensorException
 from sensor.logger import logging
 from sensor.entity import config_entity
+from sensor.profiler import RunProfiler
+from sensor.resources import configure_process
 from sensor.components.data_ingestion import DataIngestion
 from sensor.components.data_validation import DataValidation
 from sensor.components.data_transformation import DataTransformation
@@ -11,60 +14,111 @@ from sensor.components.model_evaluation import ModelEvaluation
 from sensor.components.model_pusher import ModelPusher
 
 
-def start_training_pipeline():
+def start_training_pipeline(training_pipeline_config:config_entity.TrainingPipelineConfig = None) -> dict:
+    """
+    Run every stage of the training pipeline
+    training_pipeline_config: run configuration, a new unpartitioned run when None
+    =========================================================
+    return dict of stage name to stage artifact
+    """
     try:
 
-        training_pipeline_config = config_entity.TrainingPipelineConfig()
-
-        # Data Ingestion
-        data_ingestion_config = config_entity.DataIngestionConfig(training_pipeline_config=training_pipeline_config)
-        print(data_ingestion_config.to_dict())
-        data_ingestion = DataIngestion(data_ingestion_config=data_ingestion_config)
-        data_ingestion_artifact = data_ingestion.initiate_data_ingestion()
-
-        
-        # Data Validation
-        data_validation_config = config_entity.DataValidationConfig(training_pipeline_config=training_pipeline_config)
-        data_validation = DataValidation(data_validation_config=data_validation_config, 
-                       data_ingestion_artifact=data_ingestion_artifact)
-        
-        data_validation_artifact = data_validation.initiate_data_validation()
-
-        
-        # Data Transformation
-        data_transformation_config = config_entity.DataTransformationConfig(training_pipeline_config=training_pipeline_config)
-        data_transformation = DataTransformation(data_transfomation_config=data_transformation_config,
-                                                 data_ingestion_artifact=data_ingestion_artifact)
-        
-        data_transformation_artifact = data_transformation.initiate_data_transformation()
-
-        
-        # Model Trainer
-        model_trainer_config = config_entity.ModelTrainerConfig(training_pipeline_config=training_pipeline_config)
-        model_trainer = ModelTrainer(model_trainer_config=model_trainer_config,
-                                     data_transformation_artifact=data_transformation_artifact)
-        
-        model_trainer_artifact = model_trainer.initiate_model_trainer()
-
-
-        # Model Evaluation
-        model_eval_config = config_entity.ModelEvaluationConfig(training_pipeline_config=training_pipeline_config)
-        model_eval = ModelEvaluation(model_eval_config=model_eval_config,
-                                     data_transformation_artifact=data_transformation_artifact,
-                                     data_ingestion_artifact=data_ingestion_artifact,
-                                     model_trainer_artifact=model_trainer_artifact)
-        
-        model_eval_artifact = model_eval.initiate_model_evalutaion()
-
-
-        # Model Pusher
-        model_pusher_config = config_entity.ModelPusherConfig(training_pipeline_config=training_pipeline_config)
-        model_pusher = ModelPusher(model_pusher_config=model_pusher_config,
-                                   data_transformation_artifact=data_transformation_artifact,
-                                   model_trainer_artifact=model_trainer_artifact)
-        
-        model_pusher_artifact = model_pusher.initiate_model_pusher()
-
-   
+        if training_pipeline_config is None:
+            training_pipeline_config = config_entity.TrainingPipelineConfig()
+        profiler = RunProfiler(profile_file_path=training_pipeline_config.profile_file_path,
+                               cprofile_dir=training_pipeline_config.cprofile_dir if training_pipeline_config.enable_cprofile else None)
+
+        try:
+            # Data Ingestion
+            data_ingestion_config = config_entity.DataIngestionConfig(training_pipeline_config=training_pipeline_config)
+            print(data_ingestion_config.to_dict())
+            data_ingestion = DataIngestion(data_ingestion_config=data_ingestion_config)
+            with profiler.stage("data_ingestion"):
+                data_ingestion_artifact = data_ingestion.initiate_data_ingestion()
+
+
+            # Data Validation
+            data_validation_config = config_entity.DataValidationConfig(training_pipeline_config=training_pipeline_config)
+            data_validation = DataValidation(data_validation_config=data_validation_config,
+                           data_ingestion_artifact=data_ingestion_artifact)
+
+            with profiler.stage("data_validation"):
+                data_validation_artifact = data_validation.initiate_data_validation()
+
+
+            # Data Transformation
+            data_transformation_config = config_entity.DataTransformationConfig(training_pipeline_config=training_pipeline_config)
+            data_transformation = DataTransformation(data_transfomation_config=data_transformation_config,
+                                                     data_ingestion_artifact=data_ingestion_artifact)
+
+            with profiler.stage("data_transformation"):
+                data_transformation_artifact = data_transformation.initiate_data_transformation()
+
+
+            # Model Trainer
+            model_trainer_config = config_entity.ModelTrainerConfig(training_pipeline_config=training_pipeline_config)
+            model_trainer = ModelTrainer(model_trainer_config=model_trainer_config,
+                                         data_transformation_artifact=data_transformation_artifact,
+                                         data_ingestion_artifact=data_ingestion_artifact)
+
+            with profiler.stage("model_trainer"):
+                model_trainer_artifact = model_trainer.initiate_model_trainer()
+
+
+            # Model Evaluation
+            model_eval_config = config_entity.ModelEvaluationConfig(training_pipeline_config=training_pipeline_config)
+            model_eval = ModelEvaluation(model_eval_config=model_eval_config,
+                                         data_transformation_artifact=data_transformation_artifact,
+                                         data_ingestion_artifact=data_ingestion_artifact,
+                                         model_trainer_artifact=model_trainer_artifact)
+
+            with profiler.stage("model_evaluation"):
+                model_eval_artifact = model_eval.initiate_model_evalutaion()
+
+
+            # Model Pusher
+            model_pusher_config = config_entity.ModelPusherConfig(training_pipeline_config=training_pipeline_config)
+            model_pusher = ModelPusher(model_pusher_config=model_pusher_config,
+                                       data_transformation_artifact=data_transformation_artifact,
+                                       model_trainer_artifact=model_trainer_artifact)
+
+            # A challenger that is not significantly better leaves the registry untouched
+            model_pusher_artifact = None
+            if model_eval_artifact.is_model_accepted:
+                with profiler.stage("model_pusher"):
+                    model_pusher_artifact = model_pusher.initiate_model_pusher()
+
+            return {"data_ingestion": data_ingestion_artifact, "data_validation": data_validation_artifact,
+                    "data_transformation": data_transformation_artifact, "model_trainer": model_trainer_artifact,
+                    "model_evaluation": model_eval_artifact, "model_pusher": model_pusher_artifact}
+
+        finally:
+            # Profile is written for failed runs too, so regressions can be traced to a stage
+            profiler.write()
+            logging.info(f"Stage timings:\n{profiler.format_stage_times()}")
+            if training_pipeline_config.smoke:
+                print(profiler.format_stage_times())
+
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Run the training pipeline")
+    parser.add_argument("--smoke", action="store_true",
+                        help="Train on a stratified sample with few boosting rounds, under smoke/ instead of saved_models")
+    args = parser.parse_args(args)
+
+    try:
+        configure_process()
+        artifacts = start_training_pipeline(config_entity.TrainingPipelineConfig(smoke=args.smoke))
+        print(f"Training pipeline complete, model pushed: {artifacts['model_pusher'] is not None}")
+        return 0
+
     except Exception as e:
-        raise SensorException(e, sys)
\ No newline at end of file
+        raise SensorException(e, sys)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
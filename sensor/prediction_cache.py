@@ -0,0 +1,180 @@
+import os, sys
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Tuple
+import numpy as np
+import pandas as pd
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+
+def hash_feature_rows(input_df:pd.DataFrame) -> np.ndarray:
+    """
+    Hash every row of the model input columns in one vectorised pass
+    input_df: model input columns with missing values already converted to NaN
+    return: uint64 array with one hash per row
+    """
+    try:
+        # Normalise to float so "12", "12.0" and 12.0 hash alike
+        float_df = input_df.astype("float64")
+        return pd.util.hash_pandas_object(float_df, index=False).to_numpy()
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def stack_probas(probas:list) -> np.ndarray:
+    if len(probas)==0:
+        return np.empty((0, 0))
+    return np.vstack(probas)
+
+
+class PredictionCache:
+    """
+    Bounded least recently used store of class probabilities keyed by feature row hash
+    Entries belong to one model version, the cache empties itself when another version asks
+    """
+
+    def __init__(self, max_size:int = 1_000_000):
+        try:
+            self.max_size = max_size
+            self.version = None
+            self.hits = 0
+            self.misses = 0
+            self.lock = threading.Lock()
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def lookup(self, version:str, row_hashes:np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        return: boolean hit mask over row_hashes and probabilities of the hit rows
+        """
+        try:
+            with self.lock:
+                if version != self.version:
+                    logging.info(f"Prediction cache invalidated, model version changed from {self.version} to {version}")
+                    self._reset(version)
+                    self.version = version
+
+                hit_mask, hit_probas = self._lookup(row_hashes)
+                num_hits = int(hit_mask.sum())
+                self.hits += num_hits
+                self.misses += len(row_hashes) - num_hits
+                return hit_mask, hit_probas
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def store(self, version:str, row_hashes:np.ndarray, probas:np.ndarray):
+        try:
+            with self.lock:
+                if version == self.version:
+                    self._store(row_hashes, probas)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def stats(self) -> dict:
+        return {"version": self.version, "hits": self.hits, "misses": self.misses, "size": self._size()}
+
+
+class InMemoryPredictionCache(PredictionCache):
+
+    def __init__(self, max_size:int = 1_000_000):
+        super().__init__(max_size=max_size)
+        self.entries = OrderedDict()
+
+
+    def _reset(self, version:str):
+        self.entries.clear()
+
+
+    def _size(self) -> int:
+        return len(self.entries)
+
+
+    def _lookup(self, row_hashes:np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        hit_mask = np.zeros(len(row_hashes), dtype=bool)
+        hit_probas = []
+        for row_idx, row_hash in enumerate(row_hashes.tolist()):
+            proba = self.entries.get(row_hash)
+            if proba is not None:
+                self.entries.move_to_end(row_hash)
+                hit_mask[row_idx] = True
+                hit_probas.append(proba)
+        return hit_mask, stack_probas(hit_probas)
+
+
+    def _store(self, row_hashes:np.ndarray, probas:np.ndarray):
+        for row_hash, proba in zip(row_hashes.tolist(), probas):
+            self.entries[row_hash] = proba
+            self.entries.move_to_end(row_hash)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+class DiskPredictionCache(PredictionCache):
+    """
+    sqlite backed cache which survives restarts, recency is tracked with a monotonically increasing access counter
+    """
+
+    def __init__(self, cache_file_path:str = os.path.join("prediction_cache", "cache.sqlite"), max_size:int = 10_000_000):
+        super().__init__(max_size=max_size)
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_file_path)), exist_ok=True)
+            self.connection = sqlite3.connect(cache_file_path, check_same_thread=False)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS cache (row_hash INTEGER PRIMARY KEY, proba BLOB, last_access INTEGER)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)")
+            row = self.connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            self.version = row[0] if row is not None else None
+            self.access_counter = self.connection.execute("SELECT COALESCE(MAX(last_access), 0) FROM cache").fetchone()[0]
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def _reset(self, version:str):
+        with self.connection:
+            self.connection.execute("DELETE FROM cache")
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+
+
+    def _size(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+    def _lookup(self, row_hashes:np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # sqlite integers are signed 64 bit
+        signed_hashes = row_hashes.view(np.int64).tolist()
+        found = dict()
+        for chunk_start in range(0, len(signed_hashes), 500):
+            chunk = signed_hashes[chunk_start:chunk_start+500]
+            placeholders = ",".join("?"*len(chunk))
+            found.update(self.connection.execute(f"SELECT row_hash, proba FROM cache WHERE row_hash IN ({placeholders})", chunk))
+
+        self.access_counter += 1
+        with self.connection:
+            self.connection.executemany("UPDATE cache SET last_access = ? WHERE row_hash = ?",
+                                        [(self.access_counter, row_hash) for row_hash in found])
+
+        hit_mask = np.array([row_hash in found for row_hash in signed_hashes], dtype=bool)
+        hit_probas = [np.frombuffer(found[row_hash], dtype=np.float64) for row_hash in np.array(signed_hashes)[hit_mask].tolist()]
+        return hit_mask, stack_probas(hit_probas)
+
+
+    def _store(self, row_hashes:np.ndarray, probas:np.ndarray):
+        self.access_counter += 1
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+                                        [(row_hash, np.asarray(proba, dtype=np.float64).tobytes(), self.access_counter)
+                                         for row_hash, proba in zip(row_hashes.view(np.int64).tolist(), probas)])
+            excess = self._size() - self.max_size
+            if excess > 0:
+                self.connection.execute("DELETE FROM cache WHERE row_hash IN "
+                                        "(SELECT row_hash FROM cache ORDER BY last_access LIMIT ?)", (excess,))
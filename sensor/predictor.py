@@ -1,7 +1,23 @@
 import os, sys
-from sensor.entity.config_entity import TRANSFORMER_OBJECT_FILE_NAME, TARGET_ENCODER_OBJECT_FILE_NAME, MODEL_FILE_NAME
-from typing import Optional
+import time
+import threading
+from sensor.entity.config_entity import TRANSFORMER_OBJECT_FILE_NAME, TARGET_ENCODER_OBJECT_FILE_NAME, MODEL_FILE_NAME, REQUIRED_COLUMNS_FILE_NAME, REFERENCE_PROFILE_FILE_NAME
+from sensor.entity.config_entity import PARTITION_DIR_NAME, get_partition_dir_name
+from typing import Optional, List
+import numpy as np
+import pandas as pd
 from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.utils import load_object, get_file_hash, read_yaml_file
+from sensor.prediction_cache import PredictionCache, hash_feature_rows
+from sensor.resources import get_num_threads
+from sensor.tree_ensemble import CompiledTreeEnsemble
+from sensor.explainer import PredictionExplainer
+
+# Evaluators of the model trees, compiled trades XGBoost's per call setup for NumPy traversal
+EVALUATOR_XGBOOST = "xgboost"
+EVALUATOR_COMPILED = "compiled"
+EVALUATORS = [EVALUATOR_XGBOOST, EVALUATOR_COMPILED]
 
 
 class ModelResolver:
@@ -9,9 +25,14 @@ class ModelResolver:
     def __init__(self, model_registry:str = "saved_models",
                        transformer_dir_name = "transformer",
                        model_dir_name = "model",
-                       target_encoder_dir_name = "target_encoder"):
+                       target_encoder_dir_name = "target_encoder",
+                       partition = None):
         try:
+            # Every partition has its own version sequence below the registry
+            self.partition = partition
             self.model_registry = model_registry
+            if self.partition is not None:
+                self.model_registry = os.path.join(model_registry, PARTITION_DIR_NAME, get_partition_dir_name(self.partition))
             os.makedirs(self.model_registry, exist_ok=True)
             self.transformer_dir_name = transformer_dir_name
             self.model_dir_name = model_dir_name
@@ -21,12 +42,16 @@ class ModelResolver:
             raise SensorException(e, sys)
         
 
+    def get_version_names(self) -> List[int]:
+        # Versions being published are assembled under hidden temporary names and must be skipped
+        return [int(dir_name) for dir_name in os.listdir(self.model_registry) if dir_name.isdigit()]
+
+
     def get_latest_dir_path(self) -> Optional[str]:
         try:
-            dir_names = os.listdir(self.model_registry)
+            dir_names = self.get_version_names()
             if len(dir_names)==0:
                 return None
-            dir_names = list(map(int, dir_names))
             latest_dir_name = max(dir_names)
             return os.path.join(self.model_registry, f"{latest_dir_name}")
         
@@ -34,6 +59,57 @@ class ModelResolver:
             raise SensorException(e, sys)
         
 
+    def get_dir_paths(self, num_versions:Optional[int] = None) -> List[str]:
+        """
+        Return registry version directories ordered from latest to oldest
+        num_versions: limit on number of versions returned, None returns all
+        """
+        try:
+            dir_names = sorted(self.get_version_names(), reverse=True)
+            if num_versions is not None:
+                dir_names = dir_names[:num_versions]
+            return [os.path.join(self.model_registry, f"{dir_name}") for dir_name in dir_names]
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_model_path(self, dir_path:str) -> str:
+        return os.path.join(dir_path, self.model_dir_name, MODEL_FILE_NAME)
+
+
+    def get_transformer_path(self, dir_path:str) -> str:
+        return os.path.join(dir_path, self.transformer_dir_name, TRANSFORMER_OBJECT_FILE_NAME)
+
+
+    def get_target_encoder_path(self, dir_path:str) -> str:
+        return os.path.join(dir_path, self.target_encoder_dir_name, TARGET_ENCODER_OBJECT_FILE_NAME)
+
+
+    def get_required_columns_path(self, dir_path:str) -> str:
+        return os.path.join(dir_path, REQUIRED_COLUMNS_FILE_NAME)
+
+
+    def get_reference_profile_path(self, dir_path:str) -> str:
+        return os.path.join(dir_path, REFERENCE_PROFILE_FILE_NAME)
+
+
+    def get_required_columns(self, dir_path:Optional[str] = None) -> Optional[List[str]]:
+        """
+        Sensor columns the model of a version reads, recorded by pruned models
+        dir_path: version directory, the latest version when None
+        returns None when there is no version or it was trained on every column
+        """
+        try:
+            dir_path = dir_path if dir_path is not None else self.get_latest_dir_path()
+            if dir_path is None:
+                return None
+            return read_yaml_file(file_path=self.get_required_columns_path(dir_path)) or None
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
     def get_latest_model_path(self):
         try:
             latest_dir = self.get_latest_dir_path()
@@ -104,5 +180,159 @@ class ModelResolver:
         
         except Exception as e:
             raise SensorException(e, sys)
-        
-    
+
+
+class SensorModel:
+    """
+    Transformer, model and target encoder of one registry version loaded together for scoring
+    evaluator: xgboost scores with the booster, compiled with the trees exported to NumPy arrays,
+               which has far lower latency for single rows and small batches
+    explainer: adds the top contributing sensors of positive and near threshold rows to the predictions
+    """
+
+    def __init__(self, model_resolver:ModelResolver, version_dir:Optional[str] = None,
+                 prediction_cache:Optional[PredictionCache] = None, n_jobs:Optional[int] = None,
+                 evaluator:str = EVALUATOR_XGBOOST, explainer:Optional[PredictionExplainer] = None):
+        try:
+            self.version_dir = version_dir if version_dir is not None else model_resolver.get_latest_dir_path()
+            if self.version_dir is None:
+                raise Exception("Model is not available")
+
+            logging.info(f"Loading Transformer, Model and Target Encoder from: {self.version_dir}")
+            self.version = os.path.basename(self.version_dir)
+            self.transformer = load_object(file_path=model_resolver.get_transformer_path(self.version_dir))
+            self.model = load_object(file_path=model_resolver.get_model_path(self.version_dir))
+            # The pickled model keeps the thread count of the training host
+            self.model.set_params(n_jobs=n_jobs if n_jobs is not None else get_num_threads())
+            # Kept for explanations, which need the booster whichever evaluator scores
+            self.xgb_model = self.model
+            if evaluator not in EVALUATORS:
+                raise Exception(f"Unknown evaluator: {evaluator}, expected one of {EVALUATORS}")
+            self.evaluator = evaluator
+            if self.evaluator == EVALUATOR_COMPILED:
+                # Same predict and predict_proba interface, so the scoring paths below do not change
+                self.model = CompiledTreeEnsemble.from_xgb_classifier(self.model)
+            self.target_encoder = load_object(file_path=model_resolver.get_target_encoder_path(self.version_dir))
+            self.input_feature_name = list(self.transformer.feature_names_in_)
+            # Pruned versions record the columns they read, scoring reads project to them
+            required_columns = model_resolver.get_required_columns(self.version_dir)
+            if required_columns is not None:
+                if list(required_columns) != self.input_feature_name:
+                    raise Exception(f"Required columns of version {self.version_dir} do not match its transformer inputs")
+                self.input_feature_name = list(required_columns)
+            # Columns never observed in training are dropped by the imputer, so the model sees fewer features
+            self.transformed_feature_name = list(self.transformer.get_feature_names_out())
+            self.explainer = explainer
+            # Registry numbers can be reused after a registry reset, so cached results are keyed by content as well
+            self.fingerprint = f"{self.version}-{get_file_hash(model_resolver.get_model_path(self.version_dir))[:16]}"
+            self.prediction_cache = prediction_cache
+            # Versions pushed before drift monitoring have no reference profile
+            self.reference_profile = read_yaml_file(file_path=model_resolver.get_reference_profile_path(self.version_dir)) or None
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def predict(self, df:pd.DataFrame, include_proba:bool = False) -> pd.DataFrame:
+        """
+        Score a raw sensor DataFrame, "na" values are treated as missing
+        include_proba: add a proba_<class> column per target class from predict_proba
+        =====================================================================================
+        returns Pandas DataFrame with prediction and cat_pred columns aligned to df index, followed by
+        top_sensor_<rank> and top_contribution_<rank> columns when the model has an explainer
+        """
+        try:
+            input_df = df[self.input_feature_name].replace(to_replace="na", value=np.nan)
+
+            if self.prediction_cache is not None:
+                proba = self.predict_proba_cached(input_df)
+                prediction = proba.argmax(axis=1)
+            elif include_proba or self.explainer is not None:
+                proba = self.model.predict_proba(self.transformer.transform(input_df))
+                prediction = proba.argmax(axis=1)
+            else:
+                prediction = self.model.predict(self.transformer.transform(input_df))
+            cat_pred = self.target_encoder.inverse_transform(prediction)
+
+            prediction_df = pd.DataFrame({"prediction": prediction, "cat_pred": cat_pred}, index=df.index)
+            if self.explainer is not None:
+                prediction_df = pd.concat([prediction_df, self.explainer.explain(self, input_df, proba)], axis=1)
+            if include_proba:
+                for class_idx, class_name in enumerate(self.target_encoder.classes_):
+                    prediction_df[f"proba_{class_name}"] = proba[:, class_idx]
+            return prediction_df
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def predict_proba_cached(self, input_df:pd.DataFrame) -> np.ndarray:
+        """
+        Class probabilities where only rows missing from the prediction cache go through the
+        transformer and model, identical rows within the batch are scored once
+        """
+        try:
+            row_hashes = hash_feature_rows(input_df)
+            hit_mask, hit_probas = self.prediction_cache.lookup(version=self.fingerprint, row_hashes=row_hashes)
+
+            proba = np.empty((len(input_df), len(self.target_encoder.classes_)))
+            if hit_mask.any():
+                proba[hit_mask] = hit_probas
+
+            miss_idx = np.flatnonzero(~hit_mask)
+            if len(miss_idx) > 0:
+                unique_hashes, first_idx, inverse = np.unique(row_hashes[miss_idx], return_index=True, return_inverse=True)
+                unique_input_df = input_df.iloc[miss_idx[first_idx]]
+                unique_proba = self.model.predict_proba(self.transformer.transform(unique_input_df))
+                proba[miss_idx] = unique_proba[inverse.reshape(-1)]
+                self.prediction_cache.store(version=self.fingerprint, row_hashes=unique_hashes, probas=unique_proba)
+
+            logging.info("Prediction cache stats", extra={"prediction_cache": self.prediction_cache.stats()})
+            return proba
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+class WarmModel:
+    """
+    Keeps the latest registry version resident and reloads it only when a newer version is published
+    The registry is checked at most once every check_interval_sec seconds
+    """
+
+    def __init__(self, model_resolver:ModelResolver, check_interval_sec:float = 5,
+                 prediction_cache:Optional[PredictionCache] = None, n_jobs:Optional[int] = None,
+                 evaluator:str = EVALUATOR_XGBOOST, explainer:Optional[PredictionExplainer] = None):
+        try:
+            self.model_resolver = model_resolver
+            self.prediction_cache = prediction_cache
+            self.n_jobs = n_jobs
+            self.evaluator = evaluator
+            self.explainer = explainer
+            self.check_interval_sec = check_interval_sec
+            self.sensor_model = None
+            self.last_check_time = 0
+            self.lock = threading.Lock()
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get(self) -> SensorModel:
+        try:
+            if self.sensor_model is not None and time.monotonic() - self.last_check_time < self.check_interval_sec:
+                return self.sensor_model
+
+            with self.lock:
+                latest_dir_path = self.model_resolver.get_latest_dir_path()
+                self.last_check_time = time.monotonic()
+                if self.sensor_model is None or latest_dir_path != self.sensor_model.version_dir:
+                    logging.info(f"Registry version changed, loading: {latest_dir_path}")
+                    self.sensor_model = SensorModel(model_resolver=self.model_resolver, version_dir=latest_dir_path,
+                                                    prediction_cache=self.prediction_cache, n_jobs=self.n_jobs,
+                                                    evaluator=self.evaluator, explainer=self.explainer)
+
+            return self.sensor_model
+
+        except Exception as e:
+            raise SensorException(e, sys)
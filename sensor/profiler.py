@@ -0,0 +1,150 @@
+import os, sys
+import time
+import cProfile
+from contextlib import contextmanager
+from typing import Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.utils import write_yaml_file
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PROC_SELF_IO = "/proc/self/io"
+PROC_SELF_STATUS = "/proc/self/status"
+PROC_SELF_CLEAR_REFS = "/proc/self/clear_refs"
+
+# Stages currently being measured, innermost last, used by record_rows
+_active_stages = []
+
+
+def get_io_counters() -> dict:
+    """
+    Return bytes read and written by this process so far, empty when the platform does not expose them
+    """
+    try:
+        with open(PROC_SELF_IO) as io_file:
+            counters = dict(line.split(":") for line in io_file.read().splitlines())
+        return {"bytes_read": int(counters["rchar"]), "bytes_written": int(counters["wchar"])}
+    except (OSError, KeyError, ValueError):
+        return dict()
+
+
+def reset_peak_rss() -> bool:
+    """
+    Reset the kernel high water mark of resident memory so the next reading is per stage
+    """
+    try:
+        with open(PROC_SELF_CLEAR_REFS, "w") as clear_refs_file:
+            clear_refs_file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    try:
+        with open(PROC_SELF_STATUS) as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    if resource is None:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024*1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+def record_rows(num_rows:int):
+    """
+    Add num_rows to the rows processed by the currently measured stage, no-op outside a stage
+    """
+    if len(_active_stages) > 0:
+        stage_profile = _active_stages[-1]
+        stage_profile["rows_processed"] = stage_profile.get("rows_processed", 0) + int(num_rows)
+
+
+class RunProfiler:
+    """
+    Collects wall time, cpu time, peak rss, rows processed and bytes read and
+    written for every stage of a run and writes them as a yaml run profile
+    """
+
+    def __init__(self, profile_file_path:str, cprofile_dir:Optional[str] = None):
+        try:
+            self.profile_file_path = profile_file_path
+            self.cprofile_dir = cprofile_dir
+            self.stages = dict()
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    @contextmanager
+    def stage(self, stage_name:str):
+        stage_profile = {"rows_processed": 0}
+        peak_rss_resettable = reset_peak_rss()
+        io_start = get_io_counters()
+        profiler = cProfile.Profile() if self.cprofile_dir is not None else None
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        _active_stages.append(stage_profile)
+
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield stage_profile
+            stage_profile["status"] = "success"
+        except BaseException:
+            stage_profile["status"] = "failed"
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            _active_stages.remove(stage_profile)
+
+            stage_profile["wall_time_sec"] = time.perf_counter() - wall_start
+            stage_profile["cpu_time_sec"] = time.process_time() - cpu_start
+            stage_profile["peak_rss_mb"] = get_peak_rss_mb()
+            stage_profile["peak_rss_scope"] = "stage" if peak_rss_resettable else "process"
+            io_end = get_io_counters()
+            for key, value in io_end.items():
+                stage_profile[key] = value - io_start[key]
+
+            if profiler is not None:
+                os.makedirs(self.cprofile_dir, exist_ok=True)
+                cprofile_file_path = os.path.join(self.cprofile_dir, f"{stage_name}.prof")
+                profiler.dump_stats(cprofile_file_path)
+                stage_profile["cprofile_file_path"] = cprofile_file_path
+
+            self.stages[stage_name] = stage_profile
+            logging.info("Stage profile %s", stage_name, extra={"stage_profile": dict(stage_profile)})
+
+
+    def format_stage_times(self) -> str:
+        """
+        Wall and cpu time of every measured stage as a table, in the order the stages ran
+        """
+        lines = [f"{'stage':<22} {'status':>8} {'wall s':>8} {'cpu s':>8} {'rows':>10}"]
+        for stage_name, stage_profile in self.stages.items():
+            lines.append(f"{stage_name:<22} {stage_profile['status']:>8} {stage_profile['wall_time_sec']:>8.2f} "
+                         f"{stage_profile['cpu_time_sec']:>8.2f} {stage_profile['rows_processed']:>10}")
+        lines.append(f"{'total':<22} {'':>8} {sum(stage['wall_time_sec'] for stage in self.stages.values()):>8.2f}")
+        return "\n".join(lines)
+
+
+    def write(self) -> str:
+        try:
+            run_profile = {
+                "total_wall_time_sec": sum(stage["wall_time_sec"] for stage in self.stages.values()),
+                "stages": self.stages}
+            write_yaml_file(file_path=self.profile_file_path, data=run_profile)
+            logging.info(f"Run profile written to: {self.profile_file_path}")
+            return self.profile_file_path
+
+        except Exception as e:
+            raise SensorException(e, sys)
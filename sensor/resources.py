@@ -0,0 +1,128 @@
+"""
+Runtime CPU budget of the process
+
+XGBoost, the BLAS/OpenMP runtimes behind NumPy and scikit-learn's neighbour searches each
+default to one thread per core. Several trainings or scorers on one host then run many
+times more threads than cores. Entry points call configure_process once and every
+component asks get_num_threads for its n_jobs instead of picking its own.
+
+Environment:
+    SENSOR_NUM_THREADS: threads per process, overrides the computed budget
+    SENSOR_NUM_PROCESSES: processes expected to share the host, the cores are divided between them
+"""
+import os, sys
+import multiprocessing
+from typing import Optional, List
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+NUM_THREADS_ENV = "SENSOR_NUM_THREADS"
+NUM_PROCESSES_ENV = "SENSOR_NUM_PROCESSES"
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "BLIS_NUM_THREADS",
+                   "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+_num_threads = None
+_threadpool_limiter = None
+
+
+def get_available_cpus() -> List[int]:
+    """
+    Cores this process may run on, respects cpusets and affinity set by the parent
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def get_default_num_threads() -> int:
+    if os.getenv(NUM_THREADS_ENV):
+        return max(1, int(os.getenv(NUM_THREADS_ENV)))
+    num_processes = max(1, int(os.getenv(NUM_PROCESSES_ENV, "1")))
+    return max(1, len(get_available_cpus()) // num_processes)
+
+
+def get_num_threads() -> int:
+    """
+    Thread budget of this process, used as n_jobs by every component
+    """
+    return _num_threads if _num_threads is not None else get_default_num_threads()
+
+
+def configure_process(num_threads:Optional[int] = None, cpus:Optional[List[int]] = None) -> int:
+    """
+    Apply the thread budget to this process and the processes it starts
+    num_threads: threads for this process, the environment or core count decides when None
+    cpus: cores to pin this process to, where the platform supports affinity
+    =====================================================================================
+    return: thread budget in effect
+    """
+    global _num_threads, _threadpool_limiter
+    try:
+        if cpus is not None and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cpus)
+            if num_threads is None:
+                num_threads = len(cpus)
+
+        _num_threads = num_threads if num_threads is not None else get_default_num_threads()
+
+        # Read by BLAS/OpenMP runtimes that are not loaded yet and inherited by child processes
+        for env_var in THREAD_ENV_VARS:
+            os.environ[env_var] = str(_num_threads)
+        os.environ[NUM_THREADS_ENV] = str(_num_threads)
+
+        # Runtimes already loaded by NumPy, scikit-learn or XGBoost are resized in place
+        if threadpool_limits is not None:
+            _threadpool_limiter = threadpool_limits(limits=_num_threads)
+
+        logging.info(f"Process {os.getpid()} thread budget: {_num_threads}, cpus: {get_available_cpus()}")
+        return _num_threads
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def split_cpus(num_workers:int, cpus:Optional[List[int]] = None) -> List[List[int]]:
+    """
+    Divide the cores into num_workers disjoint groups, workers share cores when there are fewer cores than workers
+    """
+    cpus = cpus if cpus is not None else get_available_cpus()
+    if num_workers >= len(cpus):
+        return [[cpus[worker_idx % len(cpus)]] for worker_idx in range(num_workers)]
+    return [cpus[worker_idx::num_workers] for worker_idx in range(num_workers)]
+
+
+class WorkerResources:
+    """
+    Process pool initializer which hands every worker its own group of cores and a matching thread budget
+
+    Usage:
+        mp_context = multiprocessing.get_context("spawn")
+        worker_resources = WorkerResources(num_workers=4, mp_context=mp_context)
+        ProcessPoolExecutor(max_workers=4, mp_context=mp_context, initializer=worker_resources.initialize)
+    """
+
+    def __init__(self, num_workers:int, pin:bool = True, mp_context = None):
+        try:
+            self.num_workers = num_workers
+            self.pin = pin
+            self.cpu_groups = split_cpus(num_workers)
+            # Shared with the workers when they are started, so it must come from the pool's context
+            self.worker_counter = (mp_context or multiprocessing.get_context()).Value("i", 0)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def initialize(self):
+        with self.worker_counter.get_lock():
+            worker_idx = self.worker_counter.value
+            self.worker_counter.value += 1
+        # Replacement workers of pools with max_tasks_per_child reuse the groups round robin
+        cpu_group = self.cpu_groups[worker_idx % self.num_workers]
+        configure_process(num_threads=len(cpu_group), cpus=cpu_group if self.pin else None)
+
@@ -0,0 +1,359 @@
+"""
+Scoring worker processes sharing one loaded model
+
+Workers are forked by a supervisor process, which is spawned when the pool is created and runs no
+threads while it forks. A worker therefore never inherits a lock another thread held at fork time,
+such as a logging handler lock or OpenMP state of the daemon's request threads. For every registry
+version the supervisor loads the model once and forks the workers afterwards, so the transformer, the
+booster and the encoder are inherited copy-on-write instead of being unpickled again in every worker.
+The parent sends input batches to every worker over its own Unix socket and receives the predictions.
+Forking needs a POSIX platform.
+"""
+import os, sys
+import gc
+import time
+import atexit
+import uuid
+import queue
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Optional
+import pandas as pd
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor import logger as sensor_logger
+from sensor.predictor import ModelResolver, SensorModel, WarmModel, EVALUATOR_XGBOOST
+from sensor.explainer import PredictionExplainer
+from sensor.resources import WorkerResources, get_num_threads
+
+POOL_BATCH_SIZE = 50_000
+WORKER_START_TIMEOUT_SEC = 60
+# How often a batch waiting for an idle worker checks whether any healthy worker is left
+IDLE_WAIT_SEC = 1
+
+# Model of the workers being forked, set by the supervisor right before forking and inherited by the workers
+_sensor_model = None
+
+
+def run_worker(address:str, ready_conn, worker_resources:WorkerResources):
+    """
+    Serve one connection from the pool's parent: receive (batch, include_proba), send back ("ok", predictions)
+    or ("error", message), and exit once the parent closes the connection
+    """
+    worker_resources.initialize()
+    listener = Listener(address, family="AF_UNIX", authkey=multiprocessing.current_process().authkey)
+    ready_conn.send(address)
+    ready_conn.close()
+    conn = listener.accept()
+    listener.close()
+
+    while True:
+        try:
+            batch_df, include_proba = conn.recv()
+        except EOFError:
+            break
+        try:
+            conn.send(("ok", _sensor_model.predict(batch_df, include_proba=include_proba)))
+        except Exception as e:
+            conn.send(("error", str(SensorException(e, sys))))
+    conn.close()
+
+
+def fork_workers(sensor_model:SensorModel, num_workers:int, socket_dir:str, worker_resources:WorkerResources,
+                 mp_context) -> list:
+    """
+    Fork num_workers workers of sensor_model, called in the supervisor only
+    returns list of socket addresses the workers listen on
+    """
+    global _sensor_model
+    try:
+        _sensor_model = sensor_model
+        # Objects alive now are moved out of the collector's reach, so collections in the workers
+        # do not write to, and thereby copy, the pages holding the model. Unfreezing first lets
+        # the model of a previous version be collected
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+
+        # The log writer is the supervisor's only other thread, it is stopped so no lock is held while forking
+        sensor_logger.log_listener.stop()
+        try:
+            if threading.active_count() > 1:
+                raise Exception(f"Scoring supervisor must be single threaded to fork workers, running: {threading.enumerate()}")
+            ready_conns = []
+            for _ in range(num_workers):
+                address = os.path.join(socket_dir, f"worker-{uuid.uuid4().hex[:12]}.sock")
+                ready_conn, worker_ready_conn = mp_context.Pipe(duplex=False)
+                worker = mp_context.Process(target=run_worker, args=(address, worker_ready_conn, worker_resources), daemon=True)
+                worker.start()
+                worker_ready_conn.close()
+                ready_conns.append(ready_conn)
+        finally:
+            sensor_logger.start_listener()
+            _sensor_model = None
+
+        addresses = []
+        for ready_conn in ready_conns:
+            if not ready_conn.poll(WORKER_START_TIMEOUT_SEC):
+                raise Exception(f"Scoring worker did not start within {WORKER_START_TIMEOUT_SEC} sec")
+            addresses.append(ready_conn.recv())
+            ready_conn.close()
+        return addresses
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def run_supervisor(conn, model_resolver:ModelResolver, num_workers:int, evaluator:str, pin_workers:bool,
+                   explain_top_n:Optional[int], explain_near_threshold:Optional[float]):
+    """
+    Spawned supervisor loop: for every ("start", version_dir) command load the version, fork a new set of
+    workers and reply ("started", addresses) or ("error", message), until ("stop",) or the parent exits
+    """
+    socket_dir = tempfile.mkdtemp(prefix="aps_scoring_pool_")
+    mp_context = multiprocessing.get_context("fork")
+    worker_resources = WorkerResources(num_workers=num_workers, pin=pin_workers, mp_context=mp_context)
+    # Explanations are rare enough for every worker to keep its own explanation cache
+    explainer = None
+    if explain_top_n is not None:
+        explainer = PredictionExplainer(top_n=explain_top_n, near_threshold=explain_near_threshold)
+
+    try:
+        while True:
+            try:
+                command = conn.recv()
+            except EOFError:
+                break
+            # Workers of earlier versions exit once the parent closes their connections, this reaps them
+            multiprocessing.active_children()
+            if command[0] == "stop":
+                break
+
+            try:
+                start_time = time.perf_counter()
+                # No prediction cache, a cache filled inside one worker would not be seen by the others
+                sensor_model = SensorModel(model_resolver=model_resolver, version_dir=command[1],
+                                           n_jobs=max(1, get_num_threads() // num_workers), evaluator=evaluator,
+                                           explainer=explainer)
+                addresses = fork_workers(sensor_model=sensor_model, num_workers=num_workers, socket_dir=socket_dir,
+                                         worker_resources=worker_resources, mp_context=mp_context)
+                del sensor_model
+                logging.info(f"Forked {num_workers} scoring workers for version {command[1]} "
+                             f"in {time.perf_counter() - start_time:.3f} sec")
+                conn.send(("started", addresses))
+            except Exception as e:
+                conn.send(("error", str(SensorException(e, sys))))
+
+        for worker in multiprocessing.active_children():
+            worker.join()
+    finally:
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+class PooledSensorModel:
+    """
+    Scores with the worker processes of one model version, everything else is read from the parent's SensorModel,
+    so it can stand in for a SensorModel in predict_file and DriftMonitor.update
+    """
+
+    def __init__(self, sensor_model:SensorModel, addresses:list, batch_size:int = POOL_BATCH_SIZE):
+        try:
+            self.sensor_model = sensor_model
+            self.batch_size = batch_size
+            self.version_dir = sensor_model.version_dir
+            self.version = sensor_model.version
+            self.fingerprint = sensor_model.fingerprint
+            self.input_feature_name = sensor_model.input_feature_name
+            self.reference_profile = sensor_model.reference_profile
+            # Every connection serves one batch at a time, idle ones wait in the queue
+            self.idle_conns = queue.Queue()
+            for address in addresses:
+                self.idle_conns.put(Client(address, family="AF_UNIX", authkey=multiprocessing.current_process().authkey))
+            self.executor = ThreadPoolExecutor(max_workers=len(addresses))
+            self.num_workers = len(addresses)
+            # Connections which failed are closed and not replaced, ScoringPool.get forks a new set of workers
+            self.num_failed = 0
+            # Once closed, the connections are released when the last running predict call returns
+            self.num_running = 0
+            self.closed = False
+            self.released = False
+            self.lock = threading.Lock()
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_idle_conn(self):
+        while True:
+            with self.lock:
+                if self.num_failed == self.num_workers:
+                    raise Exception(f"All {self.num_workers} scoring workers of version {self.version} failed")
+                if self.released:
+                    raise Exception(f"Scoring workers of version {self.version} are closed")
+            try:
+                return self.idle_conns.get(timeout=IDLE_WAIT_SEC)
+            except queue.Empty:
+                continue
+
+
+    def predict_batch(self, batch_df:pd.DataFrame, include_proba:bool) -> pd.DataFrame:
+        conn = self.get_idle_conn()
+        is_healthy = False
+        try:
+            conn.send((batch_df, include_proba))
+            status, result = conn.recv()
+            is_healthy = True
+        finally:
+            with self.lock:
+                if not is_healthy:
+                    self.num_failed += 1
+                    logging.error(f"Scoring worker of version {self.version} failed, "
+                                  f"{self.num_workers - self.num_failed} of {self.num_workers} workers left")
+                if is_healthy and not self.released:
+                    self.idle_conns.put(conn)
+                else:
+                    conn.close()
+        if status != "ok":
+            raise Exception(result)
+        return result
+
+
+    def predict(self, df:pd.DataFrame, include_proba:bool = False) -> pd.DataFrame:
+        """
+        Split df into batches of batch_size rows, score them on the workers and return the predictions in df order
+        """
+        try:
+            with self.lock:
+                if self.released:
+                    raise Exception(f"Scoring workers of version {self.version} are closed")
+                self.num_running += 1
+            try:
+                # Only the model inputs are sent to the workers
+                input_df = df[self.input_feature_name]
+                futures = [self.executor.submit(self.predict_batch, input_df.iloc[batch_start:batch_start+self.batch_size], include_proba)
+                           for batch_start in range(0, max(len(input_df), 1), self.batch_size)]
+                # Every batch has returned its connection before the call ends, also when one of them failed
+                wait(futures)
+                return pd.concat([future.result() for future in futures])
+            finally:
+                with self.lock:
+                    self.num_running -= 1
+                    if self.closed and self.num_running == 0 and not self.released:
+                        self.release()
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def release(self):
+        # Called with the lock held, the workers exit when their connection closes
+        self.released = True
+        while not self.idle_conns.empty():
+            self.idle_conns.get().close()
+        self.executor.shutdown(wait=False)
+
+
+    def close(self):
+        """
+        Release the workers once the predict calls already running have returned
+        """
+        with self.lock:
+            self.closed = True
+            if self.num_running == 0 and not self.released:
+                self.release()
+
+
+class ScoringPool:
+    """
+    Keeps num_workers scoring processes serving the latest registry version
+    A newly published version is loaded once by the supervisor and a new set of workers is forked from it,
+    the previous workers finish the batches they already received and exit. A set in which a worker failed
+    is replaced the same way on the next get.
+
+    The parent also keeps the version loaded, single threaded, in a WarmModel: it detects new versions
+    and provides the input columns, fingerprint and reference profile predict_file and DriftMonitor read.
+    This is one more copy of the model besides the supervisor's, which the workers share copy-on-write.
+
+    Usage:
+        scoring_pool = ScoringPool(model_resolver=ModelResolver(), num_workers=4)
+        prediction_df = scoring_pool.get().predict(df)
+        scoring_pool.close()
+    """
+
+    def __init__(self, model_resolver:ModelResolver, num_workers:int = 2, check_interval_sec:float = 5,
+                 batch_size:int = POOL_BATCH_SIZE, evaluator:str = EVALUATOR_XGBOOST, pin_workers:bool = True,
+                 explainer:Optional[PredictionExplainer] = None):
+        try:
+            self.num_workers = num_workers
+            self.batch_size = batch_size
+            # The parent keeps the version resident to detect new versions and describe the pooled model
+            self.warm_model = WarmModel(model_resolver=model_resolver, check_interval_sec=check_interval_sec,
+                                        n_jobs=1, evaluator=evaluator)
+            self.pooled_model = None
+            self.lock = threading.Lock()
+
+            # Spawned, so the supervisor starts from a fresh interpreter whatever threads the caller runs.
+            # Explainer caches hold locks, only the explainer settings are passed
+            mp_context = multiprocessing.get_context("spawn")
+            self.supervisor_conn, supervisor_conn = mp_context.Pipe()
+            # Not daemonic, daemonic processes may not fork workers. It is stopped at exit at the latest
+            self.supervisor = mp_context.Process(target=run_supervisor,
+                                                 args=(supervisor_conn, model_resolver, num_workers, evaluator, pin_workers,
+                                                       explainer.top_n if explainer is not None else None,
+                                                       explainer.near_threshold if explainer is not None else None))
+            self.supervisor.start()
+            supervisor_conn.close()
+            atexit.register(self.close)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def start_workers(self, sensor_model:SensorModel) -> PooledSensorModel:
+        try:
+            self.supervisor_conn.send(("start", sensor_model.version_dir))
+            status, result = self.supervisor_conn.recv()
+            if status != "started":
+                raise Exception(result)
+            return PooledSensorModel(sensor_model=sensor_model, addresses=result, batch_size=self.batch_size)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def is_current(self, sensor_model:SensorModel) -> bool:
+        return (self.pooled_model is not None and self.pooled_model.sensor_model is sensor_model
+                and self.pooled_model.num_failed == 0)
+
+
+    def get(self) -> PooledSensorModel:
+        try:
+            sensor_model = self.warm_model.get()
+            if self.is_current(sensor_model):
+                return self.pooled_model
+
+            with self.lock:
+                if not self.is_current(sensor_model):
+                    previous_pooled_model = self.pooled_model
+                    self.pooled_model = self.start_workers(sensor_model)
+                    if previous_pooled_model is not None:
+                        previous_pooled_model.close()
+            return self.pooled_model
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def close(self):
+        if self.pooled_model is not None:
+            self.pooled_model.close()
+            self.pooled_model = None
+        if not self.supervisor_conn.closed:
+            if self.supervisor.is_alive():
+                self.supervisor_conn.send(("stop",))
+                self.supervisor.join()
+            self.supervisor_conn.close()
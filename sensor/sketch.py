@@ -0,0 +1,143 @@
+import sys
+import warnings
+import numpy as np
+from typing import Iterable, Optional
+from sensor.exception import SensorException
+
+
+class QuantileSketch:
+    """
+    Mergeable per column quantile summary
+    Each column keeps sketch_size weighted points which split its observed values into
+    equal weight intervals. Merging concatenates the points of both summaries and
+    compresses them back to sketch_size points, so the rank error stays around
+    1/sketch_size per level of merging and chunks can be sketched in any order or in parallel
+    """
+
+    def __init__(self, num_columns:int, sketch_size:int = 1000):
+        try:
+            self.num_columns = num_columns
+            self.sketch_size = sketch_size
+            self.values = np.empty((0, num_columns))
+            self.weights = np.empty((0, num_columns))
+            self.count = np.zeros(num_columns)
+            self.min = np.full(num_columns, np.inf)
+            self.max = np.full(num_columns, -np.inf)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    @classmethod
+    def from_array(cls, arr:np.ndarray, sketch_size:int = 1000) -> "QuantileSketch":
+        """
+        Sketch a 2d array column by column, NaN values are ignored
+        """
+        try:
+            arr = np.asarray(arr, dtype=np.float64)
+            sketch = cls(num_columns=arr.shape[1], sketch_size=sketch_size)
+            sketch.count = np.sum(~np.isnan(arr), axis=0).astype(np.float64)
+            observed = sketch.count > 0
+            if not observed.any():
+                return sketch
+
+            sketch.min[observed] = np.nanmin(arr[:, observed], axis=0)
+            sketch.max[observed] = np.nanmax(arr[:, observed], axis=0)
+
+            if arr.shape[0] <= sketch_size:
+                # Small chunks are kept exactly, NaN values sort last and get no weight
+                sketch.values = np.sort(arr, axis=0)
+                sketch.weights = (np.arange(arr.shape[0])[:, None] < sketch.count).astype(np.float64)
+            else:
+                # Midpoints of sketch_size equal weight intervals
+                probs = (np.arange(sketch_size) + 0.5) / sketch_size
+                with warnings.catch_warnings():
+                    # Columns without observations give NaN here and receive zero weight
+                    warnings.simplefilter("ignore", RuntimeWarning)
+                    sketch.values = np.nanquantile(arr, probs, axis=0)
+                sketch.weights = np.broadcast_to(sketch.count / sketch_size, sketch.values.shape).copy()
+
+            sketch.values = np.nan_to_num(sketch.values, nan=0.0)
+            return sketch
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def merge(self, other:"QuantileSketch") -> "QuantileSketch":
+        try:
+            merged = QuantileSketch(num_columns=self.num_columns, sketch_size=self.sketch_size)
+            merged.count = self.count + other.count
+            merged.min = np.minimum(self.min, other.min)
+            merged.max = np.maximum(self.max, other.max)
+
+            values = np.concatenate([self.values, other.values])
+            weights = np.concatenate([self.weights, other.weights])
+            order = np.argsort(values, axis=0, kind="stable")
+            values = np.take_along_axis(values, order, axis=0)
+            weights = np.take_along_axis(weights, order, axis=0)
+
+            if values.shape[0] <= self.sketch_size:
+                merged.values, merged.weights = values, weights
+                return merged
+
+            probs = (np.arange(self.sketch_size) + 0.5) / self.sketch_size
+            merged.values = np.empty((self.sketch_size, self.num_columns))
+            for column_idx in range(self.num_columns):
+                merged.values[:, column_idx] = self._interpolate(values[:, column_idx], weights[:, column_idx], probs)
+            merged.weights = np.broadcast_to(merged.count / self.sketch_size, merged.values.shape).copy()
+            return merged
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    @staticmethod
+    def _interpolate(values:np.ndarray, weights:np.ndarray, probs:np.ndarray) -> np.ndarray:
+        keep = weights > 0
+        values, weights = values[keep], weights[keep]
+        total_weight = weights.sum()
+        if total_weight == 0:
+            return np.zeros(len(probs))
+        # Every point represents the centre of its weight interval
+        cumulative = (np.cumsum(weights) - weights/2) / total_weight
+        return np.interp(probs, cumulative, values)
+
+
+    def quantile(self, probs) -> np.ndarray:
+        """
+        Estimate quantiles of every column, probs in [0, 1]
+        return: array of shape (len(probs), num_columns), NaN for columns without observations
+        """
+        try:
+            probs = np.atleast_1d(np.asarray(probs, dtype=np.float64))
+            result = np.full((len(probs), self.num_columns), np.nan)
+            for column_idx in range(self.num_columns):
+                if self.count[column_idx] == 0:
+                    continue
+                values = np.concatenate([[self.min[column_idx]], self.values[:, column_idx], [self.max[column_idx]]])
+                weights = self.weights[:, column_idx]
+                cumulative = np.concatenate([[0.0], (np.cumsum(weights) - weights/2) / weights.sum(), [1.0]])
+                keep = np.concatenate([[True], weights > 0, [True]])
+                result[:, column_idx] = np.interp(probs, cumulative[keep], values[keep])
+            return result
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+def merge_sketches(sketches:Iterable[QuantileSketch]) -> Optional[QuantileSketch]:
+    """
+    Merge sketches pairwise as a balanced tree so every point goes through few compressions
+    """
+    try:
+        sketches = list(sketches)
+        if len(sketches)==0:
+            return None
+        while len(sketches) > 1:
+            sketches = [sketches[idx].merge(sketches[idx+1]) if idx+1 < len(sketches) else sketches[idx]
+                        for idx in range(0, len(sketches), 2)]
+        return sketches[0]
+
+    except Exception as e:
+        raise SensorException(e, sys)
@@ -0,0 +1,167 @@
+"""
+XGBoost tree ensemble compiled to flat NumPy node arrays
+
+Small batches spend most of XGBClassifier.predict in DMatrix construction and input
+validation. The compiled ensemble walks every tree for every row with a few array
+operations per tree level and has almost no fixed cost per call.
+"""
+import sys
+import json
+import numpy as np
+from sensor.exception import SensorException
+
+SUPPORTED_OBJECTIVE = "binary:logistic"
+BLOCK_SIZE = 4096
+# Margins agree with the booster's within this absolute plus relative tolerance, the order in which
+# XGBoost adds leaves in float32 depends on its version and build, so a few ulps can differ
+MARGIN_ATOL = 1e-5
+MARGIN_RTOL = 1e-6
+
+
+class CompiledTreeEnsemble:
+    """
+    Binary XGBClassifier exported to one array per node attribute, nodes of all trees are numbered globally
+    Leaves point to themselves, so every row takes max_depth steps and needs no per-row stopping test.
+
+    Inputs are compared in float32 and leaf values are added tree by tree in float32, as XGBoost does, so
+    splits are taken identically and margins agree within MARGIN_ATOL + MARGIN_RTOL * |margin|. They are
+    often bit identical, but not guaranteed to be: XGBoost builds may add leaves in another order. Predicted
+    classes can therefore only differ for rows whose margin lies within that tolerance of zero, a positive
+    class probability of 0.5.
+    """
+
+    def __init__(self, left_children:np.ndarray, right_children:np.ndarray, split_indices:np.ndarray,
+                 split_conditions:np.ndarray, default_left:np.ndarray, tree_roots:np.ndarray,
+                 max_depth:int, base_margin:np.float32, num_features:int, block_size:int = BLOCK_SIZE):
+        # Left and right child of node i sit at 2*i and 2*i+1, so a step is a single lookup
+        self.children = np.stack([left_children, right_children], axis=1).ravel().astype(np.intp)
+        self.split_indices = split_indices.astype(np.intp)
+        self.split_conditions = split_conditions
+        self.default_left = default_left
+        self.tree_roots = tree_roots.astype(np.intp)
+        self.max_depth = max_depth
+        self.base_margin = base_margin
+        self.num_features = num_features
+        self.block_size = block_size
+
+
+    @classmethod
+    def from_xgb_classifier(cls, model, block_size:int = BLOCK_SIZE):
+        """
+        Export the trees XGBClassifier.predict would use, up to best_iteration when early stopping was used
+        """
+        try:
+            model_json = json.loads(model.get_booster().save_raw(raw_format="json"))
+            learner = model_json["learner"]
+            if learner["objective"]["name"] != SUPPORTED_OBJECTIVE or learner["gradient_booster"]["name"] != "gbtree":
+                raise Exception(f"Only gbtree models with {SUPPORTED_OBJECTIVE} objective can be compiled, "
+                                f"got: {learner['gradient_booster']['name']} with {learner['objective']['name']}")
+
+            booster_model = learner["gradient_booster"]["model"]
+            trees = booster_model["trees"]
+            best_iteration = getattr(model, "best_iteration", None)
+            if best_iteration is not None:
+                trees = trees[:booster_model["iteration_indptr"][best_iteration+1]]
+            if any(any(tree["split_type"]) for tree in trees):
+                raise Exception("Trees with categorical splits can not be compiled")
+
+            num_nodes = np.array([len(tree["left_children"]) for tree in trees])
+            tree_roots = np.concatenate([[0], np.cumsum(num_nodes)[:-1]]).astype(np.int32)
+            left_children, right_children, max_depth = [], [], 0
+            for tree, tree_root in zip(trees, tree_roots):
+                left, right = np.array(tree["left_children"]), np.array(tree["right_children"])
+                is_leaf = left == -1
+                node_idx = np.arange(len(left))
+                left_children.append(np.where(is_leaf, node_idx, left) + tree_root)
+                right_children.append(np.where(is_leaf, node_idx, right) + tree_root)
+                max_depth = max(max_depth, cls.get_tree_depth(left, right))
+
+            # Split conditions of leaves hold the leaf values
+            split_conditions = np.concatenate([np.array(tree["split_conditions"], dtype=np.float32) for tree in trees])
+            split_indices = np.concatenate([tree["split_indices"] for tree in trees]).astype(np.int32)
+            default_left = np.concatenate([tree["default_left"] for tree in trees]).astype(bool)
+
+            # base_score is a probability, trees add to its logit computed the way XGBoost does in float32
+            base_score = np.float32(np.ravel(json.loads(learner["learner_model_param"]["base_score"]))[0])
+            base_margin = -np.log(np.float32(1) / base_score - np.float32(1))
+
+            return cls(left_children=np.concatenate(left_children).astype(np.int32),
+                       right_children=np.concatenate(right_children).astype(np.int32),
+                       split_indices=split_indices, split_conditions=split_conditions, default_left=default_left,
+                       tree_roots=tree_roots, max_depth=max_depth, base_margin=np.float32(base_margin),
+                       num_features=int(learner["learner_model_param"]["num_feature"]), block_size=block_size)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    @staticmethod
+    def get_tree_depth(left:np.ndarray, right:np.ndarray) -> int:
+        depth, level = 0, np.array([0])
+        while True:
+            level = level[left[level] != -1]
+            if len(level) == 0:
+                return depth
+            level = np.concatenate([left[level], right[level]])
+            depth += 1
+
+
+    def predict_margin(self, x) -> np.ndarray:
+        """
+        Raw margin of every row, row blocks bound the (rows, trees) node matrix in memory
+        """
+        try:
+            x = np.asarray(x, dtype=np.float32)
+            if x.ndim != 2 or x.shape[1] != self.num_features:
+                raise Exception(f"Expected input with {self.num_features} features, got shape: {x.shape}")
+
+            margin = np.empty(len(x), dtype=np.float32)
+            for block_start in range(0, len(x), self.block_size):
+                margin[block_start:block_start+self.block_size] = self.predict_block_margin(x[block_start:block_start+self.block_size])
+            return margin
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def predict_block_margin(self, x:np.ndarray) -> np.ndarray:
+        # Rows are read through flat positions, one 1-D take per level is much cheaper than 2-D fancy indexing
+        x_flat = np.ascontiguousarray(x).ravel()
+        row_offsets = (np.arange(len(x), dtype=np.intp) * self.num_features)[:, None]
+        has_missing = np.isnan(x_flat).any()
+        node = np.broadcast_to(self.tree_roots, (len(x), len(self.tree_roots)))
+        for _ in range(self.max_depth):
+            value = x_flat.take(row_offsets + self.split_indices.take(node))
+            go_right = value >= self.split_conditions.take(node)
+            if has_missing:
+                missing = np.isnan(value)
+                go_right[missing] = ~self.default_left.take(node[missing])
+            node = self.children.take(2*node + go_right)
+
+        # Cumulative sum adds the trees one after another in float32 like XGBoost, a plain sum would add pairwise
+        leaf_values = np.concatenate([np.full((len(x), 1), self.base_margin, dtype=np.float32),
+                                      self.split_conditions.take(node)], axis=1)
+        return np.cumsum(leaf_values, axis=1, dtype=np.float32)[:, -1]
+
+
+    def predict_proba(self, x) -> np.ndarray:
+        """
+        Class probabilities in the layout of XGBClassifier.predict_proba
+        """
+        try:
+            margin = self.predict_margin(x)
+            # Sigmoid as XGBoost writes it, with exp rounded once to float32
+            exp_margin = np.exp(np.minimum(-margin, np.float32(88.7)).astype(np.float64)).astype(np.float32)
+            proba = np.float32(1) / (exp_margin + np.float32(1))
+            return np.column_stack([np.float32(1) - proba, proba])
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def predict(self, x) -> np.ndarray:
+        try:
+            return (self.predict_proba(x)[:, 1] > 0.5).astype(np.int64)
+
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -2,12 +2,14 @@ import pandas as pd
 import numpy as np
 from sensor.logger import logging
 from sensor.exception import SensorException
-from sensor.config import mongo_client
+from sensor import config
 import os, sys
 import yaml
 import dill
+import hashlib
+from sklearn.model_selection import train_test_split
 
-def get_collection_as_dataframe(database_name:str, collection_name:str):
+def get_collection_as_dataframe(database_name:str, collection_name:str, columns:list = None, query:dict = None):
 
     """
     Description: This function return collection as dataframe
@@ -15,20 +17,23 @@ def get_collection_as_dataframe(database_name:str, collection_name:str):
     Params:
     database_name: database name
     collection_name: collection name
+    columns: fields to fetch through a projection, None fetches every field
+    query: filter selecting documents, None fetches every document
     =========================================================
     return Pandas dataframe of a collection
     """
 
     try:
-        logging.info(f"Reading Data from database: {database_name} and collection: {collection_name}")
-        df = pd.DataFrame(list(mongo_client[database_name][collection_name].find()))
-        logging.info(f"Found Columns: {df.columns}")
+        logging.info("Reading Data from database: %s and collection: %s", database_name, collection_name)
+        projection = {column: 1 for column in columns} if columns is not None else None
+        df = pd.DataFrame(list(config.mongo_client[database_name][collection_name].find(query or dict(), projection=projection)))
+        logging.debug("Found Columns: %s", df.columns)
 
         if "_id" in df.columns:
             logging.info(f"Dropping Column: _id")
             df.drop("_id", axis=1, inplace=True)
 
-        logging.info(f"Rows and Columns in df: {df.shape}")
+        logging.info("Rows and Columns in df: %s", df.shape)
 
         return df
     
@@ -36,6 +41,44 @@ def get_collection_as_dataframe(database_name:str, collection_name:str):
         raise SensorException(e, sys)
 
 
+def get_collection_sample_as_dataframe(database_name:str, collection_name:str, sample_size:int, stratify_column:str,
+                                       columns:list = None, query:dict = None, random_state:int = None):
+
+    """
+    Description: This function return a stratified row sample of a collection as dataframe
+    =========================================================
+    Params:
+    database_name: database name
+    collection_name: collection name
+    sample_size: number of documents to fetch, every document is fetched when the collection is smaller
+    stratify_column: field whose value shares are kept in the sample
+    columns: fields to fetch through a projection, None fetches every field
+    query: filter selecting documents, None fetches every document
+    random_state: seed of the sample
+    =========================================================
+    return Pandas dataframe of the sampled documents
+    """
+
+    try:
+        # Only ids and the stratify field are read for every document, full documents only for the sample
+        key_df = pd.DataFrame(list(config.mongo_client[database_name][collection_name].find(
+            query or dict(), projection={stratify_column: 1})))
+        if sample_size >= len(key_df):
+            return get_collection_as_dataframe(database_name=database_name, collection_name=collection_name,
+                                               columns=columns, query=query)
+
+        # A value held by a single document can not be split, the sample is then drawn uniformly
+        stratify = key_df[stratify_column] if key_df[stratify_column].value_counts().min() >= 2 else None
+        sample_ids, _ = train_test_split(key_df["_id"].to_numpy(), train_size=sample_size, stratify=stratify,
+                                         random_state=random_state)
+        logging.info(f"Sampled {len(sample_ids)} of {len(key_df)} documents stratified by {stratify_column}")
+        return get_collection_as_dataframe(database_name=database_name, collection_name=collection_name,
+                                           columns=columns, query={"_id": {"$in": list(sample_ids)}})
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
 def write_yaml_file(file_path, data:dict):
     try:
         file_dir = os.path.dirname(file_path)
@@ -49,6 +92,35 @@ def write_yaml_file(file_path, data:dict):
         
     
 
+def read_yaml_file(file_path) -> dict:
+    try:
+        if not os.path.exists(file_path):
+            return dict()
+
+        with open(file_path, "r") as file_reader:
+            return yaml.safe_load(file_reader) or dict()
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def get_file_hash(file_path:str, chunk_size:int = 1024*1024) -> str:
+    """
+    Compute sha256 digest of a file by reading it in chunks
+    file_path: str location of file to hash
+    return: hex digest of file content
+    """
+    try:
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as file_obj:
+            for chunk in iter(lambda: file_obj.read(chunk_size), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
 def convert_column_float(df:pd.DataFrame, exclude_columns:list)-> pd.DataFrame:
     try:
         for column in df.columns:
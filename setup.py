@@ -23,6 +23,6 @@ setup(
     version="0.0.1",
     author="kshitij",
     author_email="kshitijthotwe1@gmail.com",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks*", "tests*"]),
     install_requires = get_requirements(),
 )
\ No newline at end of file
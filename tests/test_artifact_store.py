@@ -0,0 +1,108 @@
+import os
+import shutil
+import stat
+import pytest
+from sensor.artifact_store import ArtifactStore
+from sensor.exception import SensorException
+
+
+def write_file(file_path:str, content:str) -> str:
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w") as file_obj:
+        file_obj.write(content)
+    return file_path
+
+
+@pytest.fixture
+def artifact_store(tmp_path):
+    return ArtifactStore(store_dir=os.path.join(tmp_path, "artifact_store"))
+
+
+def test_put_copies_into_the_store(artifact_store, tmp_path):
+    file_path = write_file(os.path.join(tmp_path, "artifact", "model.pkl"), "model")
+    mode = os.stat(file_path).st_mode
+    digest = artifact_store.put(file_path)
+    blob_path = artifact_store.get_blob_path(digest)
+
+    assert open(blob_path).read() == "model"
+    # The source stays an independent, writable file
+    assert not os.path.samefile(file_path, blob_path)
+    assert os.stat(file_path).st_mode == mode
+    assert not os.stat(blob_path).st_mode & stat.S_IWUSR
+
+    # Rewriting the source does not reach the stored blob
+    write_file(file_path, "retrained")
+    assert open(blob_path).read() == "model"
+
+
+def test_put_deduplicates_content(artifact_store, tmp_path):
+    first_digest = artifact_store.put(write_file(os.path.join(tmp_path, "a", "model.pkl"), "model"))
+    second_digest = artifact_store.put(write_file(os.path.join(tmp_path, "b", "model.pkl"), "model"))
+    other_digest = artifact_store.put(write_file(os.path.join(tmp_path, "c", "model.pkl"), "other model"))
+
+    assert first_digest == second_digest != other_digest
+    assert sum(len(blobs) for _, _, blobs in os.walk(artifact_store.blob_dir)) == 2
+
+
+def test_publish_links_blob(artifact_store, tmp_path):
+    digest = artifact_store.put(write_file(os.path.join(tmp_path, "artifact", "model.pkl"), "model"))
+    target_path = os.path.join(tmp_path, "saved_models", "0", "model", "model.pkl")
+    artifact_store.publish(digest=digest, target_path=target_path)
+
+    assert open(target_path).read() == "model"
+    assert os.path.samefile(target_path, artifact_store.get_blob_path(digest))
+    assert len(os.listdir(artifact_store.manifest_dir)) == 1
+
+
+def test_publish_dir(artifact_store, tmp_path):
+    files = {os.path.join("model", "model.pkl"): artifact_store.put(write_file(os.path.join(tmp_path, "m.pkl"), "model")),
+             os.path.join("transformer", "transformer.pkl"): artifact_store.put(write_file(os.path.join(tmp_path, "t.pkl"), "transformer"))}
+    target_dir = os.path.join(tmp_path, "saved_models", "0")
+    artifact_store.publish_dir(target_dir=target_dir, files=files)
+
+    assert open(os.path.join(target_dir, "model", "model.pkl")).read() == "model"
+    assert open(os.path.join(target_dir, "transformer", "transformer.pkl")).read() == "transformer"
+    # Nothing of the temporary directory is left behind
+    assert os.listdir(os.path.dirname(target_dir)) == ["0"]
+
+    # A published version is never replaced
+    with pytest.raises(SensorException):
+        artifact_store.publish_dir(target_dir=target_dir, files=files)
+    assert os.listdir(os.path.dirname(target_dir)) == ["0"]
+
+
+def test_garbage_collection_follows_manifests(artifact_store, tmp_path):
+    kept_digest = artifact_store.put(write_file(os.path.join(tmp_path, "m1.pkl"), "model 1"))
+    removed_digest = artifact_store.put(write_file(os.path.join(tmp_path, "m2.pkl"), "model 2"))
+    unpublished_digest = artifact_store.put(write_file(os.path.join(tmp_path, "m3.pkl"), "model 3"))
+    kept_dir = os.path.join(tmp_path, "saved_models", "0")
+    removed_dir = os.path.join(tmp_path, "saved_models", "1")
+    artifact_store.publish_dir(target_dir=kept_dir, files={"model.pkl": kept_digest})
+    artifact_store.publish_dir(target_dir=removed_dir, files={"model.pkl": removed_digest})
+    # The removed version shares its blob with an artifact file still in place
+    shared_target_path = os.path.join(tmp_path, "artifact", "model.pkl")
+    artifact_store.publish(digest=removed_digest, target_path=shared_target_path)
+
+    # Young blobs are kept, a pusher may not have published them yet
+    assert artifact_store.collect_garbage() == []
+
+    shutil.rmtree(removed_dir)
+    assert artifact_store.collect_garbage(min_blob_age_sec=0) == [unpublished_digest]
+    os.remove(shared_target_path)
+    assert artifact_store.collect_garbage(min_blob_age_sec=0) == [removed_digest]
+
+    assert open(os.path.join(kept_dir, "model.pkl")).read() == "model 1"
+    assert os.path.exists(artifact_store.get_blob_path(kept_digest))
+    # Only the manifest of the version still published is left
+    assert len(os.listdir(artifact_store.manifest_dir)) == 1
+
+
+def test_put_restarts_grace_period(artifact_store, tmp_path):
+    file_path = write_file(os.path.join(tmp_path, "model.pkl"), "model")
+    digest = artifact_store.put(file_path)
+    blob_path = artifact_store.get_blob_path(digest)
+    os.utime(blob_path, (0, 0))
+
+    artifact_store.put(file_path)
+    assert artifact_store.collect_garbage(min_blob_age_sec=60) == []
+    assert os.path.exists(blob_path)
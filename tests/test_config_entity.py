@@ -0,0 +1,13 @@
+from sensor.entity.config_entity import get_partition_dir_name
+
+
+def test_partition_dir_names_do_not_collide():
+    assert get_partition_dir_name("B/1") != get_partition_dir_name("B_1")
+    assert get_partition_dir_name("B/1").startswith("B_1-")
+    assert get_partition_dir_name("B/1") == get_partition_dir_name("B/1")
+
+
+def test_partition_dir_name_is_path_safe():
+    dir_name = get_partition_dir_name("../fleet a")
+    assert "/" not in dir_name and " " not in dir_name
+    assert dir_name.startswith(".._fleet_a-")
@@ -0,0 +1,30 @@
+import os
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from sensor import utils
+from sensor.config import TARGET_COLUMN
+from sensor.components.data_ingestion import DataIngestion
+
+
+def test_non_numeric_fields_become_nan(tmp_path, monkeypatch):
+    num_rows = 40
+    collection_df = pd.DataFrame({"aa_000": [str(idx) for idx in range(num_rows)],
+                                  "ab_000": ["na"] + ["1.5"]*(num_rows - 1),
+                                  "fleet": ["north", "south"]*(num_rows // 2),
+                                  TARGET_COLUMN: ["neg", "pos"]*(num_rows // 2)})
+    monkeypatch.setattr(utils, "get_collection_as_dataframe", lambda **kwargs: collection_df.copy())
+    data_ingestion_config = SimpleNamespace(columns=None, use_required_columns=False, sample_size=None,
+                                            database_name="aps", collection_name="sensor", query=None,
+                                            partition_key=None, test_size=0.25, stratify=True, random_state=42,
+                                            feature_store_file_path=os.path.join(tmp_path, "sensor.parquet"),
+                                            train_index_path=os.path.join(tmp_path, "train.npy"),
+                                            test_index_path=os.path.join(tmp_path, "test.npy"))
+
+    data_ingestion_artifact = DataIngestion(data_ingestion_config=data_ingestion_config).initiate_data_ingestion()
+
+    df = pd.read_parquet(data_ingestion_artifact.feature_store_file_path)
+    assert df["aa_000"].tolist() == list(range(num_rows))
+    assert np.isnan(df["ab_000"].iloc[0]) and (df["ab_000"].iloc[1:] == 1.5).all()
+    assert df["fleet"].isna().all()
+    assert df[TARGET_COLUMN].tolist() == collection_df[TARGET_COLUMN].tolist()
@@ -0,0 +1,92 @@
+import os
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from sensor.drift_monitor import (DriftMonitor, build_reference_profile, count_bins, population_stability_index,
+                                  RETRAIN_SIGNAL_FILE_NAME)
+
+COLUMNS = ["aa_000", "ab_000"]
+
+
+def make_df(num_rows:int, shift:float = 0.0, null_ratio:float = 0.0, random_state:int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(random_state)
+    df = pd.DataFrame({"aa_000": rng.normal(loc=shift, size=num_rows), "ab_000": rng.uniform(size=num_rows)})
+    df.loc[rng.random(num_rows) < null_ratio, "ab_000"] = np.nan
+    return df
+
+
+def read_chunks(df:pd.DataFrame, chunk_size:int = 5_000):
+    return [df.iloc[chunk_start:chunk_start+chunk_size] for chunk_start in range(0, len(df), chunk_size)]
+
+
+def make_sensor_model(reference_df:pd.DataFrame, fingerprint:str = "v1") -> SimpleNamespace:
+    reference_profile = build_reference_profile(read_chunks=lambda: read_chunks(reference_df), columns=COLUMNS)
+    return SimpleNamespace(fingerprint=fingerprint, version=fingerprint, reference_profile=reference_profile,
+                           input_feature_name=COLUMNS)
+
+
+def test_population_stability_index():
+    expected = np.array([0.25, 0.25, 0.25, 0.25])
+    assert population_stability_index(expected, expected) == 0
+    actual = np.array([0.1, 0.2, 0.3, 0.4])
+    assert np.isclose(population_stability_index(expected, actual), np.sum((actual - expected) * np.log(actual / expected)))
+    # Empty bins are clipped instead of giving an infinite index
+    assert np.isfinite(population_stability_index(expected, np.array([0.5, 0.5, 0.0, 0.0])))
+
+
+def test_count_bins():
+    arr = np.array([[0.5, 10.0], [1.5, np.nan], [2.5, 30.0], [1.0, 20.0]])
+    edges = [np.array([1.0, 2.0]), np.array([20.0])]
+    # Values on an edge fall in the upper bin, NaN is not counted
+    assert count_bins(arr, edges).tolist() == [1, 2, 1, 1, 2]
+
+
+def test_reference_profile_bins_are_equal_frequency():
+    reference_df = make_df(num_rows=20_000)
+    profile = make_sensor_model(reference_df).reference_profile
+    assert profile["num_rows"] == len(reference_df)
+    for column in COLUMNS:
+        assert len(profile["columns"][column]["expected"]) == profile["num_bins"]
+        assert np.allclose(profile["columns"][column]["expected"], 1 / profile["num_bins"], atol=0.01)
+
+
+def test_same_distribution_does_not_drift(tmp_path):
+    sensor_model = make_sensor_model(make_df(num_rows=20_000))
+    drift_monitor = DriftMonitor(drift_dir=str(tmp_path), summary_interval_rows=10_000)
+    assert drift_monitor.update(sensor_model, make_df(num_rows=5_000, random_state=1)) is None
+    summary = drift_monitor.update(sensor_model, make_df(num_rows=5_000, random_state=2))
+
+    assert summary["num_rows"] == 10_000
+    assert summary["drifted_columns"] == []
+    assert all(report["psi"] < 0.01 for report in summary["columns"].values())
+    assert not os.path.exists(os.path.join(tmp_path, RETRAIN_SIGNAL_FILE_NAME))
+
+
+def test_shifted_distribution_drifts(tmp_path):
+    sensor_model = make_sensor_model(make_df(num_rows=20_000))
+    drift_monitor = DriftMonitor(drift_dir=str(tmp_path), summary_interval_rows=10_000)
+    summary = drift_monitor.update(sensor_model, make_df(num_rows=10_000, shift=1.0, null_ratio=0.3, random_state=1))
+
+    assert summary["columns"]["aa_000"]["psi"] > drift_monitor.psi_threshold
+    # ab_000 keeps its distribution but loses values
+    assert summary["columns"]["ab_000"]["psi"] < 0.01
+    assert np.isclose(summary["columns"]["ab_000"]["null_ratio"], 0.3, atol=0.02)
+    assert summary["drifted_columns"] == COLUMNS
+    assert summary["retrain"]
+    assert os.path.exists(os.path.join(tmp_path, RETRAIN_SIGNAL_FILE_NAME))
+
+
+def test_window_restarts_on_model_change(tmp_path):
+    reference_df = make_df(num_rows=20_000)
+    drift_monitor = DriftMonitor(drift_dir=str(tmp_path), summary_interval_rows=10_000)
+    drift_monitor.update(make_sensor_model(reference_df, fingerprint="v1"), make_df(num_rows=4_000, random_state=1))
+    drift_monitor.save_state()
+
+    # Another run with the same model continues the saved window
+    drift_monitor = DriftMonitor(drift_dir=str(tmp_path), summary_interval_rows=10_000)
+    drift_monitor.update(make_sensor_model(reference_df, fingerprint="v1"), make_df(num_rows=4_000, random_state=2))
+    assert drift_monitor.num_rows == 8_000
+
+    drift_monitor.update(make_sensor_model(reference_df, fingerprint="v2"), make_df(num_rows=1_000, random_state=3))
+    assert drift_monitor.model_version == "v2"
+    assert drift_monitor.num_rows == 1_000
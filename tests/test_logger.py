@@ -0,0 +1,20 @@
+import logging
+import pytest
+from sensor.logger import get_level, parse_module_levels
+
+
+def test_parse_module_levels():
+    assert parse_module_levels("data_validation=warning, utils=DEBUG") == {"data_validation": logging.WARNING,
+                                                                          "utils": logging.DEBUG}
+    assert parse_module_levels("") == dict()
+
+
+@pytest.mark.parametrize("module_levels", ["sensor.x=VERBOSE", "utils", "utils=INFO=DEBUG"])
+def test_invalid_module_levels_raise(module_levels):
+    with pytest.raises(ValueError, match="LOG_MODULE_LEVELS|log level"):
+        parse_module_levels(module_levels)
+
+
+def test_unknown_level_raises():
+    with pytest.raises(ValueError, match="VERBOSE"):
+        get_level("verbose")
@@ -0,0 +1,76 @@
+import os
+import numpy as np
+from sklearn.metrics import f1_score
+from sensor.components.model_evaluation import ModelEvaluation, get_f1_scores, bootstrap_f1_difference
+
+
+def make_predictions(num_rows:int = 400, random_state:int = 7):
+    rng = np.random.default_rng(random_state)
+    y_true = (rng.random(num_rows) < 0.2).astype(int)
+    # Both models flip some labels, the challenger fewer
+    challenger_pred = np.where(rng.random(num_rows) < 0.10, 1 - y_true, y_true)
+    champion_pred = np.where(rng.random(num_rows) < 0.15, 1 - y_true, y_true)
+    return y_true, challenger_pred, champion_pred
+
+
+def naive_bootstrap_differences(y_true, challenger_pred, champion_pred, num_resamples:int, random_state:int = 0):
+    """
+    F1 difference of every resample drawn row by row with replacement, scored with sklearn
+    """
+    rng = np.random.default_rng(random_state)
+    differences = np.empty(num_resamples)
+    for resample_idx in range(num_resamples):
+        rows = rng.integers(0, len(y_true), len(y_true))
+        differences[resample_idx] = (f1_score(y_true[rows], challenger_pred[rows], zero_division=0) -
+                                     f1_score(y_true[rows], champion_pred[rows], zero_division=0))
+    return differences
+
+
+def test_get_f1_scores_matches_sklearn():
+    y_true, challenger_pred, _ = make_predictions()
+    f1 = get_f1_scores(true_positives=np.array([np.sum((y_true == 1) & (challenger_pred == 1))]),
+                       false_positives=np.array([np.sum((y_true == 0) & (challenger_pred == 1))]),
+                       false_negatives=np.array([np.sum((y_true == 1) & (challenger_pred == 0))]))
+    assert np.isclose(f1[0], f1_score(y_true, challenger_pred))
+    assert get_f1_scores(np.zeros(1), np.zeros(1), np.zeros(1))[0] == 0
+
+
+def test_bootstrap_matches_row_bootstrap():
+    y_true, challenger_pred, champion_pred = make_predictions()
+    confidence_level = 0.9
+    lower, upper = bootstrap_f1_difference(y_true=y_true, challenger_pred=challenger_pred, champion_pred=champion_pred,
+                                           num_resamples=4000, confidence_level=confidence_level)
+    differences = naive_bootstrap_differences(y_true, challenger_pred, champion_pred, num_resamples=2000)
+    naive_lower, naive_upper = np.quantile(differences, [(1 - confidence_level)/2, (1 + confidence_level)/2])
+
+    # Same distribution, bounds only differ by Monte Carlo error
+    assert abs(lower - naive_lower) < 0.015
+    assert abs(upper - naive_upper) < 0.015
+    assert lower < f1_score(y_true, challenger_pred) - f1_score(y_true, champion_pred) < upper
+
+
+def test_bootstrap_is_seeded():
+    y_true, challenger_pred, champion_pred = make_predictions()
+    first = bootstrap_f1_difference(y_true, challenger_pred, champion_pred, num_resamples=500, random_state=3)
+    second = bootstrap_f1_difference(y_true, challenger_pred, champion_pred, num_resamples=500, random_state=3)
+    assert first == second
+
+
+def test_bootstrap_of_identical_predictions_is_zero():
+    y_true, challenger_pred, _ = make_predictions()
+    assert bootstrap_f1_difference(y_true, challenger_pred, challenger_pred, num_resamples=500) == (0.0, 0.0)
+
+
+def test_model_fingerprint_follows_file_content(tmp_path):
+    paths = dict()
+    for key in ("transformer_path", "model_path", "target_encoder_path"):
+        paths[key] = os.path.join(tmp_path, f"{key}.pkl")
+        with open(paths[key], "w") as file_obj:
+            file_obj.write(key)
+    fingerprint = ModelEvaluation.get_model_fingerprint(paths)
+    assert ModelEvaluation.get_model_fingerprint(paths) == fingerprint
+
+    # A recreated registry reuses the version number, the retrained model changes the fingerprint
+    with open(paths["model_path"], "w") as file_obj:
+        file_obj.write("retrained model")
+    assert ModelEvaluation.get_model_fingerprint(paths) != fingerprint
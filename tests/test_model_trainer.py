@@ -0,0 +1,31 @@
+import os
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from xgboost import XGBClassifier
+from sensor import utils
+from sensor.components.data_transformation import DataTransformation
+from sensor.components.model_trainer import ModelTrainer
+
+
+def test_feature_ranking_includes_features_without_gain(tmp_path):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.normal(size=(500, 6)), columns=[f"s{idx}" for idx in range(6)])
+    # Constant columns are never split on, so the booster reports no gain for them
+    df["s1"] = 0.0
+    df["s4"] = 1.0
+    y = (df["s0"] + df["s5"] > 0).astype(int)
+
+    transformer = DataTransformation.get_data_transformer_object().fit(df)
+    transform_object_path = os.path.join(tmp_path, "transformer.pkl")
+    utils.save_object(file_path=transform_object_path, obj=transformer)
+    model = XGBClassifier(n_estimators=10).fit(transformer.transform(df), y)
+
+    model_trainer = ModelTrainer(model_trainer_config=None,
+                                 data_transformation_artifact=SimpleNamespace(transform_object_path=transform_object_path))
+    feature_ranking = model_trainer.get_feature_ranking(model=model)
+
+    assert len(feature_ranking) == df.shape[1]
+    assert sorted(idx for idx, _ in feature_ranking) == list(range(df.shape[1]))
+    assert [name for _, name in feature_ranking[-2:]] == ["s1", "s4"]
+    assert {name for _, name in feature_ranking[:2]} == {"s0", "s5"}
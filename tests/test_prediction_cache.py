@@ -0,0 +1,89 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from sensor.prediction_cache import InMemoryPredictionCache, DiskPredictionCache, hash_feature_rows
+
+
+@pytest.fixture(params=["memory", "disk"])
+def prediction_cache(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryPredictionCache(max_size=100)
+    return DiskPredictionCache(cache_file_path=os.path.join(tmp_path, "cache.sqlite"), max_size=100)
+
+
+def make_entries(num_rows:int, start:int = 0):
+    row_hashes = np.arange(start, start + num_rows, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    probas = np.column_stack([np.linspace(0, 1, num_rows), np.linspace(1, 0, num_rows)])
+    return row_hashes, probas
+
+
+def test_hash_feature_rows_normalises_types():
+    df = pd.DataFrame({"aa_000": [12, 3], "ab_000": [np.nan, 1.5]})
+    same_df = pd.DataFrame({"aa_000": ["12", "3.0"], "ab_000": [np.nan, "1.5"]})
+    assert np.array_equal(hash_feature_rows(df), hash_feature_rows(same_df))
+    assert hash_feature_rows(df)[0] != hash_feature_rows(df)[1]
+
+
+def test_lookup_returns_stored_probas(prediction_cache):
+    row_hashes, probas = make_entries(10)
+    prediction_cache.lookup("v1", row_hashes)
+    prediction_cache.store("v1", row_hashes[:6], probas[:6])
+
+    hit_mask, hit_probas = prediction_cache.lookup("v1", row_hashes)
+    assert hit_mask.tolist() == [True]*6 + [False]*4
+    assert np.array_equal(hit_probas, probas[:6])
+    assert prediction_cache.stats() == {"version": "v1", "hits": 6, "misses": 14, "size": 6}
+
+
+def test_version_change_resets(prediction_cache):
+    row_hashes, probas = make_entries(10)
+    prediction_cache.lookup("v1", row_hashes)
+    prediction_cache.store("v1", row_hashes, probas)
+
+    hit_mask, _ = prediction_cache.lookup("v2", row_hashes)
+    assert not hit_mask.any()
+    assert prediction_cache.stats()["size"] == 0
+
+    # Probabilities of a version which is no longer current are dropped
+    prediction_cache.store("v1", row_hashes, probas)
+    assert prediction_cache.stats()["size"] == 0
+
+
+def test_least_recently_used_are_evicted(prediction_cache):
+    row_hashes, probas = make_entries(100)
+    prediction_cache.lookup("v1", row_hashes)
+    prediction_cache.store("v1", row_hashes, probas)
+    # The first rows are used again, so the next ones are the oldest
+    prediction_cache.lookup("v1", row_hashes[:10])
+
+    new_row_hashes, new_probas = make_entries(20, start=100)
+    prediction_cache.store("v1", new_row_hashes, new_probas)
+    hit_mask, _ = prediction_cache.lookup("v1", row_hashes)
+    assert prediction_cache.stats()["size"] == 100
+    # The disk cache tracks recency per batch, so which older rows go is only fixed for the memory cache
+    assert hit_mask[:10].all()
+    assert hit_mask.sum() == 80
+    if isinstance(prediction_cache, InMemoryPredictionCache):
+        assert hit_mask.tolist() == [True]*10 + [False]*20 + [True]*70
+
+
+def test_disk_cache_survives_restart_of_same_version(tmp_path):
+    cache_file_path = os.path.join(tmp_path, "cache.sqlite")
+    row_hashes, probas = make_entries(10)
+    prediction_cache = DiskPredictionCache(cache_file_path=cache_file_path)
+    prediction_cache.lookup("v1", row_hashes)
+    prediction_cache.store("v1", row_hashes, probas)
+    prediction_cache.connection.close()
+
+    prediction_cache = DiskPredictionCache(cache_file_path=cache_file_path)
+    assert prediction_cache.version == "v1"
+    hit_mask, hit_probas = prediction_cache.lookup("v1", row_hashes)
+    assert hit_mask.all()
+    assert np.array_equal(hit_probas, probas)
+    prediction_cache.connection.close()
+
+    prediction_cache = DiskPredictionCache(cache_file_path=cache_file_path)
+    hit_mask, _ = prediction_cache.lookup("v2", row_hashes)
+    assert not hit_mask.any()
+    assert prediction_cache.stats() == {"version": "v2", "hits": 0, "misses": 10, "size": 0}
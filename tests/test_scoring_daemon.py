@@ -0,0 +1,69 @@
+import os
+import time
+import threading
+from sensor.pipeline.scoring_daemon import ScoringDaemon
+
+
+def write_csv(file_path:str):
+    with open(file_path, "w") as csv_file:
+        csv_file.write("aa_000\n1\n")
+
+
+class SlowWarmModel:
+    """
+    Stands in for WarmModel, the first get drops files into the input directory while the model loads
+    """
+
+    def __init__(self, input_dir:str, file_names:list):
+        self.input_dir = input_dir
+        self.file_names = file_names
+        self.loaded = False
+
+    def get(self):
+        if not self.loaded:
+            for file_name in self.file_names:
+                write_csv(os.path.join(self.input_dir, file_name))
+                time.sleep(0.05)
+            self.loaded = True
+        return self
+
+
+def run_daemon(scoring_daemon:ScoringDaemon, expected_num_files:int, timeout_sec:float = 10) -> list:
+    scored_files = []
+    def score_file(file_path, submit_time):
+        scored_files.append(os.path.basename(file_path))
+        scoring_daemon.pending_files.release()
+    scoring_daemon.score_file = score_file
+
+    stop_event = threading.Event()
+    daemon_thread = threading.Thread(target=scoring_daemon.run, kwargs={"stop_event": stop_event})
+    daemon_thread.start()
+    deadline = time.monotonic() + timeout_sec
+    while len(scored_files) < expected_num_files and time.monotonic() < deadline:
+        time.sleep(0.05)
+    stop_event.set()
+    daemon_thread.join()
+    return sorted(scored_files)
+
+
+def test_files_landing_while_model_loads_are_scored(tmp_path):
+    input_dir = os.path.join(tmp_path, "incoming")
+    scoring_daemon = ScoringDaemon(input_dir=input_dir, output_dir=os.path.join(tmp_path, "prediction"),
+                                   model_registry=os.path.join(tmp_path, "saved_models"), rescan_interval_sec=0.2)
+    write_csv(os.path.join(input_dir, "existing.csv"))
+    scoring_daemon.warm_model = SlowWarmModel(input_dir=input_dir, file_names=["a.csv", "b.csv", "c.csv"])
+
+    # Files present at start are only scored with score_existing
+    assert run_daemon(scoring_daemon, expected_num_files=3) == ["a.csv", "b.csv", "c.csv"]
+
+
+def test_submitted_files_are_forgotten_once_removed(tmp_path):
+    input_dir = os.path.join(tmp_path, "incoming")
+    scoring_daemon = ScoringDaemon(input_dir=input_dir, output_dir=os.path.join(tmp_path, "prediction"),
+                                   model_registry=os.path.join(tmp_path, "saved_models"), rescan_interval_sec=0.2)
+    scoring_daemon.warm_model = SlowWarmModel(input_dir=input_dir, file_names=["a.csv", "b.csv"])
+    assert run_daemon(scoring_daemon, expected_num_files=2) == ["a.csv", "b.csv"]
+
+    os.remove(os.path.join(input_dir, "a.csv"))
+    scoring_daemon.scan_input_dir(executor=None)
+    assert scoring_daemon.submitted_files == {os.path.join(input_dir, "b.csv")}
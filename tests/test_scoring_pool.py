@@ -0,0 +1,77 @@
+import os
+import threading
+import multiprocessing
+from types import SimpleNamespace
+from multiprocessing.connection import Listener
+import pandas as pd
+import pytest
+from sensor.exception import SensorException
+from sensor.scoring_pool import PooledSensorModel
+
+
+def serve(listener:Listener, num_batches:int):
+    """
+    Stands in for run_worker, scores num_batches batches and then drops the connection as a crashed worker would
+    """
+    conn = listener.accept()
+    listener.close()
+    for _ in range(num_batches):
+        try:
+            batch_df, _ = conn.recv()
+        except EOFError:
+            break
+        conn.send(("ok", pd.DataFrame({"prediction": [0]*len(batch_df)}, index=batch_df.index)))
+    conn.close()
+
+
+def make_pooled_model(tmp_path, batches_per_worker:list) -> PooledSensorModel:
+    addresses = []
+    for worker_idx, num_batches in enumerate(batches_per_worker):
+        address = os.path.join(tmp_path, f"worker-{worker_idx}.sock")
+        listener = Listener(address, family="AF_UNIX", authkey=multiprocessing.current_process().authkey)
+        threading.Thread(target=serve, args=(listener, num_batches), daemon=True).start()
+        addresses.append(address)
+    sensor_model = SimpleNamespace(version_dir="saved_models/0", version="0", fingerprint="0",
+                                   input_feature_name=["aa_000"], reference_profile=None)
+    return PooledSensorModel(sensor_model=sensor_model, addresses=addresses, batch_size=10)
+
+
+def test_predict_scores_every_batch_in_order(tmp_path):
+    pooled_model = make_pooled_model(tmp_path, batches_per_worker=[100, 100])
+    df = pd.DataFrame({"aa_000": range(35), "ab_000": range(35)})
+    prediction_df = pooled_model.predict(df)
+    assert prediction_df.index.tolist() == list(range(35))
+    pooled_model.close()
+
+
+def test_failed_worker_is_not_waited_for(tmp_path):
+    pooled_model = make_pooled_model(tmp_path, batches_per_worker=[0, 100])
+    df = pd.DataFrame({"aa_000": range(5)})
+    # The batch sent to the crashed worker fails, later batches go to the remaining one
+    with pytest.raises(SensorException):
+        for _ in range(2):
+            pooled_model.predict(df)
+    assert pooled_model.num_failed == 1
+    assert len(pooled_model.predict(df)) == 5
+    pooled_model.close()
+
+
+def test_all_workers_failed_raises_instead_of_blocking(tmp_path):
+    pooled_model = make_pooled_model(tmp_path, batches_per_worker=[0, 0])
+    df = pd.DataFrame({"aa_000": range(50)})
+    with pytest.raises(SensorException):
+        pooled_model.predict(df)
+    with pytest.raises(SensorException, match="scoring workers"):
+        pooled_model.predict(df)
+    assert pooled_model.num_failed == 2
+    pooled_model.close()
+
+
+def test_close_waits_for_running_predict(tmp_path):
+    pooled_model = make_pooled_model(tmp_path, batches_per_worker=[100])
+    pooled_model.num_running += 1
+    pooled_model.close()
+    assert not pooled_model.released
+    pooled_model.num_running -= 1
+    assert len(pooled_model.predict(pd.DataFrame({"aa_000": range(5)}))) == 5
+    assert pooled_model.released
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from sensor.sketch import QuantileSketch, merge_sketches
+
+PROBS = np.linspace(0.01, 0.99, 99)
+
+
+def make_data(num_rows:int = 100_000, random_state:int = 0) -> np.ndarray:
+    rng = np.random.default_rng(random_state)
+    return np.column_stack([rng.normal(size=num_rows), rng.exponential(size=num_rows),
+                            rng.integers(0, 50, num_rows).astype(np.float64)])
+
+
+def max_rank_error(column:np.ndarray, estimates:np.ndarray, probs:np.ndarray) -> float:
+    """
+    Largest distance between prob and the range of ranks the estimate occupies in column
+    """
+    column = np.sort(column[~np.isnan(column)])
+    lower_rank = np.searchsorted(column, estimates, side="left") / len(column)
+    upper_rank = np.searchsorted(column, estimates, side="right") / len(column)
+    return float(np.max(np.maximum(0, np.maximum(lower_rank - probs, probs - upper_rank))))
+
+
+def test_small_chunk_is_exact():
+    arr = np.array([[3.0, np.nan], [1.0, 2.0], [2.0, np.nan]])
+    sketch = QuantileSketch.from_array(arr, sketch_size=10)
+    assert sketch.count.tolist() == [3, 1]
+    assert sketch.quantile([0, 1]).tolist() == [[1.0, 2.0], [3.0, 2.0]]
+
+
+def test_column_without_observations_is_nan():
+    arr = np.column_stack([np.arange(2000.0), np.full(2000, np.nan)])
+    quantiles = QuantileSketch.from_array(arr, sketch_size=100).quantile(PROBS)
+    assert np.isnan(quantiles[:, 1]).all()
+    assert not np.isnan(quantiles[:, 0]).any()
+
+
+@pytest.mark.parametrize("num_chunks", [1, 16, 64])
+def test_merged_rank_error_is_bounded(num_chunks):
+    data = make_data()
+    sketch_size = 200
+    sketch = merge_sketches([QuantileSketch.from_array(chunk, sketch_size=sketch_size)
+                             for chunk in np.array_split(data, num_chunks)])
+    quantiles = sketch.quantile(PROBS)
+    # Rank error grows by about 1/sketch_size per level of the balanced merge tree
+    num_levels = int(np.ceil(np.log2(num_chunks)))
+    for column_idx in range(data.shape[1]):
+        assert max_rank_error(data[:, column_idx], quantiles[:, column_idx], PROBS) <= (num_levels + 1) / sketch_size
+    assert sketch.count.tolist() == [len(data)] * data.shape[1]
+    assert np.array_equal(sketch.quantile([0, 1]), np.stack([data.min(axis=0), data.max(axis=0)]))
+
+
+def test_reversed_merge_order_keeps_rank_error_bounded():
+    data = make_data(num_rows=20_000)
+    sketches = [QuantileSketch.from_array(chunk, sketch_size=200) for chunk in np.array_split(data, 8)]
+    forward = merge_sketches(sketches).quantile(PROBS)
+    backward = merge_sketches(sketches[::-1]).quantile(PROBS)
+    for column_idx in range(data.shape[1]):
+        assert max_rank_error(data[:, column_idx], forward[:, column_idx], PROBS) <= 4 / 200
+        assert max_rank_error(data[:, column_idx], backward[:, column_idx], PROBS) <= 4 / 200
+
+
+def test_merge_sketches_of_nothing():
+    assert merge_sketches([]) is None
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+import xgboost
+from xgboost import XGBClassifier
+from sensor.tree_ensemble import CompiledTreeEnsemble, MARGIN_ATOL, MARGIN_RTOL
+from sensor.exception import SensorException
+
+
+def make_data(num_rows:int = 3000, num_features:int = 12, null_ratio:float = 0.1, random_state:int = 0):
+    rng = np.random.default_rng(random_state)
+    x = rng.normal(size=(num_rows, num_features))
+    y = (x[:, 0] + 0.5*x[:, 1]*x[:, 2] + rng.normal(scale=0.5, size=num_rows) > 1).astype(int)
+    # Missing values exercise the default direction of every split
+    x[rng.random(x.shape) < null_ratio] = np.nan
+    return x, y
+
+
+def assert_matches_booster(model:XGBClassifier, compiled:CompiledTreeEnsemble, x:np.ndarray):
+    iteration_range = (0, model.best_iteration + 1) if hasattr(model, "best_iteration") else (0, 0)
+    booster_margin = model.get_booster().predict(xgboost.DMatrix(x), output_margin=True, iteration_range=iteration_range)
+    margin = compiled.predict_margin(x)
+    assert np.allclose(margin, booster_margin, rtol=MARGIN_RTOL, atol=MARGIN_ATOL)
+
+    # Classes may only differ where the margin is within tolerance of zero
+    decided = np.abs(booster_margin) > MARGIN_ATOL
+    assert np.array_equal(compiled.predict(x)[decided], model.predict(x)[decided])
+    assert np.allclose(compiled.predict_proba(x), model.predict_proba(x), atol=1e-6)
+
+
+@pytest.mark.parametrize("null_ratio", [0.0, 0.1])
+def test_matches_booster(null_ratio):
+    x, y = make_data(null_ratio=null_ratio)
+    model = XGBClassifier(n_estimators=50, max_depth=5).fit(x, y)
+    assert_matches_booster(model, CompiledTreeEnsemble.from_xgb_classifier(model), x)
+
+
+def test_all_missing_rows_take_default_directions():
+    x, y = make_data()
+    model = XGBClassifier(n_estimators=20, max_depth=4).fit(x, y)
+    assert_matches_booster(model, CompiledTreeEnsemble.from_xgb_classifier(model), np.full((5, x.shape[1]), np.nan))
+
+
+def test_early_stopping_uses_best_iteration():
+    x, y = make_data(num_rows=4000)
+    model = XGBClassifier(n_estimators=300, max_depth=6, learning_rate=0.3, early_stopping_rounds=5,
+                          eval_metric="logloss").fit(x[:3000], y[:3000], eval_set=[(x[3000:], y[3000:])], verbose=False)
+    assert model.best_iteration < 299
+    compiled = CompiledTreeEnsemble.from_xgb_classifier(model)
+    assert len(compiled.tree_roots) == model.best_iteration + 1
+    assert_matches_booster(model, compiled, x)
+
+
+def test_small_blocks_give_same_margin():
+    x, y = make_data()
+    model = XGBClassifier(n_estimators=20, max_depth=4).fit(x, y)
+    compiled = CompiledTreeEnsemble.from_xgb_classifier(model)
+    margin = compiled.predict_margin(x)
+    compiled.block_size = 7
+    assert np.array_equal(compiled.predict_margin(x), margin)
+
+
+def test_rejects_wrong_feature_count():
+    x, y = make_data()
+    compiled = CompiledTreeEnsemble.from_xgb_classifier(XGBClassifier(n_estimators=5).fit(x, y))
+    with pytest.raises(SensorException):
+        compiled.predict_margin(x[:, :-1])